@@ -4,14 +4,13 @@ FastAPI Production Server for PetPlantr - Enhanced Version
 Quick Win #3 - REST API with authentication and advanced features
 """
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, BackgroundTasks, Request, Form
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, BackgroundTasks, Request, Response, Form, Query, Header, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 import asyncio
 import uvicorn
 import os
-import tempfile
 import time
 import json
 from pathlib import Path
@@ -19,24 +18,43 @@ from typing import Optional, Dict, List, Any
 import uuid
 from pydantic import BaseModel, Field, validator
 import logging
-import aiohttp
 import hashlib
 from datetime import datetime, timedelta
 import asyncio
 from enum import Enum
 from contextlib import asynccontextmanager
 
+from src.core.mesh_export import write_placeholder_stl
+from src.core.mesh_optimizer import MeshOptimizer
+from src.core.metrics import PROMETHEUS_CONTENT_TYPE, REGISTRY, record_fallback, timed
+from src.core.pipeline_dag import PipelineDAG, PipelineStageError, Stage
+from src.services.artifact_cache import artifact_key, create_artifact_cache
+from src.services.auth import AuthError, create_token_verifier, user_from_claims
+from src.services.file_streaming import file_download
+from src.services.http_sessions import UpstreamSessions
+from src.services.job_events import HEARTBEAT_INTERVAL, JobEvents, format_sse, is_terminal
+from src.services.job_queue import create_job_queue
+from src.services.job_store import TERMINAL_STATUSES, create_job_store, job_owner
+from src.services.rate_limit import create_rate_limiter
+from src.services.replicate_poller import PREDICTION_MAX_WAIT, REPLICATE_API_BASE, ReplicatePoller, WebhookSignatureError
+from src.services.single_flight import IDEMPOTENCY_TTL, SingleFlight, request_fingerprint
+from src.services.upload_ingest import UploadSizeLimit, UploadTooLarge, ingest_upload
+
 # Enhanced configuration
-MAX_REQUESTS_PER_HOUR = 50
 CACHE_TTL = 3600  # 1 hour
 SUPPORTED_IMAGE_FORMATS = ['jpg', 'jpeg', 'png', 'webp']
 MAX_IMAGE_SIZE = 10 * 1024 * 1024  # 10MB
 PRODUCTION_MODE = os.getenv('NODE_ENV') == 'production' or os.getenv('ENABLE_PRODUCTION_AI') == 'true'
 REPLICATE_API_TOKEN = os.getenv('REPLICATE_API_TOKEN')
 AWS_LAMBDA_API_URL = os.getenv('AWS_LAMBDA_API_URL', 'https://cm1ffbb7hf.execute-api.us-east-1.amazonaws.com/dev')
+JOB_SPOOL_DIR = os.getenv('JOB_SPOOL_DIR', 'temp_uploads')  # Uploads waiting for a worker
+MAX_MESH_SIZE = int(os.getenv('MAX_MESH_SIZE', str(200 * 1024 * 1024)))  # Generated meshes fetched for optimization
 
-# Enhanced rate limiting store
-request_log = {}
+# Enhanced pipeline stage timeouts (seconds); the model stage covers FLUX + TRELLIS predictions
+ANALYZE_STAGE_TIMEOUT = float(os.getenv('ANALYZE_STAGE_TIMEOUT', '60'))
+MODEL_STAGE_TIMEOUT = float(os.getenv('MODEL_STAGE_TIMEOUT', str(2 * PREDICTION_MAX_WAIT + 60)))
+OPTIMIZE_STAGE_TIMEOUT = float(os.getenv('OPTIMIZE_STAGE_TIMEOUT', '300'))
+FORMATS_STAGE_TIMEOUT = float(os.getenv('FORMATS_STAGE_TIMEOUT', '120'))
 
 # Enhanced enums
 class QualityLevel(str, Enum):
@@ -67,7 +85,7 @@ except ImportError:
 
 # Import new breed detection modules
 try:
-    from src.api.routes.breed import router as breed_router
+    from src.api.routes.breed import router as breed_router, MAX_IMAGE_BYTES as BREED_MAX_IMAGE_BYTES
     from src.core.inference import BreedInferenceEngine
     BREED_DETECTION_AVAILABLE = True
     logger.info("✅ Advanced breed detection system available")
@@ -96,16 +114,69 @@ except ImportError as e:
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# In-memory job storage (replace with Redis in production)
-job_storage = {}
+# Job storage (SQLite shared by all workers, or in-memory via JOB_STORE_BACKEND)
+job_store = create_job_store()
 neural_planter = None
 
+# Planter generation queue (None runs jobs inline as background tasks)
+job_queue = create_job_queue()
+if job_queue and job_store.name == 'memory':
+    logger.warning("⚠️  Job queue workers cannot see the in-memory job store; set JOB_STORE_BACKEND=sqlite")
+
+# Generated meshes reused across identical photo + parameter requests
+artifact_cache = create_artifact_cache()
+
+# Live progress fan-out for SSE / WebSocket subscribers
+job_events = JobEvents()
+
+# Per-plan, per-route request limits (RATE_LIMITS overrides the defaults; shared via RATE_LIMIT_BACKEND)
+rate_limiter = create_rate_limiter()
+
+# Identical concurrent enhanced generations share one run; Idempotency-Key retries replay the response
+enhanced_flights = SingleFlight()
+idempotent_responses = SingleFlight(result_ttl=IDEMPOTENCY_TTL)
+
+async def update_job(job_id: str, **fields):
+    """Update a job and push the new state to anyone streaming it"""
+    record = await job_store.aupdate(job_id, **fields)
+    if record is not None:
+        job_events.publish(job_id, record)
+    return record
+
+def get_neural_planter():
+    """Load the neural pipeline once per process (API server or queue worker)"""
+    global neural_planter
+    if neural_planter is None and ImprovedNeuralDogPlanter:
+        try:
+            neural_planter = ImprovedNeuralDogPlanter()
+            logger.info("✅ Neural network pipeline loaded successfully")
+        except Exception as e:
+            logger.error(f"❌ Failed to load neural pipeline: {e}")
+    return neural_planter
+
+# Pooled HTTP sessions for AWS Lambda, Replicate and image hosts
+upstream_sessions = UpstreamSessions()
+
+# Worker processes for mesh welding / decimation (CPU-bound, kept off the event loop)
+mesh_optimizer = MeshOptimizer()
+
+# JWT verification against the configured JWKS (demo pk_ tokens when none is configured)
+token_verifier = create_token_verifier(lambda: upstream_sessions.get('auth'))
+if token_verifier is None:
+    logger.warning("⚠️  AUTH_JWKS_URL / AUTH_JWKS_PATH not set - accepting demo pk_ tokens")
+
+# Shared completion tracker for every in-flight Replicate prediction
+replicate_poller = ReplicatePoller(lambda: upstream_sessions.get('replicate'), api_token=REPLICATE_API_TOKEN)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    global neural_planter
     logger.info("🚀 Initializing PetPlantr API server...")
     
+    await upstream_sessions.start()
+    await replicate_poller.start()
+    await rate_limiter.start()
+    
     # Initialize production components
     if PRODUCTION_HARDENING_AVAILABLE and replicate_client:
         try:
@@ -114,14 +185,12 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             logger.error(f"❌ Failed to initialize Replicate client: {e}")
     
-    # Initialize neural network pipeline
-    if ImprovedNeuralDogPlanter:
-        try:
-            neural_planter = ImprovedNeuralDogPlanter()
-            logger.info("✅ Neural network pipeline loaded successfully")
-        except Exception as e:
-            logger.error(f"❌ Failed to load neural pipeline: {e}")
-            neural_planter = None
+    # Initialize neural network pipeline (queue workers load their own)
+    if job_queue:
+        logger.info(f"📬 Planter jobs go to the {job_queue.name} queue; run workers with "
+                    f"`python -m src.services.job_queue api_server:process_planter_generation`")
+    elif ImprovedNeuralDogPlanter:
+        get_neural_planter()
     else:
         logger.warning("⚠️  Running in demo mode - neural pipeline not available")
     
@@ -137,6 +206,14 @@ async def lifespan(app: FastAPI):
             logger.info("✅ Replicate client shutdown complete")
         except Exception as e:
             logger.error(f"❌ Error during Replicate client shutdown: {e}")
+    
+    await replicate_poller.stop()
+    await upstream_sessions.close()
+    await rate_limiter.stop()
+    mesh_optimizer.shutdown()
+    job_store.close()
+    if job_queue:
+        job_queue.close()
 
 # FastAPI app setup
 app = FastAPI(
@@ -158,6 +235,12 @@ if PRODUCTION_HARDENING_AVAILABLE:
         app.add_middleware(ProductionMiddleware)
         logger.info("✅ Production monitoring middleware enabled")
 
+# Reject oversized uploads while they arrive, before multipart parsing spools them
+upload_limits = {"/api/v1/generate-planter": MAX_IMAGE_SIZE}
+if BREED_DETECTION_AVAILABLE and breed_router:
+    upload_limits["/api/v1/breed/detect-file"] = BREED_MAX_IMAGE_BYTES
+app.add_middleware(UploadSizeLimit, limits=upload_limits)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -265,6 +348,7 @@ class EnhancedQualityMetrics(BaseModel):
     geometry_score: float = 0.0
     polygon_count: int = 0
     texture_resolution: str = ""
+    optimization_time: Optional[float] = None
 
 class EnhancedMetadata(BaseModel):
     """Enhanced metadata"""
@@ -304,7 +388,7 @@ class EnhancedGenerationResult(BaseModel):
     breed_analysis: EnhancedBreedAnalysis
     quality_metrics: EnhancedQualityMetrics
     metadata: EnhancedMetadata
-    generation_details: Dict[str, str]
+    generation_details: Dict[str, Any]
     additional_features: Optional[AdditionalFeatures] = None
     message: str
     processing_time: str
@@ -313,73 +397,54 @@ class EnhancedGenerationResult(BaseModel):
 
 # Authentication (simplified)
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """Simple token validation (implement proper JWT in production)"""
+    """Verify the bearer JWT (cached until expiry after the first signature check)"""
     token = credentials.credentials
     
+    if token_verifier:
+        try:
+            claims = await token_verifier.verify(token)
+        except AuthError as e:
+            raise HTTPException(
+                status_code=401,
+                detail=f"Invalid authentication token: {e}",
+                headers={"WWW-Authenticate": "Bearer"}
+            )
+        return user_from_claims(claims)
+    
     # Demo validation - accept any token starting with "pk_"
     if token.startswith("pk_"):
         return {"user_id": "demo_user", "plan": "premium"}
     else:
         raise HTTPException(status_code=401, detail="Invalid authentication token")
 
-# Rate limiting (simplified)
-user_requests = {}
-
-async def check_rate_limit(user: dict = Depends(get_current_user)):
-    """Simple rate limiting: 100 requests per hour"""
-    user_id = user["user_id"]
-    current_time = time.time()
-    
-    if user_id not in user_requests:
-        user_requests[user_id] = []
-    
-    # Remove old requests (older than 1 hour)
-    user_requests[user_id] = [
-        req_time for req_time in user_requests[user_id] 
-        if current_time - req_time < 3600
-    ]
-    
-    # Check limit
-    if len(user_requests[user_id]) >= 100:
+# Rate limiting
+async def enforce_rate_limit(response: Response, identity: str, route: str, plan: Optional[str]):
+    """Count a request for the caller; 429 with Retry-After once the plan's limit is used up"""
+    decision = await rate_limiter.check(identity, route, plan)
+    if not decision.allowed:
         raise HTTPException(
-            status_code=429, 
-            detail="Rate limit exceeded. Maximum 100 requests per hour."
+            status_code=429,
+            detail=f"Rate limit exceeded. Try again in {int(decision.retry_after) + 1} seconds",
+            headers=decision.headers()
         )
-    
-    # Add current request
-    user_requests[user_id].append(current_time)
+    response.headers.update(decision.headers())
+
+async def check_rate_limit(response: Response, user: dict = Depends(get_current_user)):
+    """Per-user limit for planter generation (100 requests per hour by default)"""
+    await enforce_rate_limit(response, user["user_id"], "generate-planter", user.get("plan"))
     return user
 
 # Enhanced utility functions
-async def check_rate_limit_enhanced(request: Request) -> Dict[str, Any]:
-    """Enhanced rate limiting with IP detection"""
+async def check_rate_limit_enhanced(request: Request, response: Response) -> Dict[str, Any]:
+    """Per-client limit for the unauthenticated enhanced endpoint (50 requests per hour by default)"""
+    forwarded = request.headers.get('x-forwarded-for')
     client_id = (
-        request.headers.get('x-forwarded-for') or 
-        request.headers.get('x-real-ip') or 
-        str(request.client.host) if request.client else 'anonymous'
+        (forwarded.split(',')[0].strip() if forwarded else None) or
+        request.headers.get('x-real-ip') or
+        (str(request.client.host) if request.client else 'anonymous')
     )
     
-    now = time.time()
-    hour_ms = 3600  # 1 hour in seconds
-    
-    if client_id not in request_log:
-        request_log[client_id] = {'count': 1, 'reset_time': now + hour_ms}
-        return {'allowed': True, 'user_id': f'user_{client_id}'}
-    
-    record = request_log[client_id]
-    
-    if now > record['reset_time']:
-        record['count'] = 1
-        record['reset_time'] = now + hour_ms
-        return {'allowed': True, 'user_id': f'user_{client_id}'}
-    
-    if record['count'] >= MAX_REQUESTS_PER_HOUR:
-        raise HTTPException(
-            status_code=429, 
-            detail=f"Rate limit exceeded. Try again in {int(record['reset_time'] - now)} seconds"
-        )
-    
-    record['count'] += 1
+    await enforce_rate_limit(response, client_id, "generate-enhanced-3d", "anonymous")
     return {'allowed': True, 'user_id': f'user_{client_id}'}
 
 def validate_image_file(file: UploadFile) -> bool:
@@ -427,6 +492,7 @@ def calculate_estimated_cost(quality_level: str) -> str:
     base = base_costs.get(quality_level, 5.00)
     return f"${base:.2f}"
 
+@timed('lambda_analysis')
 async def analyze_pet_image_enhanced(image_url: str, user_breed: Optional[str] = None, options: Optional[EnhancedGenerationOptions] = None) -> EnhancedBreedAnalysis:
     """Enhanced pet image analysis with AWS Lambda"""
     logger.info('🔍 Analyzing pet image with enhanced production AI...')
@@ -444,39 +510,40 @@ async def analyze_pet_image_enhanced(image_url: str, user_breed: Optional[str] =
             'analyzeDimensions': options.analyze_dimensions
         }
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f'{AWS_LAMBDA_API_URL}/api/analyze-pet',
-                json=request_body,
-                headers={'Content-Type': 'application/json'}
-            ) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    analysis_data = data.get('analysis', data)
-                    
-                    return EnhancedBreedAnalysis(
-                        breed=analysis_data.get('breed', user_breed or 'Mixed Breed'),
-                        confidence=analysis_data.get('confidence', 0.9 if user_breed else 0.7),
-                        head_shape=analysis_data.get('headShape', 'well-proportioned'),
-                        ear_type=analysis_data.get('earType', 'alert'),
-                        facial_features=analysis_data.get('facialFeatures', 'intelligent expression'),
-                        body_type=analysis_data.get('bodyType', 'athletic'),
-                        size_class=analysis_data.get('sizeClass', 'medium'),
-                        primary_color=analysis_data.get('primaryColor', '#8B7355'),
-                        markings=analysis_data.get('markings', 'unique pattern'),
-                        facial_markings=analysis_data.get('facialMarkings', 'distinctive features'),
-                        color_palette=analysis_data.get('colorPalette', ['#8B7355', '#D2B48C', '#FFFFFF']),
-                        estimated_size=analysis_data.get('estimatedSize', {'height': '20-24 inches', 'weight': '40-60 lbs'}),
-                        personality=analysis_data.get('personality', 'friendly and intelligent'),
-                        dimensions={'height': '24 inches', 'length': '36 inches', 'weight': '45-65 lbs'},
-                        temperament='friendly, intelligent, loyal',
-                        activity_level='moderate to high',
-                        grooming_needs='moderate'
-                    )
+        session = upstream_sessions.get('lambda')
+        async with session.post(
+            f'{AWS_LAMBDA_API_URL}/api/analyze-pet',
+            json=request_body,
+            headers={'Content-Type': 'application/json'}
+        ) as response:
+            if response.status == 200:
+                data = await response.json()
+                analysis_data = data.get('analysis', data)
+                
+                return EnhancedBreedAnalysis(
+                    breed=analysis_data.get('breed', user_breed or 'Mixed Breed'),
+                    confidence=analysis_data.get('confidence', 0.9 if user_breed else 0.7),
+                    head_shape=analysis_data.get('headShape', 'well-proportioned'),
+                    ear_type=analysis_data.get('earType', 'alert'),
+                    facial_features=analysis_data.get('facialFeatures', 'intelligent expression'),
+                    body_type=analysis_data.get('bodyType', 'athletic'),
+                    size_class=analysis_data.get('sizeClass', 'medium'),
+                    primary_color=analysis_data.get('primaryColor', '#8B7355'),
+                    markings=analysis_data.get('markings', 'unique pattern'),
+                    facial_markings=analysis_data.get('facialMarkings', 'distinctive features'),
+                    color_palette=analysis_data.get('colorPalette', ['#8B7355', '#D2B48C', '#FFFFFF']),
+                    estimated_size=analysis_data.get('estimatedSize', {'height': '20-24 inches', 'weight': '40-60 lbs'}),
+                    personality=analysis_data.get('personality', 'friendly and intelligent'),
+                    dimensions={'height': '24 inches', 'length': '36 inches', 'weight': '45-65 lbs'},
+                    temperament='friendly, intelligent, loyal',
+                    activity_level='moderate to high',
+                    grooming_needs='moderate'
+                )
     except Exception as e:
         logger.error(f'AWS analyze-pet failed: {e}')
 
     # Enhanced fallback analysis
+    record_fallback('breed_analysis')
     return EnhancedBreedAnalysis(
         breed=user_breed or 'Mixed Breed',
         confidence=0.9 if user_breed else 0.7,
@@ -516,11 +583,28 @@ async def health_check():
     return {
         "status": "healthy",
         "neural_pipeline": neural_planter is not None,
-        "active_jobs": len(job_storage),
+        "active_jobs": await job_store.acount(),
         "memory_usage": "available",  # Add actual memory monitoring
-        "gpu_available": "checking"   # Add GPU status check
+        "gpu_available": "checking",  # Add GPU status check
+        "upstream_connections": upstream_sessions.stats(),
+        "replicate_predictions": replicate_poller.get_metrics(),
+        "job_queue": await asyncio.to_thread(job_queue.stats) if job_queue else {"backend": "inline"},
+        "job_events": job_events.get_metrics(),
+        "artifact_cache": artifact_cache.get_metrics() if artifact_cache else None,
+        "mesh_optimizer": mesh_optimizer.get_metrics(),
+        "rate_limits": rate_limiter.get_metrics(),
+        "auth": token_verifier.get_metrics() if token_verifier else {"mode": "demo"},
+        "coalescing": {
+            "enhanced_generations": enhanced_flights.get_metrics(),
+            "idempotent_responses": idempotent_responses.get_metrics()
+        }
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Stage latencies and fallback counters in Prometheus text format"""
+    return Response(content=REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
 @app.post("/api/v1/generate-planter", response_model=GenerationStatus)
 async def generate_planter(
     background_tasks: BackgroundTasks,
@@ -529,13 +613,22 @@ async def generate_planter(
     style: Optional[str] = "realistic",
     size: Optional[str] = "medium",
     quality: Optional[str] = "high",
+    idempotency_key: Optional[str] = Header(None),
     user: dict = Depends(check_rate_limit)
 ):
-    """Generate 3D planter from dog photo"""
+    """
+    Generate 3D planter from dog photo
+
+    A request identical to one of the user's jobs still in flight (same
+    photo bytes and parameters) returns that job instead of starting
+    another. Retries carrying the same ``Idempotency-Key`` header return
+    the job created by the first attempt.
+    """
     
     # Validate file
     if not file.content_type or not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image")
+    _validate_idempotency_key(idempotency_key)
     
     # Create job
     job_id = str(uuid.uuid4())
@@ -546,45 +639,115 @@ async def generate_planter(
         created_at=time.strftime("%Y-%m-%d %H:%M:%S UTC")
     )
     
-    job_storage[job_id] = job_info.dict()
+    # Stream the upload into the spool directory where queue workers can read it
+    os.makedirs(JOB_SPOOL_DIR, exist_ok=True)
+    try:
+        upload = await ingest_upload(file, MAX_IMAGE_SIZE, spool_dir=JOB_SPOOL_DIR)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    
+    # Retry of a request we already accepted: hand back its job
+    idempotency_claim = f"idem:{user['user_id']}:{idempotency_key}" if idempotency_key else None
+    if idempotency_claim:
+        owner = await job_store.aclaim(idempotency_claim, job_id, IDEMPOTENCY_TTL)
+        if owner != job_id:
+            upload.discard()
+            logger.info(f"🔁 Idempotent replay of job {owner} for user {user['user_id']}")
+            return await _job_status(owner)
+    
+    params = {
+        "breed_hint": breed_hint or "",
+        "style": style or "realistic",
+        "size": size or "medium",
+        "quality": quality or "high"
+    }
+    content_key = artifact_key(upload.sha256, **params)
+    
+    # Same photo and parameters as an earlier job: reuse its mesh and finish now
+    cache_key = content_key if artifact_cache else None
+    if cache_key:
+        output_path = f"temp_outputs/{job_id}_planter.stl"
+        cached = artifact_cache.lookup(cache_key, output_path)
+        if cached is not None:
+            upload.discard()
+            job_info.status = "completed"
+            job_info.progress = 100.0
+            job_info.completed_at = time.strftime("%Y-%m-%d %H:%M:%S UTC")
+            await job_store.acreate(job_id, {
+                **job_info.dict(),
+                "user_id": user["user_id"],
+                "stl_file_path": output_path,
+                "processing_time": 0.0,
+                "quality_score": cached.get("quality_score", 0.0),
+                "metadata": {**params, "user_id": user["user_id"], "artifact_cache_hit": True}
+            })
+            logger.info(f"♻️  Job {job_id} served from artifact cache for user {user['user_id']}")
+            return job_info
+    
+    # Same photo and parameters as a job still running: attach to it
+    flight_claim = f"flight:{user['user_id']}:{content_key}"
+    leader = await job_store.aclaim(flight_claim, job_id, IDEMPOTENCY_TTL)
+    if leader != job_id:
+        leader_info = await job_store.aget(leader)
+        if leader_info is not None and leader_info["status"] not in TERMINAL_STATUSES:
+            upload.discard()
+            if idempotency_claim:
+                await job_store.aclaim(idempotency_claim, leader, IDEMPOTENCY_TTL, expected=job_id)
+            logger.info(f"🔗 Request coalesced onto in-flight job {leader} for user {user['user_id']}")
+            return await _job_status(leader, leader_info)
+        # The earlier job finished or vanished; this request takes over the key
+        await job_store.aclaim(flight_claim, job_id, IDEMPOTENCY_TTL, expected=leader)
+    
+    input_path = upload.persist(os.path.join(JOB_SPOOL_DIR, f"{job_id}.jpg"))
+    
+    await job_store.acreate(job_id, {**job_info.dict(), "user_id": user["user_id"]})
+    
+    payload = {
+        "job_id": job_id,
+        "input_path": input_path,
+        **params,
+        "user_id": user["user_id"],
+        "cache_key": cache_key
+    }
     
-    # Start background processing
-    background_tasks.add_task(
-        process_planter_generation,
-        job_id,
-        file,
-        breed_hint or "",
-        style or "realistic",
-        size or "medium",
-        quality or "high",
-        user["user_id"]
-    )
+    # Hand off to queue workers, or process in this server without a queue
+    if job_queue:
+        await asyncio.to_thread(job_queue.enqueue, job_id, {**payload, "queued": True})
+    else:
+        background_tasks.add_task(process_planter_generation, **payload)
     
     logger.info(f"🎯 Started planter generation job {job_id} for user {user['user_id']}")
     return job_info
 
 async def process_planter_generation(
     job_id: str,
-    file: UploadFile,
+    input_path: str,
     breed_hint: str,
     style: str,
     size: str,
     quality: str,
-    user_id: str
+    user_id: str,
+    cache_key: Optional[str] = None,
+    queued: bool = False
 ):
-    """Background task for planter generation"""
+    """
+    Planter generation task (queue worker or in-process background task)
+
+    Under a queue worker (``queued``) a failure re-raises so the worker
+    retries with backoff; the job stays pending with its last error and
+    the upload is kept for the retry until fail_planter_job dead-letters
+    it. Inline, a failure marks the job failed straight away.
+    """
+    cacheable = True
+    succeeded = False
     try:
         # Update status
-        job_storage[job_id]["status"] = "processing"
-        job_storage[job_id]["progress"] = 10.0
+        await update_job(job_id, status="processing", progress=10.0)
         
-        # Save uploaded file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp_file:
-            content = await file.read()
-            temp_file.write(content)
-            temp_input_path = temp_file.name
+        temp_input_path = input_path
+        neural_planter = get_neural_planter()
         
-        job_storage[job_id]["progress"] = 20.0
+        await update_job(job_id, progress=20.0)
         
         # Process with neural network
         if neural_planter:
@@ -598,113 +761,146 @@ async def process_planter_generation(
             
             # Call neural pipeline (with fallback if method doesn't exist)
             try:
-                # Try different possible method names
-                if hasattr(neural_planter, 'generate_dog_planter'):
-                    result = getattr(neural_planter, 'generate_dog_planter')(
-                        temp_input_path,
-                        output_path,
-                        breed_hint=breed_hint
-                    )
-                elif hasattr(neural_planter, 'generate_planter'):
-                    result = getattr(neural_planter, 'generate_planter')(
-                        temp_input_path,
-                        output_path,
-                        breed_hint=breed_hint
-                    )
-                else:
-                    # Fallback: create demo output
-                    result = {"quality_score": 85.0}
-                    demo_stl_content = """solid DemoPlanter
-  facet normal 0 0 1
-    outer loop
-      vertex 0 0 0
-      vertex 1 0 0
-      vertex 0 1 0
-    endloop
-  endfacet
-endsolid DemoPlanter"""
-                    with open(output_path, "w") as f:
-                        f.write(demo_stl_content)
+                # Try different possible method names (run off the event loop)
+                with timed('neural_stl'):
+                    if hasattr(neural_planter, 'generate_dog_planter'):
+                        result = await asyncio.to_thread(
+                            getattr(neural_planter, 'generate_dog_planter'),
+                            temp_input_path,
+                            output_path,
+                            breed_hint=breed_hint
+                        )
+                    elif hasattr(neural_planter, 'generate_planter'):
+                        result = await asyncio.to_thread(
+                            getattr(neural_planter, 'generate_planter'),
+                            temp_input_path,
+                            output_path,
+                            breed_hint=breed_hint
+                        )
+                    else:
+                        # Fallback: create demo output
+                        record_fallback('demo_planter')
+                        cacheable = False
+                        result = {"quality_score": 85.0}
+                        write_placeholder_stl(output_path, "DemoPlanter")
             except Exception as e:
                 logger.warning(f"Neural pipeline error: {e}, using fallback")
+                record_fallback('neural_stl')
+                cacheable = False
                 result = {"quality_score": 75.0}
-                demo_stl_content = """solid FallbackPlanter
-  facet normal 0 0 1
-    outer loop
-      vertex 0 0 0
-      vertex 1 0 0
-      vertex 0 1 0
-    endloop
-  endfacet
-endsolid FallbackPlanter"""
-                with open(output_path, "w") as f:
-                    f.write(demo_stl_content)
+                write_placeholder_stl(output_path, "FallbackPlanter")
             
             processing_time = time.time() - start_time
-            job_storage[job_id]["progress"] = 90.0
+            await update_job(job_id, progress=90.0)
             
         else:
             # Demo mode - create placeholder STL
             logger.info(f"📝 Processing {job_id} in demo mode...")
+            record_fallback('demo_planter')
+            cacheable = False
             output_path = f"temp_outputs/{job_id}_demo_planter.stl"
             os.makedirs("temp_outputs", exist_ok=True)
             
             # Create simple demo STL content
-            demo_stl_content = """solid DemoPlanter
-  facet normal 0 0 1
-    outer loop
-      vertex 0 0 0
-      vertex 1 0 0
-      vertex 0 1 0
-    endloop
-  endfacet
-endsolid DemoPlanter"""
-            
-            with open(output_path, "w") as f:
-                f.write(demo_stl_content)
+            write_placeholder_stl(output_path, "DemoPlanter")
             
             processing_time = 2.0  # Demo processing time
             result = {"quality_score": 85.0}
         
         # Complete job
-        job_storage[job_id].update({
-            "status": "completed",
-            "progress": 100.0,
-            "completed_at": time.strftime("%Y-%m-%d %H:%M:%S UTC"),
-            "stl_file_path": output_path,
-            "processing_time": processing_time,
-            "quality_score": result.get("quality_score", 0.0),
-            "metadata": {
+        await update_job(
+            job_id,
+            status="completed",
+            progress=100.0,
+            completed_at=time.strftime("%Y-%m-%d %H:%M:%S UTC"),
+            stl_file_path=output_path,
+            processing_time=processing_time,
+            quality_score=result.get("quality_score", 0.0),
+            metadata={
                 "breed_hint": breed_hint,
                 "style": style,
                 "size": size,
                 "quality": quality,
                 "user_id": user_id
             }
-        })
+        )
         
         logger.info(f"✅ Completed job {job_id} in {processing_time:.1f}s")
         
-        # Cleanup input file
-        os.unlink(temp_input_path)
+        # Keep the mesh for identical future requests (only real generator output is reused);
+        # storing walks temp_outputs for eviction, so it runs off the event loop
+        if cache_key and artifact_cache and cacheable:
+            await asyncio.to_thread(artifact_cache.store, cache_key, output_path, {
+                "quality_score": result.get("quality_score", 0.0),
+                "processing_time": processing_time
+            })
+        
+        succeeded = True
         
     except Exception as e:
         logger.error(f"❌ Job {job_id} failed: {e}")
-        job_storage[job_id].update({
-            "status": "failed",
-            "error": str(e),
-            "completed_at": time.strftime("%Y-%m-%d %H:%M:%S UTC")
-        })
+        if queued:
+            await update_job(job_id, status="pending", progress=0.0, error=str(e))
+            raise
+        await update_job(
+            job_id,
+            status="failed",
+            error=str(e),
+            completed_at=time.strftime("%Y-%m-%d %H:%M:%S UTC")
+        )
+    finally:
+        # Cleanup input file (a queued job keeps it until its last attempt)
+        if succeeded or not queued:
+            _discard_spooled_input(input_path)
+
+def _discard_spooled_input(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+def _validate_idempotency_key(idempotency_key: Optional[str]):
+    if idempotency_key is not None and not 0 < len(idempotency_key) <= 255:
+        raise HTTPException(status_code=400, detail="Idempotency-Key must be 1-255 characters")
+
+async def _job_status(job_id: str, job_info: Optional[Dict[str, Any]] = None) -> GenerationStatus:
+    """Status response for an existing job (pending if its first request is still setting it up)"""
+    job_info = job_info or await job_store.aget(job_id)
+    if job_info is None:
+        return GenerationStatus(
+            job_id=job_id,
+            status="pending",
+            progress=0.0,
+            created_at=time.strftime("%Y-%m-%d %H:%M:%S UTC")
+        )
+    return GenerationStatus(
+        job_id=job_id,
+        status=job_info["status"],
+        progress=job_info.get("progress", 0.0),
+        created_at=job_info.get("created_at", ""),
+        completed_at=job_info.get("completed_at")
+    )
+
+def fail_planter_job(job_id: str, error: str):
+    """Dead-letter hook for queue workers: a job that kept failing or crashing its worker (called synchronously)"""
+    _discard_spooled_input(os.path.join(JOB_SPOOL_DIR, f"{job_id}.jpg"))
+    record = job_store.update(
+        job_id,
+        status="failed",
+        error=error,
+        completed_at=time.strftime("%Y-%m-%d %H:%M:%S UTC")
+    )
+    if record is not None:
+        job_events.publish(job_id, record)
 
 @app.get("/api/v1/status/{job_id}", response_model=GenerationResult)
 async def get_generation_status(job_id: str, user: dict = Depends(get_current_user)):
     """Get status of planter generation job"""
     
-    if job_id not in job_storage:
+    job_info = await job_store.aget(job_id)
+    if job_info is None:
         raise HTTPException(status_code=404, detail="Job not found")
     
-    job_info = job_storage[job_id]
-    
     # Build response
     result = GenerationResult(
         job_id=job_id,
@@ -721,15 +917,84 @@ async def get_generation_status(job_id: str, user: dict = Depends(get_current_us
     
     return result
 
+async def _owned_job(job_id: str, user: dict) -> Dict[str, Any]:
+    """Job record the user may watch, or 404/403"""
+    job_info = await job_store.aget(job_id)
+    if job_info is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    owner = job_owner(job_info)
+    if owner and owner != user["user_id"]:
+        raise HTTPException(status_code=403, detail="Access denied")
+    return job_info
+
+def _job_watch_source(job_id: str):
+    """Store reader for jobs that other processes (queue workers) update"""
+    return (lambda: job_store.aget(job_id)) if job_queue else None
+
+@app.get("/api/v1/status/{job_id}/events")
+async def stream_generation_status(job_id: str, request: Request, user: dict = Depends(get_current_user)):
+    """Server-sent events stream of job progress; ends once the job completes or fails"""
+
+    job_info = await _owned_job(job_id, user)
+
+    async def current():
+        return await job_store.aget(job_id) or job_info
+
+    async def event_stream():
+        # Subscribe before re-reading the job so no update is lost in between
+        async with job_events.subscribe(job_id, load=current, fetch=_job_watch_source(job_id)) as subscription:
+            while not await request.is_disconnected():
+                event = await subscription.next(timeout=HEARTBEAT_INTERVAL)
+                if event is None:
+                    yield b": keep-alive\n\n"
+                    continue
+                yield format_sse(event)
+                if is_terminal(event):
+                    break
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/api/v1/status/{job_id}/ws")
+async def websocket_generation_status(websocket: WebSocket, job_id: str, token: str = Query(...)):
+    """WebSocket variant of the progress stream (browsers cannot set headers, so auth is ?token=)"""
+
+    try:
+        user = await get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+        job_info = await _owned_job(job_id, user)
+    except HTTPException as e:
+        await websocket.close(code=4000 + e.status_code, reason=str(e.detail))
+        return
+
+    await websocket.accept()
+    try:
+        async def current():
+            return await job_store.aget(job_id) or job_info
+
+        async with job_events.subscribe(job_id, load=current, fetch=_job_watch_source(job_id)) as subscription:
+            while True:
+                event = await subscription.next(timeout=HEARTBEAT_INTERVAL)
+                if event is None:
+                    await websocket.send_json({"event": "keep-alive"})
+                    continue
+                await websocket.send_text(f'{{"event": "{event[0]}", "data": {event[1]}}}')
+                if is_terminal(event):
+                    break
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
 @app.get("/api/v1/download/{job_id}/stl")
-async def download_stl(job_id: str, user: dict = Depends(get_current_user)):
-    """Download generated STL file"""
+async def download_stl(job_id: str, request: Request, user: dict = Depends(get_current_user)):
+    """Download generated STL file (chunked, resumable with Range, gzip/deflate for large meshes)"""
     
-    if job_id not in job_storage:
+    job_info = await job_store.aget(job_id)
+    if job_info is None:
         raise HTTPException(status_code=404, detail="Job not found")
     
-    job_info = job_storage[job_id]
-    
     if job_info["status"] != "completed":
         raise HTTPException(status_code=400, detail="Job not completed")
     
@@ -737,44 +1002,67 @@ async def download_stl(job_id: str, user: dict = Depends(get_current_user)):
     if not stl_path or not os.path.exists(stl_path):
         raise HTTPException(status_code=404, detail="STL file not found")
     
-    return FileResponse(
+    return file_download(
         stl_path,
-        media_type="application/octet-stream",
+        request.headers,
+        media_type="model/stl",
         filename=f"petplantr_{job_id}_planter.stl"
     )
 
+@app.get("/api/v1/download/optimized/{model_id}/stl")
+async def download_optimized_stl(model_id: str, request: Request, user: dict = Depends(get_current_user)):
+    """Download a mesh produced by the enhanced pipeline's optimizer (same streaming as job downloads)"""
+    
+    if not model_id.replace('-', '').replace('_', '').isalnum():
+        raise HTTPException(status_code=404, detail="STL file not found")
+    
+    stl_path = f"temp_outputs/{model_id}_optimized.stl"
+    if not os.path.exists(stl_path):
+        raise HTTPException(status_code=404, detail="STL file not found")
+    
+    return file_download(
+        stl_path,
+        request.headers,
+        media_type="model/stl",
+        filename=f"petplantr_{model_id}_optimized.stl"
+    )
+
 @app.get("/api/v1/jobs")
-async def list_user_jobs(user: dict = Depends(get_current_user)):
-    """List all jobs for authenticated user"""
+async def list_user_jobs(
+    limit: int = Query(20, ge=1, le=100),
+    after: Optional[str] = None,
+    user: dict = Depends(get_current_user)
+):
+    """List jobs for authenticated user, newest first (pass next_cursor as `after` for the next page)"""
+    
+    try:
+        jobs, next_cursor = await job_store.alist_jobs(user["user_id"], limit=limit, after=after)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     
-    user_id = user["user_id"]
     user_jobs = []
     
-    for job_id, job_info in job_storage.items():
-        metadata = job_info.get("metadata", {})
-        if metadata.get("user_id") == user_id:
-            user_jobs.append({
-                "job_id": job_id,
-                "status": job_info["status"],
-                "created_at": job_info["created_at"],
-                "completed_at": job_info.get("completed_at"),
-                "breed_hint": metadata.get("breed_hint")
-            })
+    for job_info in jobs:
+        metadata = job_info.get("metadata") or {}
+        user_jobs.append({
+            "job_id": job_info["job_id"],
+            "status": job_info["status"],
+            "created_at": job_info["created_at"],
+            "completed_at": job_info.get("completed_at"),
+            "breed_hint": metadata.get("breed_hint")
+        })
     
-    return {"jobs": sorted(user_jobs, key=lambda x: x["created_at"], reverse=True)}
+    return {"jobs": user_jobs, "next_cursor": next_cursor}
 
 @app.delete("/api/v1/jobs/{job_id}")
 async def delete_job(job_id: str, user: dict = Depends(get_current_user)):
     """Delete a job and its files"""
     
-    if job_id not in job_storage:
+    job_info = await job_store.aget(job_id)
+    if job_info is None:
         raise HTTPException(status_code=404, detail="Job not found")
-    
-    job_info = job_storage[job_id]
-    metadata = job_info.get("metadata", {})
-    
     # Check ownership
-    if metadata.get("user_id") != user["user_id"]:
+    if job_owner(job_info) != user["user_id"]:
         raise HTTPException(status_code=403, detail="Access denied")
     
     # Delete files
@@ -783,10 +1071,28 @@ async def delete_job(job_id: str, user: dict = Depends(get_current_user)):
         os.unlink(stl_path)
     
     # Remove from storage
-    del job_storage[job_id]
+    await job_store.adelete(job_id)
     
     return {"message": "Job deleted successfully"}
 
+@app.post("/api/v1/webhooks/replicate")
+async def replicate_webhook(request: Request):
+    """Completion callback from Replicate; settles the waiting prediction immediately"""
+
+    body = await request.body()
+    try:
+        replicate_poller.verify_webhook(request.headers, body)
+    except WebhookSignatureError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+
+    try:
+        prediction = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON payload")
+
+    resolved = replicate_poller.resolve(prediction)
+    return {"received": True, "resolved": resolved}
+
 # Enhanced API endpoint
 @app.post("/api/v1/generate-enhanced-3d-simple", response_model=EnhancedGenerationResult)
 async def generate_enhanced_3d_simple(
@@ -795,11 +1101,19 @@ async def generate_enhanced_3d_simple(
     quality_level: QualityLevel = Form(QualityLevel.ultra_high),
     breed: Optional[str] = Form(None),
     options: Optional[str] = Form("{}"),  # JSON string of options
+    idempotency_key: Optional[str] = Header(None),
     user: dict = Depends(check_rate_limit_enhanced)
 ):
-    """Enhanced 3D model generation endpoint with comprehensive options"""
+    """
+    Enhanced 3D model generation endpoint with comprehensive options
+
+    Concurrent requests with the same image, quality, breed and options
+    share one generation. With an ``Idempotency-Key`` header, retries
+    within ``IDEMPOTENCY_TTL`` get the first attempt's result.
+    """
     
     start_time = time.time()
+    _validate_idempotency_key(idempotency_key)
     
     try:
         # Parse options
@@ -836,11 +1150,10 @@ async def generate_enhanced_3d_simple(
                     raise HTTPException(status_code=400, detail="Image too large. Maximum size: 10MB")
             else:
                 # For regular URLs, make a HEAD request
-                async with aiohttp.ClientSession() as session:
-                    async with session.head(image_url) as response:
-                        content_length = response.headers.get('content-length')
-                        if content_length and int(content_length) > MAX_IMAGE_SIZE:
-                            raise HTTPException(status_code=400, detail="Image too large. Maximum size: 10MB")
+                async with upstream_sessions.get('images').head(image_url) as response:
+                    content_length = response.headers.get('content-length')
+                    if content_length and int(content_length) > MAX_IMAGE_SIZE:
+                        raise HTTPException(status_code=400, detail="Image too large. Maximum size: 10MB")
         except HTTPException:
             raise  # Re-raise HTTP exceptions
         except Exception as e:
@@ -850,11 +1163,28 @@ async def generate_enhanced_3d_simple(
         logger.info(f"🎯 Starting enhanced 3D generation ({mode} mode)...")
         logger.info(f"📊 Request details: Quality={quality_level}, Breed={breed or 'auto-detect'}, Options={options_dict}")
         
-        if PRODUCTION_MODE:
-            result = await generate_production_model_enhanced(image_url, quality_level, breed, generation_options)
+        async def generate():
+            if PRODUCTION_MODE:
+                return await generate_production_model_enhanced(image_url, quality_level, breed, generation_options)
+            return await generate_development_model_enhanced(image_url, quality_level, breed, generation_options)
+        
+        fingerprint = request_fingerprint(image_url, quality_level.value, breed, generation_options.dict())
+        
+        async def generate_once():
+            result, shared = await enhanced_flights.do(fingerprint, generate)
+            if shared:
+                logger.info("🔗 Enhanced generation coalesced onto an identical in-flight request")
+            return result
+        
+        if idempotency_key:
+            result, replayed = await idempotent_responses.do(f"{user['user_id']}:{idempotency_key}", generate_once)
+            if replayed:
+                logger.info(f"🔁 Idempotent replay for {user['user_id']}")
         else:
-            result = await generate_development_model_enhanced(image_url, quality_level, breed, generation_options)
+            result = await generate_once()
         
+        # Shared results are copied so each caller reports its own timing
+        result = result.copy()
         processing_time = time.time() - start_time
         result.processing_time = f"{processing_time:.1f}s"
         
@@ -883,26 +1213,24 @@ async def generate_production_model_enhanced(
     logger.info('🔥 Production mode: Calling real AI services...')
     
     try:
-        # Step 1: Analyze the pet image with enhanced AI
-        analysis_result = await analyze_pet_image_enhanced(image_url, breed, options)
-        
-        # Step 2: Generate 3D model using production services
-        model_result = await generate_with_3d_service_enhanced(image_url, analysis_result, quality_level, options)
-        
-        # Step 3: Optimize the generated model
-        optimized_result = await optimize_model_enhanced(model_result, options)
-        
-        # Step 4: Generate additional formats
-        additional_formats = await generate_additional_formats(optimized_result, options)
+        # Analyze → 3D model, then optimize, format conversion and thumbnailing side by side
+        outputs, stage_timings = await ENHANCED_PIPELINE.run(
+            image_url=image_url, breed=breed, quality_level=quality_level, options=options
+        )
+        analysis_result = outputs['analysis']
+        optimized_result = outputs['optimized']
+        additional_formats = {**outputs['formats'], **outputs['thumbnail']}
+        timings = ', '.join(f"{name} {span['duration']:.2f}s" for name, span in stage_timings.items())
+        logger.info(f'⏱️ Pipeline stages: {timings}')
         
         return EnhancedGenerationResult(
             success=True,
             development_mode=False,
             model_url=optimized_result['model_url'],
             stl_url=optimized_result['stl_url'],
-            obj_url=additional_formats['obj_url'],
+            obj_url=additional_formats.get('obj_url'),
             preview_url=optimized_result['preview_url'],
-            thumbnail_url=additional_formats['thumbnail_url'],
+            thumbnail_url=additional_formats.get('thumbnail_url'),
             breed_analysis=analysis_result,
             quality_metrics=EnhancedQualityMetrics(
                 prompt_complexity=optimized_result['complexity'],
@@ -911,8 +1239,9 @@ async def generate_production_model_enhanced(
                 estimated_printability=optimized_result['printability'],
                 mesh_quality=optimized_result.get('mesh_quality', 98.5),
                 geometry_score=optimized_result.get('geometry_score', 96.5),
-                polygon_count=options.target_poly_count,
-                texture_resolution=f"{options.texture_size}x{options.texture_size}"
+                polygon_count=optimized_result.get('polygon_count', options.target_poly_count),
+                texture_resolution=f"{options.texture_size}x{options.texture_size}",
+                optimization_time=optimized_result.get('optimization_time')
             ),
             metadata=EnhancedMetadata(
                 breed=analysis_result.breed,
@@ -936,9 +1265,10 @@ async def generate_production_model_enhanced(
                 'model_optimization': 'Production-grade optimization applied',
                 'planter_integration': 'Professional planter cavity integration',
                 'printability': 'Validated for commercial 3D printing',
-                'mesh_optimization': 'Advanced mesh optimization applied',
+                'mesh_optimization': optimized_result.get('mesh_optimization', 'Advanced mesh optimization applied'),
                 'texture_generation': optimized_result.get('texture_generation', 'High-quality texture mapping'),
-                'color_accuracy': '95% match to original photo'
+                'color_accuracy': '95% match to original photo',
+                'stage_timings': stage_timings
             },
             additional_features=AdditionalFeatures(
                 drainage_holes=options.include_drainage,
@@ -953,6 +1283,9 @@ async def generate_production_model_enhanced(
             job_id=optimized_result.get('job_id')
         )
         
+    except PipelineStageError as e:
+        logger.error(f'Production generation failed: {e} (stage timings: {e.spans})')
+        raise Exception(f'Production AI generation failed: {str(e)}')
     except Exception as e:
         logger.error(f'Production generation failed: {e}')
         raise Exception(f'Production AI generation failed: {str(e)}')
@@ -1047,6 +1380,7 @@ async def generate_development_model_enhanced(
         estimated_cost='$0.00 (development mode)'
     )
 
+@timed('3d_generation')
 async def generate_with_3d_service_enhanced(
     image_url: str, 
     analysis: EnhancedBreedAnalysis, 
@@ -1074,6 +1408,7 @@ async def generate_with_3d_service_enhanced(
         # Fallback to procedural generation
         return await generate_procedural_model_enhanced(analysis, quality_level, options)
 
+@timed('flux_image')
 async def generate_enhanced_pet_image(
     image_url: str, 
     analysis: EnhancedBreedAnalysis, 
@@ -1099,42 +1434,45 @@ async def generate_enhanced_pet_image(
     prompt = f"{base_prompt}. {', '.join(style_options)}. High detail, photorealistic, perfect for 3D reconstruction."
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                'https://api.replicate.com/v1/predictions',
-                headers={
-                    'Authorization': f'Token {REPLICATE_API_TOKEN}',
-                    'Content-Type': 'application/json'
+        session = upstream_sessions.get('replicate')
+        async with session.post(
+            f'{REPLICATE_API_BASE}/predictions',
+            headers={
+                'Authorization': f'Token {REPLICATE_API_TOKEN}',
+                'Content-Type': 'application/json'
+            },
+            json={
+                'version': 'black-forest-labs/flux-dev',
+                'input': {
+                    'prompt': prompt,
+                    'width': options.image_width,
+                    'height': options.image_height,
+                    'num_inference_steps': 35 if options.quality == 'high' else 28,
+                    'guidance_scale': 3.5,
+                    'output_format': 'png'
                 },
-                json={
-                    'version': 'black-forest-labs/flux-dev',
-                    'input': {
-                        'prompt': prompt,
-                        'width': options.image_width,
-                        'height': options.image_height,
-                        'num_inference_steps': 35 if options.quality == 'high' else 28,
-                        'guidance_scale': 3.5,
-                        'output_format': 'png'
-                    }
-                }
-            ) as response:
-                if response.status != 200:
-                    raise Exception(f'Replicate API error: {response.status}')
-                
-                prediction = await response.json()
-                
-                # Poll for completion
-                result = await poll_replicate_job(session, prediction['id'])
+                **replicate_poller.webhook_fields()
+            }
+        ) as response:
+            if response.status != 200:
+                raise Exception(f'Replicate API error: {response.status}')
+            
+            prediction = await response.json()
+            
+            # Wait for completion (webhook or adaptive polling)
+            result = await replicate_poller.wait(prediction['id'], 'black-forest-labs/flux-dev')
+            
+            if result['status'] == 'succeeded' and result['output']:
+                return result['output'][0] if isinstance(result['output'], list) else result['output']
+            else:
+                raise Exception('Enhanced image generation failed')
                 
-                if result['status'] == 'succeeded' and result['output']:
-                    return result['output'][0] if isinstance(result['output'], list) else result['output']
-                else:
-                    raise Exception('Enhanced image generation failed')
-                    
     except Exception as e:
         logger.error(f'Enhanced image generation failed: {e}')
+        record_fallback('flux_original_image')
         return image_url  # Fallback to original
 
+@timed('trellis_model')
 async def generate_custom_3d_model_enhanced(
     enhanced_image_url: str, 
     analysis: EnhancedBreedAnalysis, 
@@ -1145,75 +1483,56 @@ async def generate_custom_3d_model_enhanced(
     logger.info('🏗️ Converting image to 3D model with enhanced settings...')
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                'https://api.replicate.com/v1/predictions',
-                headers={
-                    'Authorization': f'Token {REPLICATE_API_TOKEN}',
-                    'Content-Type': 'application/json'
+        session = upstream_sessions.get('replicate')
+        async with session.post(
+            f'{REPLICATE_API_BASE}/predictions',
+            headers={
+                'Authorization': f'Token {REPLICATE_API_TOKEN}',
+                'Content-Type': 'application/json'
+            },
+            json={
+                'version': 'firtoz/trellis:e8f6c45206993f297372f5436b90350817bd9b4a0d52d2a76df50c1c8afa2b3c',
+                'input': {
+                    'images': [enhanced_image_url],
+                    'generate_model': True,
+                    'generate_color': options.include_color,
+                    'texture_size': options.texture_size,
+                    'mesh_simplify': options.mesh_simplify,
+                    'return_no_background': True,
+                    'randomize_seed': options.randomize_seed
                 },
-                json={
-                    'version': 'firtoz/trellis:e8f6c45206993f297372f5436b90350817bd9b4a0d52d2a76df50c1c8afa2b3c',
-                    'input': {
-                        'images': [enhanced_image_url],
-                        'generate_model': True,
-                        'generate_color': options.include_color,
-                        'texture_size': options.texture_size,
-                        'mesh_simplify': options.mesh_simplify,
-                        'return_no_background': True,
-                        'randomize_seed': options.randomize_seed
-                    }
-                }
-            ) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    raise Exception(f'3D generation API error: {response.status} - {error_text}')
+                **replicate_poller.webhook_fields()
+            }
+        ) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                raise Exception(f'3D generation API error: {response.status} - {error_text}')
+            
+            prediction = await response.json()
+            
+            # Wait for completion (webhook or adaptive polling)
+            result = await replicate_poller.wait(prediction['id'], 'firtoz/trellis')
+            
+            if result['status'] == 'succeeded' and result['output']:
+                model_url = result['output'].get('model_file', result['output'])
                 
-                prediction = await response.json()
+                # Convert to planter
+                planter_model = await convert_to_planter_model_enhanced(model_url, analysis, options)
                 
-                # Poll for completion
-                result = await poll_replicate_job(session, prediction['id'])
+                return {
+                    'model_url': planter_model['glb_url'],
+                    'stl_url': planter_model['stl_url'] or planter_model['glb_url'],
+                    'preview_url': planter_model['preview_url'] or planter_model['glb_url'],
+                    'job_id': prediction['id'],
+                    'message': 'Custom 3D model generated from pet photo with enhanced options'
+                }
+            else:
+                raise Exception('3D model generation failed')
                 
-                if result['status'] == 'succeeded' and result['output']:
-                    model_url = result['output'].get('model_file', result['output'])
-                    
-                    # Convert to planter
-                    planter_model = await convert_to_planter_model_enhanced(model_url, analysis, options)
-                    
-                    return {
-                        'model_url': planter_model['glb_url'],
-                        'stl_url': planter_model['stl_url'] or planter_model['glb_url'],
-                        'preview_url': planter_model['preview_url'] or planter_model['glb_url'],
-                        'job_id': prediction['id'],
-                        'message': 'Custom 3D model generated from pet photo with enhanced options'
-                    }
-                else:
-                    raise Exception('3D model generation failed')
-                    
     except Exception as e:
         logger.error(f'Custom 3D model generation failed: {e}')
         raise
 
-async def poll_replicate_job(session: aiohttp.ClientSession, job_id: str, max_attempts: int = 30) -> Dict[str, Any]:
-    """Poll Replicate job for completion"""
-    for i in range(max_attempts):
-        async with session.get(
-            f'https://api.replicate.com/v1/predictions/{job_id}',
-            headers={'Authorization': f'Token {REPLICATE_API_TOKEN}'}
-        ) as response:
-            if response.status != 200:
-                raise Exception(f'Failed to check job status: {response.status}')
-            
-            result = await response.json()
-            
-            if result['status'] in ['succeeded', 'failed']:
-                return result
-            
-            # Wait 2 seconds before next poll
-            await asyncio.sleep(2)
-    
-    raise Exception('Job polling timeout')
-
 async def convert_to_planter_model_enhanced(
     original_model_url: str, 
     analysis: EnhancedBreedAnalysis, 
@@ -1245,6 +1564,7 @@ async def generate_procedural_model_enhanced(
 ) -> Dict[str, Any]:
     """Generate enhanced procedural model"""
     logger.info('🔧 Generating enhanced procedural model based on breed analysis...')
+    record_fallback('procedural_model')
     
     # Generate custom model based on analysis and options
     model_id = f"custom_{int(time.time())}_{uuid.uuid4().hex[:8]}"
@@ -1267,6 +1587,30 @@ async def generate_procedural_model_enhanced(
         'message': 'Enhanced procedural model generated based on breed analysis'
     }
 
+async def fetch_mesh(model_url: str, destination: str) -> Optional[str]:
+    """Local path of a generated mesh, downloading it first when it is remote"""
+    base_url = os.getenv('BASE_URL', 'http://localhost:8000')
+    if model_url.startswith(f"{base_url}/temp_outputs/"):
+        path = os.path.join("temp_outputs", model_url[len(f"{base_url}/temp_outputs/"):])
+        return path if os.path.exists(path) else None
+    if os.path.exists(model_url):
+        return model_url
+    if not model_url.startswith(('http://', 'https://')):
+        return None
+    
+    received = 0
+    async with upstream_sessions.get('meshes').get(model_url) as response:
+        if response.status != 200:
+            raise Exception(f'Mesh download error: {response.status}')
+        with open(destination, 'wb') as f:
+            async for chunk in response.content.iter_chunked(256 * 1024):
+                received += len(chunk)
+                if received > MAX_MESH_SIZE:
+                    raise Exception(f'Mesh larger than {MAX_MESH_SIZE} bytes')
+                f.write(chunk)
+    return destination
+
+@timed('mesh_optimization')
 async def optimize_model_enhanced(
     model_result: Dict[str, Any], 
     options: EnhancedGenerationOptions
@@ -1277,7 +1621,7 @@ async def optimize_model_enhanced(
     optimization_level = options.optimization_level
     target_poly_count = options.target_poly_count
     
-    return {
+    optimized = {
         'model_url': model_result['model_url'],
         'stl_url': model_result['stl_url'],
         'preview_url': model_result['preview_url'],
@@ -1298,24 +1642,87 @@ async def optimize_model_enhanced(
         'texture_generation': 'High-quality procedural textures generated',
         'filament_usage': '150g'
     }
+    
+    # Weld, clean and decimate the real mesh in the optimizer pool
+    model_id = model_result.get('job_id') or uuid.uuid4().hex
+    source_url = model_result['stl_url'] or model_result['model_url']
+    download_path = f"temp_outputs/{model_id}_source{os.path.splitext(source_url.split('?')[0])[1] or '.glb'}"
+    output_path = f"temp_outputs/{model_id}_optimized.stl"
+    os.makedirs("temp_outputs", exist_ok=True)
+    try:
+        source_path = await fetch_mesh(source_url, download_path)
+        if source_path is None:
+            raise ValueError(f'mesh not reachable at {source_url}')
+        report = await mesh_optimizer.optimize_file(source_path, output_path, target_poly_count, optimization_level)
+    except Exception as e:
+        logger.warning(f'Mesh optimization skipped: {e}')
+        record_fallback('mesh_optimization_skipped')
+        optimized['mesh_optimization'] = f'Skipped ({e}); quality figures are estimates'
+        return optimized
+    finally:
+        if os.path.exists(download_path):
+            os.unlink(download_path)
+    
+    base_url = os.getenv('BASE_URL', 'http://localhost:8000')
+    logger.info(f"✅ Mesh optimized: {report['input_faces']} → {report['faces']} faces in {report['optimization_time']:.2f}s")
+    optimized.update({
+        'stl_url': f"{base_url}/api/v1/download/optimized/{model_id}/stl",
+        'complexity': report['faces'],
+        'polygon_count': report['faces'],
+        'mesh_quality': report['mesh_quality'],
+        'geometry_score': report['geometry_score'],
+        'printability': 'excellent' if report['watertight'] and report['mesh_quality'] >= 60 else (
+            'good' if report['non_manifold_edges'] == 0 else 'needs repair'
+        ),
+        'optimization_time': report['optimization_time'],
+        'mesh_optimization': (
+            f"Welded {report['welded_vertices']} vertices, removed {report['degenerate_faces_removed']} degenerate faces, "
+            f"decimated {report['input_faces']} → {report['faces']} faces"
+        )
+    })
+    return optimized
 
 async def generate_additional_formats(
-    optimized_result: Dict[str, Any], 
+    model_result: Dict[str, Any], 
     options: EnhancedGenerationOptions
 ) -> Dict[str, str]:
     """Generate additional file formats"""
     logger.info('🔄 Generating additional file formats...')
     
     # In production, this would convert GLB to other formats
-    base_url = optimized_result['model_url']
+    base_url = model_result['model_url']
     
     return {
         'obj_url': base_url.replace('.glb', '.obj'),
-        'thumbnail_url': base_url.replace('.glb', '-thumb.jpg'),
         'wireframe_url': base_url.replace('.glb', '-wireframe.png'),
         'cross_section_url': base_url.replace('.glb', '-section.png')
     }
 
+async def generate_thumbnail(
+    model_result: Dict[str, Any], 
+    options: EnhancedGenerationOptions
+) -> Dict[str, str]:
+    """Generate the model thumbnail"""
+    logger.info('🖼️ Generating model thumbnail...')
+    
+    # In production, this would render the GLB
+    return {'thumbnail_url': model_result['model_url'].replace('.glb', '-thumb.jpg')}
+
+# Enhanced production pipeline: formats and thumbnail only need the generated model (optimization
+# keeps model_url), so they run alongside mesh optimization; both are optional extras
+ENHANCED_PIPELINE = PipelineDAG([
+    Stage('analysis', analyze_pet_image_enhanced, inputs=('image_url', 'breed', 'options'),
+          params={'user_breed': 'breed'}, timeout=ANALYZE_STAGE_TIMEOUT),
+    Stage('model', generate_with_3d_service_enhanced, inputs=('image_url', 'analysis', 'quality_level', 'options'),
+          timeout=MODEL_STAGE_TIMEOUT),
+    Stage('optimized', optimize_model_enhanced, inputs=('model', 'options'),
+          params={'model_result': 'model'}, timeout=OPTIMIZE_STAGE_TIMEOUT),
+    Stage('formats', generate_additional_formats, inputs=('model', 'options'),
+          params={'model_result': 'model'}, timeout=FORMATS_STAGE_TIMEOUT, fallback={}),
+    Stage('thumbnail', generate_thumbnail, inputs=('model', 'options'),
+          params={'model_result': 'model'}, timeout=FORMATS_STAGE_TIMEOUT, fallback={}),
+], initial=('image_url', 'breed', 'quality_level', 'options'))
+
 # Add health router if available
 if PRODUCTION_HARDENING_AVAILABLE and health_router:
     app.include_router(health_router, prefix="/api/v1", tags=["health"])
@@ -1336,10 +1743,12 @@ if __name__ == "__main__":
     # Configuration
     port = int(os.getenv("PORT", 8000))
     host = os.getenv("HOST", "0.0.0.0")
+    workers = int(os.getenv("WEB_CONCURRENCY", 1))
     
     print("🚀 Starting PetPlantr Enhanced API Server...")
     print(f"📍 Server: http://{host}:{port}")
     print(f"📊 Mode: {'Production' if PRODUCTION_MODE else 'Development'}")
+    print(f"👷 Workers: {workers}" + (f" (shared weights: {os.getenv('BREED_SHARED_WEIGHTS')})" if os.getenv('BREED_SHARED_WEIGHTS') else ""))
     print(f"📚 API Docs: http://{host}:{port}/api/docs")
     print(f"🎯 Enhanced 3D Generation: http://{host}:{port}/api/v1/generate-enhanced-3d-simple")
     print(f"🔗 Health Check: http://{host}:{port}/api/v1/health")
@@ -1350,6 +1759,7 @@ if __name__ == "__main__":
         host=host,
         port=port,
         reload=False,
+        workers=workers,
         log_level="info",
         access_log=True
     )
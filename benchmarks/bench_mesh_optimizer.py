@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Mesh Optimizer Benchmark
+Weld, clean and decimate time and output quality for synthetic meshes of increasing size
+
+Usage:
+    python -m benchmarks.bench_mesh_optimizer --sizes 20000 80000 320000 --target 15000
+"""
+
+import argparse
+import time
+from typing import Dict, Tuple
+
+import numpy as np
+
+from src.core.mesh_optimizer import optimize_mesh
+
+
+def noisy_sphere(faces: int, noise: float, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """UV sphere with about ``faces`` triangles, as an unwelded triangle soup (like STL)"""
+    rings = max(4, int(round(np.sqrt(faces / 4))))
+    segments = 2 * rings
+    theta = np.linspace(0.0, np.pi, rings + 1)
+    phi = np.linspace(0.0, 2.0 * np.pi, segments, endpoint=False)
+    t, p = np.meshgrid(theta, phi, indexing='ij')
+    radius = 1.0 + noise * np.random.default_rng(seed).standard_normal(t.shape)
+    radius[0], radius[-1] = radius[0].mean(), radius[-1].mean()  # Keep the poles single points
+    grid = np.stack([radius * np.sin(t) * np.cos(p), radius * np.sin(t) * np.sin(p), radius * np.cos(t)], axis=-1)
+    grid = grid.reshape(-1, 3)
+
+    i, j = np.meshgrid(np.arange(rings), np.arange(segments), indexing='ij')
+    a = i * segments + j
+    b = i * segments + (j + 1) % segments
+    c = a + segments
+    d = b + segments
+    indexed = np.concatenate([np.stack([a, c, b], -1).reshape(-1, 3), np.stack([b, c, d], -1).reshape(-1, 3)])
+    return grid[indexed].reshape(-1, 3), np.arange(3 * len(indexed)).reshape(-1, 3)
+
+
+def run(size: int, target: int, level: str, noise: float) -> Dict[str, float]:
+    vertices, faces = noisy_sphere(size, noise)
+    start = time.perf_counter()
+    out_vertices, out_faces, report = optimize_mesh(vertices, faces, target, level)
+    elapsed = time.perf_counter() - start
+
+    radius_error = np.abs(np.linalg.norm(out_vertices, axis=1) - 1.0)
+    return {
+        'input_faces': len(faces),
+        'output_faces': report['faces'],
+        'weld_s': report['timings']['weld'],
+        'clean_s': report['timings']['clean'],
+        'decimate_s': report['timings']['decimate'],
+        'total_s': elapsed,
+        'passes': report['decimation_passes'],
+        'quality': report['mesh_quality'],
+        'watertight': report['watertight'],
+        'max_error': float(radius_error.max()),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[20000, 80000, 320000])
+    parser.add_argument('--target', type=int, default=15000)
+    parser.add_argument('--level', default='standard')
+    parser.add_argument('--noise', type=float, default=0.002)
+    args = parser.parse_args()
+
+    print(f"Target {args.target} faces, optimization_level={args.level}, surface noise {args.noise}")
+    print(f"{'faces in':>9} {'faces out':>9} {'weld s':>7} {'clean s':>7} {'decim s':>7} {'total s':>7} "
+          f"{'passes':>6} {'quality':>7} {'closed':>6} {'max err':>8}")
+    for size in args.sizes:
+        r = run(size, args.target, args.level, args.noise)
+        print(f"{r['input_faces']:>9} {r['output_faces']:>9} {r['weld_s']:>7.3f} {r['clean_s']:>7.3f} "
+              f"{r['decimate_s']:>7.3f} {r['total_s']:>7.3f} {r['passes']:>6} {r['quality']:>7.1f} "
+              f"{str(r['watertight']):>6} {r['max_error']:>8.4f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Replicate Completion Benchmark
+Fixed 2-second polling vs the shared adaptive poller (and webhooks) against a local fake Replicate server
+
+Usage:
+    python -m benchmarks.bench_replicate_polling --jobs 20 --latency 2.1
+"""
+
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from typing import Dict, List
+
+import aiohttp
+from aiohttp import web
+
+from src.services.replicate_poller import ReplicatePoller
+
+
+class FakeReplicate:
+    """Minimal /v1/predictions API whose jobs finish after a fixed latency"""
+
+    def __init__(self, latency: float, jitter: float, webhook_url: str = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.webhook_url = webhook_url
+        self.finish_at: Dict[str, float] = {}
+        self.status_requests = 0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/v1/predictions', self.create)
+        app.router.add_get('/v1/predictions/{id}', self.get)
+        return app
+
+    def _payload(self, prediction_id: str) -> Dict:
+        done = time.monotonic() >= self.finish_at[prediction_id]
+        return {
+            'id': prediction_id,
+            'status': 'succeeded' if done else 'processing',
+            'output': ['https://example.invalid/out.png'] if done else None,
+        }
+
+    async def create(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        prediction_id = uuid.uuid4().hex
+        latency = self.latency + random.uniform(-self.jitter, self.jitter)
+        self.finish_at[prediction_id] = time.monotonic() + latency
+        if body.get('webhook'):
+            asyncio.get_running_loop().call_later(
+                latency, lambda: asyncio.ensure_future(self._deliver(body['webhook'], prediction_id))
+            )
+        return web.json_response(self._payload(prediction_id), status=201)
+
+    async def get(self, request: web.Request) -> web.Response:
+        self.status_requests += 1
+        return web.json_response(self._payload(request.match_info['id']))
+
+    async def _deliver(self, url: str, prediction_id: str) -> None:
+        async with aiohttp.ClientSession() as session:
+            await session.post(url, json=self._payload(prediction_id))
+
+
+async def create_prediction(session: aiohttp.ClientSession, base: str, webhook: Dict) -> str:
+    async with session.post(f'{base}/predictions', json={'version': 'fake/model', 'input': {}, **webhook}) as response:
+        return (await response.json())['id']
+
+
+async def fixed_poll(session: aiohttp.ClientSession, base: str, prediction_id: str) -> None:
+    """The original poll_replicate_job loop"""
+    while True:
+        async with session.get(f'{base}/predictions/{prediction_id}') as response:
+            if (await response.json())['status'] == 'succeeded':
+                return
+        await asyncio.sleep(2)
+
+
+async def run(mode: str, args: argparse.Namespace) -> Dict[str, float]:
+    webhook_url = f'http://127.0.0.1:{args.port + 1}/webhook' if mode == 'webhook' else None
+    fake = FakeReplicate(args.latency, args.jitter, webhook_url)
+    base = f'http://127.0.0.1:{args.port}/v1'
+    runners = [web.AppRunner(fake.app())]
+    await runners[0].setup()
+    await web.TCPSite(runners[0], '127.0.0.1', args.port).start()
+
+    session = aiohttp.ClientSession()
+    poller = ReplicatePoller(lambda: session, api_base=base, api_token='fake', webhook_url=webhook_url)
+    if webhook_url:
+        async def receive(request: web.Request) -> web.Response:
+            poller.resolve(await request.json())
+            return web.json_response({'received': True})
+
+        hook_app = web.Application()
+        hook_app.router.add_post('/webhook', receive)
+        runners.append(web.AppRunner(hook_app))
+        await runners[1].setup()
+        await web.TCPSite(runners[1], '127.0.0.1', args.port + 1).start()
+
+    # Warm the latency model the way production traffic would
+    for _ in range(args.warmup if mode != 'fixed' else 0):
+        await poller.wait(await create_prediction(session, base, poller.webhook_fields()), 'fake/model')
+    fake.status_requests = 0
+
+    async def one() -> float:
+        started = time.monotonic()
+        prediction_id = await create_prediction(session, base, poller.webhook_fields())
+        if mode == 'fixed':
+            await fixed_poll(session, base, prediction_id)
+        else:
+            await poller.wait(prediction_id, 'fake/model')
+        return time.monotonic() - started
+
+    latencies: List[float] = await asyncio.gather(*(one() for _ in range(args.jobs)))
+
+    await poller.stop()
+    await session.close()
+    for runner in runners:
+        await runner.cleanup()
+
+    latencies.sort()
+    return {
+        'mean': sum(latencies) / len(latencies),
+        'p90': latencies[int(0.9 * (len(latencies) - 1))],
+        'requests_per_job': fake.status_requests / args.jobs,
+    }
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    print(f"Fake job latency {args.latency:.2f}s ± {args.jitter:.2f}s, {args.jobs} concurrent jobs")
+    print(f"{'mode':<9} {'mean s':>8} {'p90 s':>8} {'GETs/job':>9}")
+    for mode in ('fixed', 'adaptive', 'webhook'):
+        stats = await run(mode, args)
+        print(f"{mode:<9} {stats['mean']:>8.2f} {stats['p90']:>8.2f} {stats['requests_per_job']:>9.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=2.1)
+    parser.add_argument('--jitter', type=float, default=0.3)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--port', type=int, default=8765)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Shared-Weights Scaling Benchmark
+Throughput and memory of 1..N model worker processes, private vs memory-mapped weights
+
+Usage:
+    python -m benchmarks.bench_shared_weights --max-workers 4 --duration 5
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+import torch
+
+from src.core.shared_weights import attach_shared_weights, process_memory, save_safetensors
+
+
+def build_model(hidden: int, layers: int) -> torch.nn.Module:
+    """Synthetic stand-in for the CLIP vision tower + LoRA head"""
+    blocks: List[torch.nn.Module] = []
+    for _ in range(layers):
+        blocks += [torch.nn.Linear(hidden, hidden), torch.nn.GELU()]
+    return torch.nn.Sequential(*blocks).eval()
+
+
+def worker(mode: str, checkpoint: str, hidden: int, layers: int, batch_size: int,
+           duration: float, start_at: float, results: "mp.Queue") -> None:
+    """One serving process: load weights, run forward passes, report throughput and RSS"""
+    torch.set_num_threads(1)
+    model = build_model(hidden, layers)
+    if mode == 'shared':
+        attach_shared_weights(model, checkpoint)
+    else:
+        model.load_state_dict(torch.load(checkpoint.replace('.safetensors', '.pt')))
+
+    inputs = torch.randn(batch_size, hidden)
+    while time.time() < start_at:
+        time.sleep(0.01)
+
+    images = 0
+    with torch.inference_mode():
+        end = time.time() + duration
+        while time.time() < end:
+            model(inputs)
+            images += batch_size
+
+    results.put({'images_per_s': images / duration, **process_memory()})
+
+
+def run(mode: str, workers: int, args: argparse.Namespace, checkpoint: str) -> Dict[str, float]:
+    ctx = mp.get_context('spawn')
+    results = ctx.Queue()
+    start_at = time.time() + 3.0  # Let every process finish loading first
+    procs = [
+        ctx.Process(target=worker, args=(mode, checkpoint, args.hidden, args.layers,
+                                         args.batch_size, args.duration, start_at, results))
+        for _ in range(workers)
+    ]
+    for proc in procs:
+        proc.start()
+    reports = [results.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+
+    return {
+        'throughput': sum(r['images_per_s'] for r in reports),
+        'private_mb': sum(r.get('RssAnon', 0) for r in reports) / 1e6,
+        'shared_mb': max(r.get('RssFile', 0) for r in reports) / 1e6,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--hidden', type=int, default=2048)
+    parser.add_argument('--layers', type=int, default=8)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint = os.path.join(tmp, 'weights.safetensors')
+        state_dict = build_model(args.hidden, args.layers).state_dict()
+        save_safetensors(state_dict, checkpoint)
+        torch.save(state_dict, checkpoint.replace('.safetensors', '.pt'))
+        weights_mb = os.path.getsize(checkpoint) / 1e6
+
+        print(f"Model weights: {weights_mb:.1f} MB")
+        print(f"{'mode':<8} {'workers':>7} {'img/s':>10} {'speedup':>8} {'private MB':>11} {'shared MB':>10}")
+        for mode in ('private', 'shared'):
+            baseline = None
+            for workers in range(1, args.max_workers + 1):
+                stats = run(mode, workers, args, checkpoint)
+                baseline = baseline or stats['throughput']
+                print(f"{mode:<8} {workers:>7} {stats['throughput']:>10.1f} "
+                      f"{stats['throughput'] / baseline:>7.2f}x {stats['private_mb']:>11.1f} "
+                      f"{stats['shared_mb']:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -7,10 +7,12 @@ from fastapi import APIRouter, HTTPException, File, UploadFile, BackgroundTasks
 from fastapi.responses import JSONResponse
 import torch
 from PIL import Image
-import io
+import os
 import base64
+import asyncio
 import numpy as np
-from typing import Dict, List, Optional, Any
+import httpx
+from typing import Dict, List, Optional, Any, Tuple, Union
 import logging
 import time
 from pydantic import BaseModel
@@ -18,22 +20,58 @@ from pydantic import field_validator, model_validator
 
 from src.ai.models.clip_breed import CLIPBreedDetector
 from ...core.inference import BreedInferenceEngine
+from ...core.batching import MicroBatcher
+from ...core.prediction_cache import PredictionCache, create_prediction_cache, image_digest
+from ...core import embedding_index as embedding_index_config
+from ...core.embedding_index import EmbeddingIndex
+from ...core.decode_pool import DecodePool, DecodePoolSaturated, ImageTooLarge
+from ...core.inference_executor import InferenceExecutor, InferenceOverloaded
+from ...core.metrics import timed
+from ...core.shared_weights import SHARED_WEIGHTS_PATH, ensure_shared_weights, process_memory
+from ...services.upload_ingest import UploadTooLarge, ingest_upload
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
+# Maximum number of images accepted by /batch-detect
+MAX_BATCH_IMAGES = int(os.getenv('BREED_MAX_BATCH_IMAGES', '10'))
+
+# Image download limits for image_url requests
+MAX_IMAGE_BYTES = int(os.getenv('BREED_MAX_IMAGE_BYTES', str(10 * 1024 * 1024)))
+FETCH_CONNECT_TIMEOUT = float(os.getenv('BREED_FETCH_CONNECT_TIMEOUT', '3'))
+FETCH_READ_TIMEOUT = float(os.getenv('BREED_FETCH_READ_TIMEOUT', '10'))
+FETCH_MAX_CONNECTIONS = int(os.getenv('BREED_FETCH_MAX_CONNECTIONS', '100'))
+
 # Create router
 router = APIRouter(prefix="/breed", tags=["breed-detection"])
 
 # Global inference engine (loaded once)
 inference_engine: Optional[BreedInferenceEngine] = None
 
+# Dedicated model workers and the micro-batching scheduler in front of them
+inference_executor: Optional[InferenceExecutor] = None
+batcher: Optional[MicroBatcher] = None
+
+# Content-addressed prediction cache (None when disabled)
+prediction_cache: Optional[PredictionCache] = None
+
+# Embedding index of previously classified images (created on first use)
+embedding_index: Optional[EmbeddingIndex] = None
+_embedding_index_lock = asyncio.Lock()
+
+# Worker pool for CPU-bound image decoding
+decode_pool: Optional[DecodePool] = None
+
+# Shared keep-alive client for image_url downloads
+http_client: Optional[httpx.AsyncClient] = None
+
 
 class BreedDetectionRequest(BaseModel):
     """Request model for breed detection"""
     image_url: Optional[str] = None
     image_base64: Optional[str] = None
     use_tta: bool = True
+    adaptive_tta: bool = False  # Extra TTA views only below confidence_threshold
     confidence_threshold: float = 0.8
     return_top_k: int = 5
 
@@ -59,6 +97,19 @@ class BreedDetectionRequest(BaseModel):
         return self
 
 
+class SimilarImagesRequest(BaseModel):
+    """Request model for nearest-neighbour image lookup"""
+    image_url: Optional[str] = None
+    image_base64: Optional[str] = None
+    top_k: int = 5
+
+    @model_validator(mode="after")
+    def check_any_source(self):
+        if not self.image_url and not self.image_base64:
+            raise ValueError("Either image_url or image_base64 must be provided")
+        return self
+
+
 class BreedDetectionResponse(BaseModel):
     model_config = {"protected_namespaces": ()}
     """Response model for breed detection"""
@@ -74,7 +125,10 @@ class BreedDetectionResponse(BaseModel):
 @router.on_event("startup")
 async def load_breed_model():
     """Load breed detection model on startup"""
-    global inference_engine
+    global inference_engine, inference_executor, batcher, prediction_cache, decode_pool, http_client
+    
+    decode_pool = DecodePool()
+    http_client = _create_http_client()
     
     try:
         logger.info("Loading CLIP+LoRA breed detection model...")
@@ -82,11 +136,40 @@ async def load_breed_model():
         await inference_engine.load_model()
         logger.info("Breed detection model loaded successfully")
         
+        # Serve weights from one checkpoint mapped by every worker process
+        if SHARED_WEIGHTS_PATH and isinstance(getattr(inference_engine, 'model', None), torch.nn.Module):
+            mapped_bytes = await asyncio.to_thread(
+                ensure_shared_weights, inference_engine.model, SHARED_WEIGHTS_PATH
+            )
+            if mapped_bytes:
+                logger.info(f"Mapped {mapped_bytes / 1e6:.1f} MB of shared weights from {SHARED_WEIGHTS_PATH}")
+        
+        inference_executor = InferenceExecutor()
+        batcher = MicroBatcher(inference_engine, executor=inference_executor)
+        await batcher.start()
+        
+        prediction_cache = create_prediction_cache()
+        
     except Exception as e:
         logger.error(f"Failed to load breed detection model: {e}")
         raise e
 
 
+@router.on_event("shutdown")
+async def stop_breed_batcher():
+    """Flush and stop the batching scheduler on shutdown"""
+    if batcher is not None:
+        await batcher.stop()
+    if inference_executor is not None:
+        inference_executor.shutdown()
+    if prediction_cache is not None:
+        await prediction_cache.close()
+    if decode_pool is not None:
+        decode_pool.shutdown()
+    if http_client is not None:
+        await http_client.aclose()
+
+
 @router.get("/health")
 async def health_check():
     """Health check for breed detection service"""
@@ -112,15 +195,16 @@ async def detect_breed(request: BreedDetectionRequest):
         raise HTTPException(status_code=503, detail="Model not loaded")
     
     try:
-        # Load image
-        image = await _load_image(request.image_url, request.image_base64)
+        # Load image bytes
+        image_data = await _fetch_image_bytes(request.image_url, request.image_base64)
         
-        # Run inference
-        results = await inference_engine.predict(
-            image=image,
+        # Run inference (or reuse a cached prediction for identical content)
+        results, image_size, cache_hit = await _predict_cached(
+            image_data,
             use_tta=request.use_tta,
             confidence_threshold=request.confidence_threshold,
-            top_k=request.return_top_k
+            top_k=request.return_top_k,
+            adaptive_tta=request.adaptive_tta
         )
         
         processing_time = time.time() - start_time
@@ -134,8 +218,11 @@ async def detect_breed(request: BreedDetectionRequest):
             is_high_confidence=results['is_high_confidence'],
             model_version=results['model_version'],
             metadata={
-                'used_tta': request.use_tta,
-                'image_size': image.size,
+                'used_tta': results.get('used_tta', request.use_tta),
+                'adaptive_tta': request.adaptive_tta,
+                'image_size': image_size,
+                'cache_hit': cache_hit,
+                'near_duplicate_of': results.get('near_duplicate_of'),
                 'processing_time_ms': processing_time * 1000,
                 'gpu_used': torch.cuda.is_available()
             }
@@ -146,6 +233,8 @@ async def detect_breed(request: BreedDetectionRequest):
         
         return response
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Breed detection failed: {e}")
         raise HTTPException(status_code=500, detail=f"Detection failed: {str(e)}")
@@ -156,7 +245,8 @@ async def detect_breed_from_file(
     file: UploadFile = File(...),
     use_tta: bool = True,
     confidence_threshold: float = 0.8,
-    top_k: int = 5
+    top_k: int = 5,
+    adaptive_tta: bool = False
 ):
     """
     Detect breed from uploaded file
@@ -170,21 +260,22 @@ async def detect_breed_from_file(
     if not file.content_type or not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="File must be an image")
     
+    upload = None
     try:
-        # Read and process image
-        image_data = await file.read()
-        image = Image.open(io.BytesIO(image_data))
-        
-        # Convert to RGB if needed
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
+        # Stream the upload (hashed on the way in, spooled to disk if large)
+        try:
+            upload = await ingest_upload(file, MAX_IMAGE_BYTES)
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
         
-        # Run inference
-        results = await inference_engine.predict(
-            image=image,
+        # Run inference (or reuse a cached prediction for identical content)
+        results, image_size, cache_hit = await _predict_cached(
+            upload.source,
             use_tta=use_tta,
             confidence_threshold=confidence_threshold,
-            top_k=top_k
+            top_k=top_k,
+            adaptive_tta=adaptive_tta,
+            digest=upload.sha256
         )
         
         processing_time = time.time() - start_time
@@ -192,17 +283,24 @@ async def detect_breed_from_file(
         # Add metadata
         results['metadata'] = {
             'filename': file.filename,
-            'file_size': len(image_data),
-            'image_size': image.size,
+            'file_size': upload.size,
+            'image_size': image_size,
+            'cache_hit': cache_hit,
             'processing_time_ms': processing_time * 1000,
-            'used_tta': use_tta
+            'used_tta': results.get('used_tta', use_tta),
+            'adaptive_tta': adaptive_tta
         }
         
         return JSONResponse(results)
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"File-based breed detection failed: {e}")
         raise HTTPException(status_code=500, detail=f"Detection failed: {str(e)}")
+    finally:
+        if upload is not None:
+            upload.discard()
 
 
 @router.post("/batch-detect")
@@ -216,41 +314,100 @@ async def batch_detect_breeds(
     if inference_engine is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
-    if len(requests) > 10:  # Limit batch size
-        raise HTTPException(status_code=400, detail="Batch size limited to 10 images")
+    if len(requests) > MAX_BATCH_IMAGES:  # Limit batch size
+        raise HTTPException(status_code=400, detail=f"Batch size limited to {MAX_BATCH_IMAGES} images")
     
     try:
-        results = []
-        for i, request in enumerate(requests):
+        results: List[Optional[Dict[str, Any]]] = [None] * len(requests)
+        
+        # Fetch every image concurrently
+        payloads = await asyncio.gather(
+            *[_fetch_image_bytes(request.image_url, request.image_base64) for request in requests],
+            return_exceptions=True
+        )
+        
+        # Serve cached predictions, decode the rest and group them by inference
+        # options so each group is one forward pass
+        cache_keys: Dict[int, str] = {}
+        pending: List[int] = []
+        for i, (request, image_data) in enumerate(zip(requests, payloads)):
+            if isinstance(image_data, BaseException):
+                results[i] = _batch_error(i, image_data)
+                continue
+            
+            if prediction_cache is not None:
+                cache_keys[i] = _cache_key(image_digest(image_data), request.use_tta, request.confidence_threshold,
+                                           request.return_top_k, request.adaptive_tta)
+                cached = await prediction_cache.get(cache_keys[i])
+                if cached is not None:
+                    results[i] = {**cached['result'], 'batch_index': i}
+                    continue
+            
+            pending.append(i)
+        
+        decoded = await asyncio.gather(
+            *[_decode_image(payloads[i]) for i in pending],
+            return_exceptions=True
+        )
+        
+        images: Dict[int, Image.Image] = {}
+        groups: Dict[tuple, List[int]] = {}
+        for i, image in zip(pending, decoded):
+            if isinstance(image, HTTPException) and image.status_code == 503:
+                raise image  # Decode pool saturated, shed the whole batch
+            if isinstance(image, BaseException):
+                results[i] = _batch_error(i, image)
+                continue
+            
+            request = requests[i]
+            images[i] = image
+            key = (request.use_tta, request.adaptive_tta,
+                   request.confidence_threshold, request.return_top_k)
+            groups.setdefault(key, []).append(i)
+        
+        for (use_tta, adaptive_tta, confidence_threshold, top_k), indices in groups.items():
             try:
-                image = await _load_image(request.image_url, request.image_base64)
-                
-                result = await inference_engine.predict(
-                    image=image,
-                    use_tta=request.use_tta,
-                    confidence_threshold=request.confidence_threshold,
-                    top_k=request.return_top_k
-                )
-                
-                result['batch_index'] = i
-                results.append(result)
-                
+                with timed('breed_inference_batch'):
+                    group_results = await batcher.predict_many(
+                        images=[images[i] for i in indices],
+                        use_tta=use_tta,
+                        confidence_threshold=confidence_threshold,
+                        top_k=top_k,
+                        adaptive_tta=adaptive_tta
+                    )
+            except InferenceOverloaded as e:
+                raise _busy_error(e)
             except Exception as e:
-                logger.error(f"Batch detection failed for image {i}: {e}")
-                results.append({
-                    'batch_index': i,
-                    'error': str(e),
-                    'predicted_breed': None,
-                    'confidence': 0.0
-                })
+                for i in indices:
+                    results[i] = _batch_error(i, e)
+                continue
+            
+            for i, result in zip(indices, group_results):
+                if i in cache_keys:
+                    await prediction_cache.set(cache_keys[i], {'result': result, 'image_size': _image_size(images[i])})
+                result['batch_index'] = i
+                results[i] = result
         
         return {'results': results, 'total_processed': len(results)}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Batch breed detection failed: {e}")
         raise HTTPException(status_code=500, detail=f"Batch detection failed: {str(e)}")
 
 
+def _batch_error(index: int, error: BaseException) -> Dict[str, Any]:
+    """Per-index error entry for batch detection responses"""
+    logger.error(f"Batch detection failed for image {index}: {error}")
+    return {
+        'batch_index': index,
+        'error': str(error),
+        'predicted_breed': None,
+        'confidence': 0.0
+    }
+
+
 @router.get("/breeds")
 async def get_supported_breeds():
     """Get list of supported dog breeds"""
@@ -273,6 +430,45 @@ async def get_model_info():
     return inference_engine.get_model_info()
 
 
+@router.post("/similar")
+async def find_similar_images(request: SimilarImagesRequest):
+    """
+    Find the closest previously classified images by CLIP embedding
+    """
+    if inference_engine is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    
+    if not _embedding_search_available():
+        raise HTTPException(status_code=501, detail="Embedding index not enabled")
+    
+    image = await _load_image(request.image_url, request.image_base64)
+    
+    try:
+        embedding = await batcher.embed(image)
+        index = await _get_embedding_index(embedding.shape[-1])
+        matches = await asyncio.to_thread(index.search, embedding, request.top_k)
+    except InferenceOverloaded as e:
+        raise _busy_error(e)
+    except Exception as e:
+        logger.error(f"Similar image lookup failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Similarity search failed: {str(e)}")
+    
+    return {
+        'matches': [
+            {
+                'id': record['id'],
+                'similarity': similarity,
+                'predicted_breed': record.get('predicted_breed'),
+                'confidence': record.get('confidence'),
+                'image_digest': record.get('image_digest'),
+                'created_at': record.get('created_at')
+            }
+            for similarity, record in matches
+        ],
+        'total_indexed': len(index)
+    }
+
+
 @router.post("/calibrate")
 async def calibrate_confidence(
     calibration_data: List[Dict[str, Any]],
@@ -285,10 +481,7 @@ async def calibrate_confidence(
         raise HTTPException(status_code=503, detail="Model not loaded")
     
     # Add calibration task to background
-    background_tasks.add_task(
-        inference_engine.update_calibration,
-        calibration_data
-    )
+    background_tasks.add_task(_recalibrate, calibration_data)
     
     return {
         'status': 'calibration_started',
@@ -296,42 +489,232 @@ async def calibrate_confidence(
     }
 
 
-async def _load_image(image_url: Optional[str] = None, 
-                     image_base64: Optional[str] = None) -> Image.Image:
-    """Load image from URL or base64 data"""
+async def _recalibrate(calibration_data: List[Dict[str, Any]]):
+    """Update calibration and drop predictions scored with the old calibration"""
+    result = inference_engine.update_calibration(calibration_data)
+    if asyncio.iscoroutine(result):
+        await result
+    if prediction_cache is not None:
+        await prediction_cache.clear()
+
+
+async def _fetch_image_bytes(image_url: Optional[str] = None,
+                             image_base64: Optional[str] = None) -> bytes:
+    """Fetch raw (still encoded) image bytes from URL or base64 data"""
     
     if image_base64:
+        if len(image_base64) * 3 // 4 > MAX_IMAGE_BYTES:
+            raise HTTPException(status_code=400, detail=f"Image too large (max {MAX_IMAGE_BYTES} bytes)")
         try:
-            # Handle base64 data URLs
-            if image_base64.startswith('data:image'):
-                image_base64 = image_base64.split(',')[1]
-            
-            image_data = base64.b64decode(image_base64)
-            image = Image.open(io.BytesIO(image_data))
+            return await decode_pool.decode_base64(image_base64)
+        except DecodePoolSaturated as e:
+            raise _busy_error(e)
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Invalid base64 image: {e}")
             
     elif image_url:
         try:
-            import httpx
-            async with httpx.AsyncClient() as client:
-                response = await client.get(image_url)
-                response.raise_for_status()
-                image = Image.open(io.BytesIO(response.content))
+            return await _download_image(image_url)
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Failed to load image from URL: {e}")
     else:
         raise HTTPException(status_code=400, detail="Either image_url or image_base64 must be provided")
+
+
+def _create_http_client() -> httpx.AsyncClient:
+    """Pooled keep-alive client with explicit timeouts (HTTP/2 when h2 is installed)"""
+    try:
+        import h2  # noqa: F401
+        http2 = True
+    except ImportError:
+        http2 = False
+        logger.info("h2 not installed, image downloads will use HTTP/1.1")
+    
+    return httpx.AsyncClient(
+        http2=http2,
+        follow_redirects=True,
+        limits=httpx.Limits(
+            max_connections=FETCH_MAX_CONNECTIONS,
+            max_keepalive_connections=FETCH_MAX_CONNECTIONS // 4,
+            keepalive_expiry=30.0
+        ),
+        timeout=httpx.Timeout(
+            connect=FETCH_CONNECT_TIMEOUT,
+            read=FETCH_READ_TIMEOUT,
+            write=FETCH_READ_TIMEOUT,
+            pool=FETCH_CONNECT_TIMEOUT
+        )
+    )
+
+
+@timed('image_download')
+async def _download_image(image_url: str) -> bytes:
+    """Stream an image download, aborting as soon as it exceeds the size cap"""
+    too_large = HTTPException(status_code=400, detail=f"Image too large (max {MAX_IMAGE_BYTES} bytes)")
+    
+    async with http_client.stream('GET', image_url) as response:
+        response.raise_for_status()
+        
+        content_length = response.headers.get('content-length')
+        if content_length and content_length.isdigit() and int(content_length) > MAX_IMAGE_BYTES:
+            raise too_large
+        
+        buffer = bytearray()
+        async for chunk in response.aiter_bytes():
+            buffer += chunk
+            if len(buffer) > MAX_IMAGE_BYTES:
+                raise too_large
+        return bytes(buffer)
+
+
+@timed('image_decode')
+async def _decode_image(image_data: Union[bytes, str]) -> Image.Image:
+    """Decode image bytes (or a spooled upload path) into a validated RGB PIL image on the decode pool"""
+    try:
+        return await decode_pool.decode(image_data)
+    except DecodePoolSaturated as e:
+        raise _busy_error(e)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image data: {e}")
+
+
+def _image_size(image: Image.Image) -> Tuple[int, int]:
+    """Size of the image as uploaded (decoding may have downscaled it)"""
+    return image.info.get('original_size', image.size)
+
+
+def _busy_error(error: Union[DecodePoolSaturated, InferenceOverloaded]) -> HTTPException:
+    """503 response asking the client to back off"""
+    return HTTPException(
+        status_code=503,
+        detail=f"{error}, please retry",
+        headers={'Retry-After': str(error.retry_after)}
+    )
+
+
+async def _load_image(image_url: Optional[str] = None, 
+                     image_base64: Optional[str] = None) -> Image.Image:
+    """Load image from URL or base64 data"""
+    return await _decode_image(await _fetch_image_bytes(image_url, image_base64))
+
+
+def _cache_key(digest: str, use_tta: bool, confidence_threshold: float,
+               top_k: int, adaptive_tta: bool) -> str:
+    """Prediction cache key for an image digest and inference options"""
+    return PredictionCache.make_key(
+        digest,
+        use_tta=use_tta,
+        top_k=top_k,
+        model_version=inference_engine.get_model_info()['model_version'],
+        confidence_threshold=confidence_threshold,
+        adaptive_tta=adaptive_tta
+    )
+
+
+async def _predict_cached(image_data: Union[bytes, str],
+                          use_tta: bool,
+                          confidence_threshold: float,
+                          top_k: int,
+                          adaptive_tta: bool = False,
+                          digest: Optional[str] = None) -> Tuple[Dict[str, Any], Tuple[int, int], bool]:
+    """
+    Predict through the batcher, short-circuiting on identical content
+
+    ``image_data`` may be a file path when ``digest`` is given (spooled uploads).
+    """
+    digest = digest or image_digest(image_data)
+    key = None
+    if prediction_cache is not None:
+        key = _cache_key(digest, use_tta, confidence_threshold, top_k, adaptive_tta)
+        cached = await prediction_cache.get(key)
+        if cached is not None:
+            return cached['result'], tuple(cached['image_size']), True
     
-    # Convert to RGB if needed
-    if image.mode != 'RGB':
-        image = image.convert('RGB')
+    image = await _decode_image(image_data)
     
-    # Validate image size
-    if image.size[0] * image.size[1] > 5000 * 5000:
-        raise HTTPException(status_code=400, detail="Image too large (max 5000x5000)")
+    try:
+        # Answer near-duplicates of already classified images from the index
+        embedding = None
+        if _embedding_search_available():
+            with timed('breed_embedding'):
+                embedding = await batcher.embed(image)
+            results = await _near_duplicate_result(embedding, confidence_threshold, top_k)
+            if results is not None:
+                return results, _image_size(image), False
+        
+        # The embedding is handed back so the single-view pass only runs the LoRA head
+        with timed('breed_inference'):
+            results = await batcher.predict(
+                image=image,
+                use_tta=use_tta,
+                confidence_threshold=confidence_threshold,
+                top_k=top_k,
+                adaptive_tta=adaptive_tta,
+                embedding=embedding
+            )
+    except InferenceOverloaded as e:
+        raise _busy_error(e)
+    
+    if embedding is not None:
+        index = await _get_embedding_index(embedding.shape[-1])
+        await asyncio.to_thread(index.add, embedding, {
+            'image_digest': digest,
+            'model_version': results.get('model_version'),
+            'predicted_breed': results.get('predicted_breed'),
+            'confidence': results.get('confidence'),
+            'top_predictions': results.get('top_predictions', [])
+        })
+    
+    if key is not None:
+        await prediction_cache.set(key, {'result': results, 'image_size': _image_size(image)})
+    
+    return results, _image_size(image), False
+
+
+def _embedding_search_available() -> bool:
+    """Whether the index is configured and the engine can embed images"""
+    return (embedding_index_config.INDEX_DIR is not None
+            and hasattr(inference_engine, 'encode_images'))
+
+
+async def _get_embedding_index(dim: int) -> EmbeddingIndex:
+    """Open the embedding index lazily once the embedding size is known"""
+    global embedding_index
+    async with _embedding_index_lock:
+        if embedding_index is None:
+            # Replays the record log from disk
+            embedding_index = await asyncio.to_thread(EmbeddingIndex, embedding_index_config.INDEX_DIR, dim)
+    return embedding_index
+
+
+async def _near_duplicate_result(embedding: np.ndarray,
+                                 confidence_threshold: float,
+                                 top_k: int) -> Optional[Dict[str, Any]]:
+    """Reuse the prediction of a near-identical, already classified image"""
+    index = await _get_embedding_index(embedding.shape[-1])
+    match = await asyncio.to_thread(index.nearest, embedding)
+    if match is None:
+        return None
     
-    return image
+    similarity, record = match
+    model_version = inference_engine.get_model_info()['model_version']
+    if similarity < embedding_index_config.NEAR_DUPLICATE_THRESHOLD or record.get('model_version') != model_version:
+        return None
+    
+    return {
+        'predicted_breed': record['predicted_breed'],
+        'confidence': record['confidence'],
+        'top_predictions': record['top_predictions'][:top_k],
+        'is_high_confidence': record['confidence'] >= confidence_threshold,
+        'model_version': model_version,
+        'used_tta': False,
+        'near_duplicate_of': record['id'],
+        'similarity': similarity
+    }
 
 
 # Performance monitoring
@@ -341,4 +724,14 @@ async def get_performance_metrics():
     if inference_engine is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
-    return inference_engine.get_performance_metrics()
+    metrics = inference_engine.get_performance_metrics()
+    if batcher is not None:
+        metrics['batching'] = batcher.get_metrics()
+    if prediction_cache is not None:
+        metrics['prediction_cache'] = prediction_cache.get_metrics()
+    if embedding_index is not None:
+        metrics['embedding_index'] = embedding_index.get_metrics()
+    if decode_pool is not None:
+        metrics['decode_pool'] = decode_pool.get_metrics()
+    metrics['process_memory'] = {'pid': os.getpid(), **process_memory()}
+    return metrics
@@ -0,0 +1,434 @@
+"""
+Dynamic Micro-Batching Scheduler
+Collects concurrent breed predictions into a single batched forward pass
+"""
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .stats import Histogram, LATENCY_BUCKETS_MS
+from .inference_executor import (
+    InferenceExecutor, InferenceOverloaded, INFERENCE_DEADLINE_MS, INFERENCE_MAX_QUEUE
+)
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Scheduler configuration
+DEFAULT_MAX_BATCH_SIZE = int(os.getenv('BREED_BATCH_MAX_SIZE', '16'))
+DEFAULT_MAX_WAIT_MS = float(os.getenv('BREED_BATCH_MAX_WAIT_MS', '5'))
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+# TTA modes understood by the scheduler
+TTA_OFF = 'off'
+TTA_FULL = 'full'
+TTA_ADAPTIVE = 'adaptive'
+
+# Queued vision-tower-only requests (no classification)
+EMBED = 'embed'
+
+# Requests are only batched together when they share inference options
+BatchKey = Tuple[str, float, int]
+
+
+def tta_mode(use_tta: bool, adaptive_tta: bool = False) -> str:
+    """Resolve request flags into a TTA mode"""
+    if not use_tta:
+        return TTA_OFF
+    return TTA_ADAPTIVE if adaptive_tta else TTA_FULL
+
+
+@dataclass
+class _PendingPrediction:
+    """A single queued prediction awaiting its slot in a batch"""
+    image: Image.Image
+    key: BatchKey
+    future: asyncio.Future
+    deadline: float
+    embedding: Optional[np.ndarray] = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class MicroBatcher:
+    """
+    Dynamic batching front-end for BreedInferenceEngine
+
+    Requests are queued and flushed as soon as either ``max_batch_size``
+    requests are waiting or the oldest request has waited ``max_wait_ms``.
+    While a forward pass is running new requests keep accumulating, so the
+    batch size grows naturally with load. The engine is expected to expose
+    ``predict_batch(images, use_tta, confidence_threshold, top_k)``; engines
+    without it are driven one image at a time through ``predict``.
+
+    Engines that split the model into ``encode_images(images)`` (vision
+    tower) and ``classify_embeddings(embeddings, confidence_threshold,
+    top_k)`` (LoRA head) can be asked for embeddings through ``embed``,
+    which is batched and admitted like any prediction. Passing such an
+    embedding back to ``predict`` makes the single-view pass run only the
+    head, so the vision tower runs once per image for both the embedding
+    and the prediction (full TTA still encodes its own views).
+
+    In adaptive TTA mode the batch is first scored with a single view and
+    only the images whose confidence falls below ``confidence_threshold``
+    are re-scored with the full set of TTA views. ``predict_batch`` returns
+    formatted predictions rather than logits, so the re-scoring pass runs
+    the identity view again.
+
+    With an ``InferenceExecutor`` forward passes run on its model workers
+    and up to one batch per worker is in flight. Admission is bounded by
+    ``max_queue_depth`` queued requests, and a request whose estimated
+    completion would miss its deadline is shed immediately with
+    ``InferenceOverloaded`` rather than left to time out in the queue.
+    """
+
+    def __init__(self,
+                 engine: Any,
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+                 executor: Optional[InferenceExecutor] = None,
+                 max_queue_depth: int = INFERENCE_MAX_QUEUE,
+                 deadline_ms: float = INFERENCE_DEADLINE_MS):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.executor = executor
+        self.max_queue_depth = max_queue_depth
+        self.deadline_ms = deadline_ms
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._in_flight: Set[asyncio.Task] = set()
+
+        self.batch_size_histogram = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_histogram = Histogram(LATENCY_BUCKETS_MS)
+        self.forward_time_histogram = Histogram(LATENCY_BUCKETS_MS)
+        self.total_requests = 0
+        self.total_batches = 0
+        self.failed_batches = 0
+        self.adaptive_requests = 0
+        self.adaptive_escalations = 0
+        self.rejected_queue_full = 0
+        self.rejected_deadline = 0
+        self.expired_in_queue = 0
+
+    async def start(self) -> None:
+        """Start the background batching loop"""
+        if self._worker is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.executor.workers if self.executor else 1)
+        self._worker = asyncio.create_task(self._run())
+        logger.info(f"Micro-batcher started (max_batch_size={self.max_batch_size}, "
+                    f"max_wait_ms={self.max_wait_ms})")
+
+    async def stop(self) -> None:
+        """Stop the batching loop and fail any requests still queued"""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+        for task in list(self._in_flight):
+            task.cancel()
+
+        while self._queue is not None and not self._queue.empty():
+            pending = self._queue.get_nowait()
+            if not pending.future.done():
+                pending.future.set_exception(RuntimeError("Batcher shut down"))
+
+    async def predict(self,
+                      image: Image.Image,
+                      use_tta: bool = True,
+                      confidence_threshold: float = 0.8,
+                      top_k: int = 5,
+                      adaptive_tta: bool = False,
+                      embedding: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """
+        Queue one image and wait for its slice of the batched result
+
+        ``embedding`` (from ``embed``) lets the single-view pass skip the
+        vision tower.
+        """
+        key = (tta_mode(use_tta, adaptive_tta), float(confidence_threshold), int(top_k))
+        return await self._enqueue(image, key, embedding)
+
+    async def embed(self, image: Image.Image) -> np.ndarray:
+        """Queue one image for the vision tower only and wait for its float32 embedding"""
+        if not self.supports_embeddings:
+            raise RuntimeError("Engine does not expose encode_images")
+        return await self._enqueue(image, (EMBED, 0.0, 0))
+
+    @property
+    def supports_embeddings(self) -> bool:
+        return hasattr(self.engine, 'encode_images')
+
+    async def _enqueue(self, image: Image.Image, key: BatchKey, embedding: Optional[np.ndarray] = None) -> Any:
+        if self._worker is None:
+            await self.start()
+
+        deadline = self._admit(1)
+        loop = asyncio.get_running_loop()
+        pending = _PendingPrediction(
+            image=image,
+            key=key,
+            future=loop.create_future(),
+            deadline=deadline,
+            embedding=embedding
+        )
+        self.total_requests += 1
+        await self._queue.put(pending)
+        return await pending.future
+
+    async def predict_many(self,
+                           images: List[Image.Image],
+                           use_tta: bool = True,
+                           confidence_threshold: float = 0.8,
+                           top_k: int = 5,
+                           adaptive_tta: bool = False) -> List[Dict[str, Any]]:
+        """Run an explicit batch in a single forward pass, bypassing the queue"""
+        if not images:
+            return []
+
+        deadline = self._admit(len(images))
+        loop = asyncio.get_running_loop()
+        key = (tta_mode(use_tta, adaptive_tta), float(confidence_threshold), int(top_k))
+        group = [
+            _PendingPrediction(image=image, key=key, future=loop.create_future(), deadline=deadline)
+            for image in images
+        ]
+        self.total_requests += len(group)
+        await self._dispatch(key, group)
+        return [pending.future.result() for pending in group]
+
+    def _admit(self, count: int) -> float:
+        """Admission control; returns the request deadline or sheds the request"""
+        queued = self._queue.qsize() if self._queue is not None else 0
+        if queued + count > self.max_queue_depth:
+            self.rejected_queue_full += count
+            raise InferenceOverloaded("admission queue full")
+
+        now = time.monotonic()
+        deadline = now + self.deadline_ms / 1000.0
+        if self.executor is not None:
+            batches_ahead = (queued + count + self.max_batch_size - 1) // self.max_batch_size
+            if now + self.executor.estimated_wait(batches_ahead) > deadline:
+                self.rejected_deadline += count
+                raise InferenceOverloaded("estimated wait exceeds deadline")
+
+        return deadline
+
+    async def _run(self) -> None:
+        """Collect queued requests into batches and dispatch them"""
+        while True:
+            # Wait for a free model worker so requests keep accumulating meanwhile
+            await self._slots.acquire()
+            try:
+                first = await self._queue.get()
+            except asyncio.CancelledError:
+                self._slots.release()
+                raise
+            batch = [first]
+            flush_at = first.enqueued_at + self.max_wait_ms / 1000.0
+
+            while len(batch) < self.max_batch_size:
+                remaining = flush_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            # Drain anything that arrived while we were waiting
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            now = time.monotonic()
+            groups: Dict[BatchKey, List[_PendingPrediction]] = {}
+            for pending in batch:
+                if pending.future.done():  # Skip cancelled callers
+                    continue
+                if now >= pending.deadline:
+                    self.expired_in_queue += 1
+                    pending.future.set_exception(InferenceOverloaded("deadline exceeded while queued"))
+                    continue
+                groups.setdefault(pending.key, []).append(pending)
+
+            task = asyncio.create_task(self._dispatch_groups(groups))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _dispatch_groups(self, groups: Dict[BatchKey, List[_PendingPrediction]]) -> None:
+        """Dispatch one collected batch, then hand the worker slot back"""
+        try:
+            for key, group in groups.items():
+                await self._dispatch(key, group)
+        finally:
+            self._slots.release()
+
+    async def _dispatch(self, key: BatchKey, group: List[_PendingPrediction]) -> None:
+        """Run one forward pass for requests sharing the same options"""
+        mode, confidence_threshold, top_k = key
+        dispatched_at = time.monotonic()
+        deadline = min(pending.deadline for pending in group)
+
+        for pending in group:
+            self.queue_wait_histogram.observe((dispatched_at - pending.enqueued_at) * 1000)
+        self.batch_size_histogram.observe(len(group))
+        self.total_batches += 1
+
+        try:
+            images = [pending.image for pending in group]
+            embeddings = None
+            if all(pending.embedding is not None for pending in group):
+                embeddings = np.stack([pending.embedding for pending in group])
+
+            if mode == EMBED:
+                results = list(await self._run_on_executor(self._engine_encode, deadline, images=images))
+            elif mode == TTA_ADAPTIVE:
+                results = await self._forward_adaptive(images, deadline, confidence_threshold, top_k, embeddings)
+            elif mode == TTA_OFF and embeddings is not None and self._can_classify_embeddings:
+                results = await self._run_on_executor(
+                    self._engine_classify, deadline,
+                    embeddings=embeddings, confidence_threshold=confidence_threshold, top_k=top_k
+                )
+            else:
+                results = await self._forward(
+                    images,
+                    deadline,
+                    use_tta=(mode == TTA_FULL),
+                    confidence_threshold=confidence_threshold,
+                    top_k=top_k
+                )
+            if len(results) != len(group):
+                raise RuntimeError(f"Engine returned {len(results)} results for batch of {len(group)}")
+        except Exception as e:
+            self.failed_batches += 1
+            logger.error(f"Batched breed inference failed (batch_size={len(group)}): {e}")
+            for pending in group:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+            return
+        finally:
+            self.forward_time_histogram.observe((time.monotonic() - dispatched_at) * 1000)
+
+        for pending, result in zip(group, results):
+            if not pending.future.done():
+                pending.future.set_result(result)
+
+    async def _forward(self, images: List[Image.Image], deadline: float, **kwargs) -> List[Dict[str, Any]]:
+        """Run one forward pass on the executor (or inline without one)"""
+        return await self._run_on_executor(self._engine_forward, deadline, images=images, **kwargs)
+
+    async def _run_on_executor(self, fn, deadline: float, **kwargs) -> Any:
+        if self.executor is not None:
+            return await self.executor.submit(fn, deadline, **kwargs)
+        return await fn(**kwargs)
+
+    @property
+    def _can_classify_embeddings(self) -> bool:
+        return hasattr(self.engine, 'classify_embeddings')
+
+    async def _engine_encode(self, images: List[Image.Image]) -> np.ndarray:
+        """Vision-tower embeddings as a float32 (n, dim) array"""
+        embeddings = await self.engine.encode_images(images)
+        if hasattr(embeddings, 'detach'):  # torch.Tensor
+            embeddings = embeddings.detach().float().cpu().numpy()
+        return np.asarray(embeddings, dtype=np.float32)
+
+    async def _engine_classify(self, embeddings: np.ndarray, **kwargs) -> List[Dict[str, Any]]:
+        """LoRA head only, over embeddings produced by ``_engine_encode``"""
+        return await self.engine.classify_embeddings(embeddings=embeddings, **kwargs)
+
+    async def _engine_forward(self, images: List[Image.Image], **kwargs) -> List[Dict[str, Any]]:
+        """Call the engine's batched entry point, falling back to per-image predict"""
+        predict_batch = getattr(self.engine, 'predict_batch', None)
+        if predict_batch is not None:
+            return await predict_batch(images=images, **kwargs)
+
+        return [await self.engine.predict(image=image, **kwargs) for image in images]
+
+    async def _forward_adaptive(self,
+                                images: List[Image.Image],
+                                deadline: float,
+                                confidence_threshold: float,
+                                top_k: int,
+                                embeddings: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """Single-view pass for everything, full TTA only for low-confidence images"""
+        if embeddings is not None and self._can_classify_embeddings:
+            results = await self._run_on_executor(
+                self._engine_classify, deadline,
+                embeddings=embeddings, confidence_threshold=confidence_threshold, top_k=top_k
+            )
+        else:
+            results = await self._forward(
+                images, deadline, use_tta=False, confidence_threshold=confidence_threshold, top_k=top_k
+            )
+        uncertain = [i for i, result in enumerate(results)
+                     if result.get('confidence', 0.0) < confidence_threshold]
+
+        self.adaptive_requests += len(images)
+        self.adaptive_escalations += len(uncertain)
+
+        if uncertain:
+            escalated = await self._forward(
+                [images[i] for i in uncertain],
+                deadline,
+                use_tta=True,
+                confidence_threshold=confidence_threshold,
+                top_k=top_k
+            )
+            for i, result in zip(uncertain, escalated):
+                results[i] = result
+
+        escalated_indices = set(uncertain)
+        for i, result in enumerate(results):
+            result['used_tta'] = i in escalated_indices
+        return results
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Batching statistics for the metrics endpoint"""
+        metrics = {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait_ms,
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'max_queue_depth': self.max_queue_depth,
+            'deadline_ms': self.deadline_ms,
+            'in_flight_batches': len(self._in_flight),
+            'rejections': {
+                'queue_full': self.rejected_queue_full,
+                'deadline': self.rejected_deadline,
+                'expired_in_queue': self.expired_in_queue,
+            },
+            'total_requests': self.total_requests,
+            'total_batches': self.total_batches,
+            'failed_batches': self.failed_batches,
+            'adaptive_tta': {
+                'requests': self.adaptive_requests,
+                'escalations': self.adaptive_escalations,
+                'escalation_rate': (self.adaptive_escalations / self.adaptive_requests
+                                    if self.adaptive_requests else 0.0),
+            },
+            'batch_size': self.batch_size_histogram.snapshot(),
+            'queue_wait_ms': self.queue_wait_histogram.snapshot(),
+            'forward_time_ms': self.forward_time_histogram.snapshot(),
+        }
+        if self.executor is not None:
+            metrics['executor'] = self.executor.get_metrics()
+        return metrics
@@ -0,0 +1,128 @@
+"""
+Image Decode Worker Pool
+Runs CPU-bound image decoding off the event loop with bounded queueing
+"""
+
+import asyncio
+import base64
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Union
+
+from PIL import Image
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Pool configuration
+DECODE_WORKERS = int(os.getenv('BREED_DECODE_WORKERS', str(min(4, os.cpu_count() or 1))))
+DECODE_MAX_QUEUE = int(os.getenv('BREED_DECODE_MAX_QUEUE', '32'))
+DECODE_RETRY_AFTER = int(os.getenv('BREED_DECODE_RETRY_AFTER', '1'))
+DECODE_TARGET_SIZE = int(os.getenv('BREED_DECODE_TARGET_SIZE', '224'))  # Model input resolution
+MAX_IMAGE_PIXELS = 5000 * 5000
+
+
+class DecodePoolSaturated(Exception):
+    """Raised when the decode queue is full; callers should retry later"""
+
+    def __init__(self, retry_after: int = DECODE_RETRY_AFTER):
+        super().__init__("Image decode queue is full")
+        self.retry_after = retry_after
+
+
+class ImageTooLarge(ValueError):
+    """Raised when an image exceeds the supported pixel count"""
+
+
+def decode_image(image_data: Union[bytes, memoryview, str],
+                 target_size: Optional[int] = DECODE_TARGET_SIZE) -> Image.Image:
+    """
+    Decode bytes (or an image file path) into an RGB image close to the model's input resolution
+
+    JPEGs are decoded through ``Image.draft`` so libjpeg produces a
+    downscaled image directly (1/2, 1/4 or 1/8 scale, never smaller than
+    ``target_size``) instead of decoding every pixel and resizing later.
+    The original dimensions are kept in ``image.info['original_size']``.
+    """
+    image = Image.open(image_data if isinstance(image_data, str) else io.BytesIO(image_data))
+    original_size = image.size
+
+    # Validate image size before any pixel data is decoded
+    if original_size[0] * original_size[1] > MAX_IMAGE_PIXELS:
+        raise ImageTooLarge("Image too large (max 5000x5000)")
+
+    if target_size and image.format == 'JPEG':
+        image.draft('RGB', (target_size, target_size))
+
+    # Convert to RGB if needed
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.load()
+
+    image.info['original_size'] = original_size
+    return image
+
+
+def decode_base64(image_base64: str) -> bytes:
+    """Decode base64 (optionally a data URL) into raw bytes"""
+    if image_base64.startswith('data:image'):
+        image_base64 = image_base64.split(',')[1]
+    return base64.b64decode(image_base64)
+
+
+class DecodePool:
+    """
+    Thread pool for image decode and preprocessing
+
+    Pillow releases the GIL while decoding, so threads give real
+    parallelism without pickling image bytes to another process. At most
+    ``max_workers + max_queue`` jobs may be outstanding; beyond that
+    ``DecodePoolSaturated`` is raised immediately so the route can answer
+    503 with Retry-After instead of queueing without bound.
+    """
+
+    def __init__(self, max_workers: int = DECODE_WORKERS, max_queue: int = DECODE_MAX_QUEUE):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='image-decode')
+        self._lock = threading.Lock()
+        self._outstanding = 0
+        self.completed = 0
+        self.rejected = 0
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run ``fn(*args)`` on the pool, rejecting when the queue is full"""
+        with self._lock:
+            if self._outstanding >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise DecodePoolSaturated()
+            self._outstanding += 1
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            with self._lock:
+                self._outstanding -= 1
+                self.completed += 1
+
+    async def decode(self, image_data: Union[bytes, str], target_size: Optional[int] = DECODE_TARGET_SIZE) -> Image.Image:
+        return await self.run(decode_image, image_data, target_size)
+
+    async def decode_base64(self, image_base64: str) -> bytes:
+        return await self.run(decode_base64, image_base64)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            'workers': self.max_workers,
+            'max_queue': self.max_queue,
+            'outstanding': self._outstanding,
+            'queued': max(0, self._outstanding - self.max_workers),
+            'completed': self.completed,
+            'rejected': self.rejected,
+        }
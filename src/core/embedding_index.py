@@ -0,0 +1,248 @@
+"""
+CLIP Image-Embedding Index
+Memory-mapped float16 embedding store with brute-force and IVF nearest-neighbour search
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Index configuration
+INDEX_DIR = os.getenv('BREED_EMBEDDING_INDEX_DIR')  # Index disabled when unset
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv('BREED_NEAR_DUPLICATE_THRESHOLD', '0.97'))
+IVF_MIN_ROWS = int(os.getenv('BREED_IVF_MIN_ROWS', '50000'))
+IVF_LISTS = int(os.getenv('BREED_IVF_LISTS', '256'))
+IVF_PROBES = int(os.getenv('BREED_IVF_PROBES', '8'))
+
+INITIAL_CAPACITY = 1024
+SEARCH_CHUNK_ROWS = 65536  # Rows scored per float32 matmul in brute-force search
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize rows so that dot products are cosine similarities"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class EmbeddingIndex:
+    """
+    Append-only store of past image embeddings
+
+    Embeddings live in ``embeddings.f16``, a memory-mapped [capacity, dim]
+    float16 matrix that grows by doubling. Per-row records (prediction,
+    digest, model version) are appended to ``entries.jsonl``. Search is
+    brute force until ``ivf_min_rows`` rows are stored, after which a
+    spherical k-means inverted file is built and only the closest
+    ``ivf_probes`` lists are scanned.
+
+    Every method blocks (matrix scans, file appends), so async callers
+    run them with ``asyncio.to_thread``; they are safe to call from
+    several threads. The IVF is trained on a background thread and
+    swapped in when done, with brute force serving searches meanwhile.
+    """
+
+    def __init__(self,
+                 directory: str,
+                 dim: int,
+                 ivf_min_rows: int = IVF_MIN_ROWS,
+                 ivf_lists: int = IVF_LISTS,
+                 ivf_probes: int = IVF_PROBES):
+        self.directory = directory
+        self.dim = dim
+        self.ivf_min_rows = ivf_min_rows
+        self.ivf_lists = ivf_lists
+        self.ivf_probes = ivf_probes
+
+        self._matrix_path = os.path.join(directory, 'embeddings.f16')
+        self._entries_path = os.path.join(directory, 'entries.jsonl')
+        self._lock = threading.Lock()
+
+        self._records: List[Dict[str, Any]] = []
+        self._matrix: Optional[np.memmap] = None
+        self._capacity = 0
+
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[List[int]] = []
+        self._assignments: List[int] = []
+        self._ivf_building = False
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def _load(self) -> None:
+        """Open (or create) the memory-mapped matrix and replay the record log"""
+        if os.path.exists(self._entries_path):
+            with open(self._entries_path, 'r') as f:
+                self._records = [json.loads(line) for line in f if line.strip()]
+
+        row_bytes = self.dim * np.dtype(np.float16).itemsize
+        existing_rows = os.path.getsize(self._matrix_path) // row_bytes if os.path.exists(self._matrix_path) else 0
+        self._map(max(existing_rows, len(self._records), INITIAL_CAPACITY))
+
+        if len(self._records) >= self.ivf_min_rows:
+            self._schedule_ivf_build()
+
+        logger.info(f"Embedding index loaded: {len(self._records)} rows, dim={self.dim}")
+
+    def _map(self, capacity: int) -> None:
+        """(Re)map the embedding file with room for ``capacity`` rows"""
+        if self._matrix is not None:
+            self._matrix.flush()
+            del self._matrix
+
+        size = capacity * self.dim * np.dtype(np.float16).itemsize
+        with open(self._matrix_path, 'ab') as f:
+            if f.tell() < size:
+                f.truncate(size)
+
+        self._matrix = np.memmap(self._matrix_path, dtype=np.float16, mode='r+', shape=(capacity, self.dim))
+        self._capacity = capacity
+
+    def add(self, embedding: np.ndarray, record: Dict[str, Any]) -> int:
+        """Append one embedding with its record, returning the row id"""
+        vector = _normalize(embedding.reshape(1, -1))[0]
+
+        with self._lock:
+            row = len(self._records)
+            if row >= self._capacity:
+                self._map(self._capacity * 2)
+
+            self._matrix[row] = vector.astype(np.float16)
+            entry = {**record, 'id': row, 'created_at': record.get('created_at', time.time())}
+            with open(self._entries_path, 'a') as f:
+                f.write(json.dumps(entry, default=str) + '\n')
+            self._records.append(entry)
+
+            if self._centroids is not None:
+                list_id = int(np.argmax(self._centroids @ vector))
+                self._lists[list_id].append(row)
+                self._assignments.append(list_id)
+            elif len(self._records) >= self.ivf_min_rows:
+                self._schedule_ivf_build()
+
+        return row
+
+    def _schedule_ivf_build(self) -> None:
+        """Start training the IVF on a background thread unless one is already running"""
+        if self._ivf_building:
+            return
+        self._ivf_building = True
+        threading.Thread(target=self._build_ivf_background, name='embedding-ivf', daemon=True).start()
+
+    def _build_ivf_background(self) -> None:
+        try:
+            self.build_ivf()
+        except Exception as e:
+            logger.error(f"IVF build failed, staying on brute-force search: {e}")
+        finally:
+            self._ivf_building = False
+
+    def build_ivf(self, iterations: int = 10, sample_size: int = 100000, seed: int = 0) -> None:
+        """
+        Train spherical k-means centroids and assign every stored row
+
+        Training runs without the lock on the rows present when it
+        started; rows appended meanwhile are assigned at the swap.
+        """
+        with self._lock:
+            count = len(self._records)
+            matrix = self._matrix
+        n_lists = min(self.ivf_lists, count)
+        if n_lists == 0:
+            return
+
+        rng = np.random.default_rng(seed)
+        vectors = np.asarray(matrix[:count], dtype=np.float32)
+        sample = vectors[rng.choice(count, size=min(sample_size, count), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)]
+
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = np.bincount(assignment, minlength=n_lists) == 0
+            sums[empty] = centroids[empty]  # Keep empty clusters where they are
+            centroids = _normalize(sums)
+
+        assignment = np.concatenate([
+            np.argmax(vectors[i:i + SEARCH_CHUNK_ROWS] @ centroids.T, axis=1)
+            for i in range(0, count, SEARCH_CHUNK_ROWS)
+        ])
+
+        with self._lock:
+            total = len(self._records)
+            if total > count:
+                appended = np.asarray(self._matrix[count:total], dtype=np.float32)
+                assignment = np.concatenate([assignment, np.argmax(appended @ centroids.T, axis=1)])
+
+            lists: List[List[int]] = [[] for _ in range(n_lists)]
+            for row, list_id in enumerate(assignment.tolist()):
+                lists[list_id].append(row)
+            self._lists = lists
+            self._assignments = assignment.tolist()
+            self._centroids = centroids
+
+        logger.info(f"Built IVF index with {n_lists} lists over {total} embeddings")
+
+    def search(self, embedding: np.ndarray, k: int = 5) -> List[Tuple[float, Dict[str, Any]]]:
+        """Return up to ``k`` (cosine similarity, record) pairs, most similar first"""
+        # Consistent snapshot; the scan itself runs unlocked alongside add()
+        with self._lock:
+            count = len(self._records)
+            matrix, centroids, lists = self._matrix, self._centroids, self._lists
+        if count == 0:
+            return []
+
+        query = _normalize(embedding.reshape(1, -1))[0]
+
+        if centroids is not None:
+            probes = np.argsort(-(centroids @ query))[:self.ivf_probes]
+            rows = np.sort(np.fromiter(
+                (row for list_id in probes for row in lists[list_id] if row < count), dtype=np.int64
+            ))
+            scores = np.asarray(matrix[rows], dtype=np.float32) @ query
+        else:
+            scores = np.concatenate([
+                np.asarray(matrix[i:min(i + SEARCH_CHUNK_ROWS, count)], dtype=np.float32) @ query
+                for i in range(0, count, SEARCH_CHUNK_ROWS)
+            ])
+            rows = np.arange(count)
+
+        if len(scores) == 0:
+            return []
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self._records[int(rows[i])]) for i in top]
+
+    def nearest(self, embedding: np.ndarray) -> Optional[Tuple[float, Dict[str, Any]]]:
+        """Closest stored record, if any"""
+        matches = self.search(embedding, k=1)
+        return matches[0] if matches else None
+
+    def flush(self) -> None:
+        if self._matrix is not None:
+            self._matrix.flush()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            'rows': len(self._records),
+            'capacity': self._capacity,
+            'dim': self.dim,
+            'ivf_enabled': self._centroids is not None,
+            'ivf_lists': len(self._lists),
+            'ivf_building': self._ivf_building,
+        }
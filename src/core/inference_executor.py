@@ -0,0 +1,159 @@
+"""
+Inference Execution Layer
+Fixed pool of model workers with deadline-aware admission control
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .stats import Histogram, LATENCY_BUCKETS_MS
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Executor configuration
+THREADS_PER_WORKER = int(os.getenv('BREED_THREADS_PER_WORKER', '4'))
+INFERENCE_MAX_QUEUE = int(os.getenv('BREED_INFERENCE_MAX_QUEUE', '64'))
+INFERENCE_DEADLINE_MS = float(os.getenv('BREED_INFERENCE_DEADLINE_MS', '10000'))
+INFERENCE_RETRY_AFTER = int(os.getenv('BREED_INFERENCE_RETRY_AFTER', '1'))
+
+
+def default_worker_count() -> int:
+    """One worker per model replica on GPU, one per core group on CPU"""
+    configured = os.getenv('BREED_INFERENCE_WORKERS')
+    if configured:
+        return max(1, int(configured))
+
+    try:
+        import torch
+        if torch.cuda.is_available():
+            return max(1, torch.cuda.device_count())
+    except ImportError:
+        pass
+
+    return max(1, (os.cpu_count() or 1) // THREADS_PER_WORKER)
+
+
+class InferenceOverloaded(Exception):
+    """Raised when a request is shed instead of queued past its deadline"""
+
+    def __init__(self, reason: str, retry_after: int = INFERENCE_RETRY_AFTER):
+        super().__init__(f"Inference overloaded: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    """
+    Runs model forward passes on a fixed number of dedicated worker threads
+
+    Each worker thread owns its own event loop, so async engine entry
+    points execute entirely off the serving loop. Torch releases the GIL
+    inside kernels, so N workers give N concurrent forward passes; on CPU
+    each worker is sized to a group of ``THREADS_PER_WORKER`` cores.
+    Jobs whose deadline passes while queued are dropped before they run.
+    """
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers or default_worker_count()
+        self._thread_state = threading.local()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers,
+            thread_name_prefix='inference',
+            initializer=self._init_worker
+        )
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.expired = 0
+        self.service_time_histogram = Histogram(LATENCY_BUCKETS_MS)
+        self._service_time_ewma: Optional[float] = None
+
+        try:
+            import torch
+            if not torch.cuda.is_available():
+                torch.set_num_threads(THREADS_PER_WORKER)
+        except ImportError:
+            pass
+
+        logger.info(f"Inference executor started with {self.workers} workers")
+
+    def _init_worker(self) -> None:
+        self._thread_state.loop = asyncio.new_event_loop()
+
+    def _call(self, fn: Callable[..., Any], deadline: float, kwargs: Dict[str, Any]) -> Any:
+        """Worker-thread body: enforce the deadline, then run the job"""
+        with self._lock:
+            self._queued -= 1
+            if time.monotonic() >= deadline:
+                self.expired += 1
+                raise InferenceOverloaded("deadline exceeded while queued")
+            self._in_flight += 1
+
+        started = time.perf_counter()
+        try:
+            result = fn(**kwargs)
+            if asyncio.iscoroutine(result):
+                result = self._thread_state.loop.run_until_complete(result)
+            with self._lock:
+                self.completed += 1
+            return result
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.service_time_histogram.observe(elapsed * 1000)
+            with self._lock:
+                self._in_flight -= 1
+                self._service_time_ewma = (elapsed if self._service_time_ewma is None
+                                           else 0.8 * self._service_time_ewma + 0.2 * elapsed)
+
+    async def submit(self, fn: Callable[..., Awaitable[Any]], deadline: float, **kwargs: Any) -> Any:
+        """Run ``fn(**kwargs)`` on a model worker; ``deadline`` is a time.monotonic() value"""
+        with self._lock:
+            self._queued += 1
+        try:
+            future = self._executor.submit(self._call, fn, deadline, kwargs)
+        except Exception:
+            with self._lock:
+                self._queued -= 1
+            raise
+        return await asyncio.wrap_future(future)
+
+    def estimated_wait(self, jobs_ahead: int) -> float:
+        """Seconds until a job queued behind ``jobs_ahead`` others would finish"""
+        service_time = self._service_time_ewma or 0.0
+        backlog = self._queued + self._in_flight + jobs_ahead
+        return (backlog // self.workers + 1) * service_time
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            'workers': self.workers,
+            'queued': self._queued,
+            'in_flight': self._in_flight,
+            'completed': self.completed,
+            'failed': self.failed,
+            'expired_in_queue': self.expired,
+            'service_time_ewma_ms': (self._service_time_ewma or 0.0) * 1000,
+            'service_time_ms': self.service_time_histogram.snapshot(),
+        }
@@ -0,0 +1,101 @@
+"""
+Binary Mesh Export
+Writes binary STL directly from NumPy vertex and face arrays
+"""
+
+import os
+import tempfile
+from typing import BinaryIO, Tuple, Union
+
+import numpy as np
+
+
+# 50-byte binary STL facet record: normal, three vertices, attribute byte count
+STL_FACET_DTYPE = np.dtype([
+    ('normal', '<f4', (3,)),
+    ('vertices', '<f4', (3, 3)),
+    ('attributes', '<u2'),
+])
+STL_HEADER_SIZE = 80
+
+# Process umask, read once: mkstemp creates 0600 files, outputs should get open()'s usual mode
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+# Single-triangle mesh written by demo mode and the pipeline fallback
+PLACEHOLDER_VERTICES = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0]], dtype=np.float32)
+PLACEHOLDER_FACES = np.array([[0, 1, 2]], dtype=np.int64)
+
+
+def face_normals(triangles: np.ndarray) -> np.ndarray:
+    """Unit normals for an (n, 3, 3) triangle array (zero for degenerate faces)"""
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    np.divide(normals, lengths, out=normals, where=lengths > 0)
+    return normals
+
+
+def binary_stl_bytes(vertices: np.ndarray, faces: np.ndarray, name: str = '') -> bytes:
+    """Binary STL encoding of an indexed triangle mesh"""
+    vertices = np.asarray(vertices, dtype=np.float32)
+    faces = np.asarray(faces)
+    if vertices.ndim != 2 or vertices.shape[1] != 3:
+        raise ValueError(f"vertices must have shape (n, 3), got {vertices.shape}")
+    if faces.ndim != 2 or faces.shape[1] != 3:
+        raise ValueError(f"faces must have shape (m, 3), got {faces.shape}")
+
+    triangles = vertices[faces]
+    records = np.zeros(len(faces), dtype=STL_FACET_DTYPE)
+    records['vertices'] = triangles
+    records['normal'] = face_normals(triangles)
+
+    # Header must not start with "solid", or readers may treat the file as ASCII
+    header = f"binary STL {name}".encode('ascii', 'replace')[:STL_HEADER_SIZE].ljust(STL_HEADER_SIZE, b'\0')
+    return header + np.uint32(len(faces)).tobytes() + records.tobytes()
+
+
+def write_binary_stl(destination: Union[str, BinaryIO],
+                     vertices: np.ndarray,
+                     faces: np.ndarray,
+                     name: str = '') -> int:
+    """
+    Write a mesh as binary STL with a single write; returns bytes written
+
+    A path is written atomically (temp file + rename) so a download never
+    sees a half-written mesh. The file gets the same permissions a plain
+    open() would give it, so other users (a web server, a backup job) can read it.
+    """
+    data = binary_stl_bytes(vertices, faces, name)
+    if not isinstance(destination, str):
+        destination.write(data)
+        return len(data)
+
+    directory = os.path.dirname(destination) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.mesh-', suffix='.stl')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o666 & ~_UMASK)
+        os.replace(tmp_path, destination)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return len(data)
+
+
+def read_binary_stl(source: Union[str, bytes]) -> Tuple[np.ndarray, np.ndarray]:
+    """Facet normals (m, 3) and triangles (m, 3, 3) from binary STL content"""
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            source = f.read()
+    count = int(np.frombuffer(source, dtype='<u4', count=1, offset=STL_HEADER_SIZE)[0])
+    records = np.frombuffer(source, dtype=STL_FACET_DTYPE, count=count, offset=STL_HEADER_SIZE + 4)
+    return records['normal'].copy(), records['vertices'].copy()
+
+
+def write_placeholder_stl(destination: str, name: str = 'PetPlantr placeholder') -> int:
+    """Single-triangle stand-in used when the neural pipeline is unavailable"""
+    return write_binary_stl(destination, PLACEHOLDER_VERTICES, PLACEHOLDER_FACES, name)
@@ -0,0 +1,458 @@
+"""
+Mesh Optimization Engine
+Vertex welding, degenerate-face removal and quadric-error decimation on NumPy arrays, run in a process pool
+"""
+
+import asyncio
+import logging
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from .mesh_export import STL_HEADER_SIZE, read_binary_stl, write_binary_stl
+from .stats import Histogram, LATENCY_BUCKETS_MS
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Optimizer configuration
+MESH_OPTIMIZER_WORKERS = int(os.getenv('MESH_OPTIMIZER_WORKERS', str(min(2, os.cpu_count() or 1))))
+BOUNDARY_WEIGHT = 1000.0  # Keeps open edges (planter rim, drainage holes) in place
+MAX_PASSES = 200
+POOL_FRACTION = 0.1  # Share of edges, cheapest first, eligible for collapse in one pass
+
+# Weld tolerance as a fraction of the bounding-box diagonal, per optimization_level
+WELD_TOLERANCE = {'high': 1e-6, 'standard': 1e-5, 'fast': 1e-4}
+
+
+def weld_vertices(vertices: np.ndarray, faces: np.ndarray, tolerance: float = 0.0) -> Tuple[np.ndarray, np.ndarray]:
+    """Merge vertices that fall in the same ``tolerance`` grid cell; faces are re-indexed"""
+    keys = np.round(vertices / tolerance).astype(np.int64) if tolerance > 0 else vertices
+    # Sort rows once (lexsort is much faster than unique(axis=0)) and number the distinct ones
+    order = np.lexsort(keys.T[::-1])
+    ordered = keys[order]
+    starts = np.concatenate([[True], np.any(ordered[1:] != ordered[:-1], axis=1)])
+    inverse = np.empty(len(vertices), dtype=np.int64)
+    inverse[order] = np.cumsum(starts) - 1
+    return vertices[order[starts]], inverse[faces]
+
+
+def remove_degenerate_faces(vertices: np.ndarray, faces: np.ndarray, area_epsilon: float = 0.0) -> np.ndarray:
+    """Drop faces with repeated vertices, (near) zero area, or duplicating another face"""
+    a, b, c = faces[:, 0], faces[:, 1], faces[:, 2]
+    keep = (a != b) & (b != c) & (a != c)
+    triangles = vertices[faces]
+    doubled_area = np.linalg.norm(np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0]), axis=1)
+    keep &= doubled_area > 2.0 * area_epsilon
+    faces = faces[keep]
+
+    ordered = np.sort(faces, axis=1)
+    stride = int(faces.max()) + 1 if len(faces) else 1
+    _, unique = np.unique((ordered[:, 0] * stride + ordered[:, 1]) * stride + ordered[:, 2], return_index=True)
+    return faces[np.sort(unique)]
+
+
+def compact(vertices: np.ndarray, faces: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Drop vertices no face references"""
+    used, inverse = np.unique(faces, return_inverse=True)
+    return vertices[used], inverse.reshape(faces.shape)
+
+
+def _edges(faces: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Unique undirected edges, the edge id of every half-edge, and faces per edge"""
+    half = np.sort(faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+    stride = int(faces.max()) + 1
+    keys, inverse, counts = np.unique(half[:, 0] * stride + half[:, 1], return_inverse=True, return_counts=True)
+    return np.stack([keys // stride, keys % stride], axis=1), inverse.reshape(-1), counts
+
+
+def _plane_quadrics(vertices: np.ndarray, faces: np.ndarray, edges: np.ndarray,
+                    half_edge: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Per-vertex 4x4 error quadrics: area-weighted face planes plus boundary constraint planes"""
+    triangles = vertices[faces]
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    doubled_area = np.linalg.norm(normals, axis=1)
+    normals /= np.maximum(doubled_area, 1e-30)[:, None]
+    planes = np.concatenate([normals, -np.einsum('ij,ij->i', normals, triangles[:, 0])[:, None]], axis=1)
+    face_q = np.einsum('i,ij,ik->ijk', doubled_area / 2.0, planes, planes)
+
+    quadrics = np.zeros((len(vertices), 4, 4))
+    for corner in range(3):
+        np.add.at(quadrics, faces[:, corner], face_q)
+
+    # Boundary edges get a heavily weighted plane perpendicular to their face
+    boundary_half = np.flatnonzero(counts[half_edge] == 1)
+    if len(boundary_half):
+        face_index = boundary_half // 3
+        u, v = edges[half_edge[boundary_half]].T
+        direction = vertices[v] - vertices[u]
+        perpendicular = np.cross(direction, normals[face_index])
+        length = np.linalg.norm(perpendicular, axis=1)
+        valid = length > 0
+        perpendicular = perpendicular[valid] / length[valid, None]
+        u, v, direction = u[valid], v[valid], direction[valid]
+        boundary_planes = np.concatenate(
+            [perpendicular, -np.einsum('ij,ij->i', perpendicular, vertices[u])[:, None]], axis=1
+        )
+        weight = BOUNDARY_WEIGHT * np.einsum('ij,ij->i', direction, direction)
+        boundary_q = np.einsum('i,ij,ik->ijk', weight, boundary_planes, boundary_planes)
+        np.add.at(quadrics, u, boundary_q)
+        np.add.at(quadrics, v, boundary_q)
+    return quadrics
+
+
+def _quadric_error(quadrics: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    homogeneous = np.concatenate([positions, np.ones((len(positions), 1))], axis=1)
+    return np.einsum('ij,ijk,ik->i', homogeneous, quadrics, homogeneous)
+
+
+def _collapse_targets(vertices: np.ndarray, quadrics: np.ndarray, edges: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Cheapest position and its error for collapsing each edge"""
+    u, v = edges[:, 0], edges[:, 1]
+    q = quadrics[u] + quadrics[v]
+    pu, pv = vertices[u], vertices[v]
+    midpoint = (pu + pv) / 2.0
+    candidates = [pu, pv, midpoint]
+
+    # Error-minimizing point where the quadric is well conditioned and the point stays near the edge
+    a, b = q[:, :3, :3], -q[:, :3, 3]
+    det = np.linalg.det(a)
+    scale = np.maximum(np.abs(np.trace(a, axis1=1, axis2=2)) / 3.0, 1e-30) ** 3
+    solvable = np.abs(det) > 1e-9 * scale
+    optimal = midpoint.copy()
+    if solvable.any():
+        try:
+            optimal[solvable] = np.linalg.solve(a[solvable], b[solvable][:, :, None])[:, :, 0]
+        except np.linalg.LinAlgError:
+            pass
+    far = np.linalg.norm(optimal - midpoint, axis=1) > np.linalg.norm(pv - pu, axis=1)
+    optimal[far] = midpoint[far]
+    candidates.append(optimal)
+
+    errors = np.stack([_quadric_error(q, candidate) for candidate in candidates])
+    best = np.argmin(errors, axis=0)
+    positions = np.stack(candidates)[best, np.arange(len(edges))]
+    return positions, errors[best, np.arange(len(edges))]
+
+
+def _independent_cheapest(faces: np.ndarray, edges: np.ndarray, errors: np.ndarray,
+                          n_vertices: int, pool_size: int, rng: np.random.Generator,
+                          rounds: int = 3) -> np.ndarray:
+    """
+    Cheap edges no two of which touch the same face, cheapest first
+
+    Candidates are the ``pool_size`` lowest-error edges. Within the pool,
+    random priorities decide which of two nearby edges wins (Luby-style
+    rounds): error alone varies smoothly over a surface, which would leave
+    only a handful of local minima per pass.
+    """
+    pool = np.flatnonzero(np.isfinite(errors))
+    if len(pool) > pool_size:
+        pool = pool[np.argpartition(errors[pool], pool_size - 1)[:pool_size]]
+
+    sentinel = len(edges)
+    chosen = []
+    blocked = np.zeros(n_vertices, dtype=bool)
+    for _ in range(rounds):
+        pool = pool[~(blocked[edges[pool, 0]] | blocked[edges[pool, 1]])]
+        if len(pool) == 0:
+            break
+        priority = np.full(len(edges), sentinel, dtype=np.int64)
+        priority[pool] = rng.permutation(len(pool))
+        vertex_best = np.full(n_vertices, sentinel, dtype=np.int64)
+        np.minimum.at(vertex_best, edges[pool, 0], priority[pool])
+        np.minimum.at(vertex_best, edges[pool, 1], priority[pool])
+        face_best = vertex_best[faces].min(axis=1)
+        ring_best = np.full(n_vertices, sentinel, dtype=np.int64)
+        for corner in range(3):
+            np.minimum.at(ring_best, faces[:, corner], face_best)
+        winners = pool[(ring_best[edges[pool, 0]] == priority[pool]) & (ring_best[edges[pool, 1]] == priority[pool])]
+        chosen.append(winners)
+
+        # Every vertex sharing a face with a winner's endpoint is now off limits
+        endpoint = np.zeros(n_vertices, dtype=bool)
+        endpoint[edges[winners].ravel()] = True
+        blocked[faces[endpoint[faces].any(axis=1)].ravel()] = True
+
+    selected = np.concatenate(chosen) if chosen else pool[:0]
+    return selected[np.argsort(errors[selected], kind='stable')]
+
+
+def _link_violations(edges: np.ndarray, counts: np.ndarray, selected: np.ndarray, n_vertices: int) -> np.ndarray:
+    """
+    Selected edges whose collapse would make the mesh non-manifold
+
+    An edge may be collapsed only if its endpoints share exactly the
+    neighbours opposite it: two for an interior edge, one on a boundary.
+    """
+    sources = np.concatenate([edges[:, 0], edges[:, 1]])
+    targets = np.concatenate([edges[:, 1], edges[:, 0]])
+    order = np.argsort(sources, kind='stable')
+    targets = targets[order]
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(sources, minlength=n_vertices))])
+
+    endpoints = np.concatenate([edges[selected, 0], edges[selected, 1]])
+    owners = np.tile(np.arange(len(selected)), 2)
+    degree = indptr[endpoints + 1] - indptr[endpoints]
+    offsets = np.arange(degree.sum()) - np.repeat(np.cumsum(degree) - degree, degree)
+    neighbours = targets[np.repeat(indptr[endpoints], degree) + offsets]
+    pair_keys = np.repeat(owners, degree) * n_vertices + neighbours
+
+    keys, seen = np.unique(pair_keys, return_counts=True)
+    shared = np.bincount(keys[seen == 2] // n_vertices, minlength=len(selected))
+    allowed = np.where(counts[selected] == 1, 1, 2)
+    return selected[shared != allowed]
+
+
+def _flip_violations(vertices: np.ndarray, faces: np.ndarray, edges: np.ndarray,
+                     selected: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    """Selected edges whose collapse would turn a surviving neighbour face over"""
+    owner = np.full(len(vertices), -1, dtype=np.int64)
+    owner[edges[selected, 0]] = selected
+    owner[edges[selected, 1]] = selected
+    face_owner = owner[faces].max(axis=1)
+    touched = np.flatnonzero(face_owner >= 0)
+
+    moved = vertices.copy()
+    moved[edges[selected, 0]] = positions[selected]
+    moved[edges[selected, 1]] = positions[selected]
+    before = vertices[faces[touched]]
+    after = moved[faces[touched]]
+    normal_before = np.cross(before[:, 1] - before[:, 0], before[:, 2] - before[:, 0])
+    normal_after = np.cross(after[:, 1] - after[:, 0], after[:, 2] - after[:, 0])
+    collapsing = (owner[faces[touched]] >= 0).sum(axis=1) >= 2  # Faces on the edge itself disappear
+    flipped = (np.einsum('ij,ij->i', normal_before, normal_after) <= 0) & ~collapsing
+    return np.unique(face_owner[touched[flipped]])
+
+
+def decimate(vertices: np.ndarray, faces: np.ndarray, target_faces: int,
+             max_passes: int = MAX_PASSES) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Quadric-error edge-collapse decimation to about ``target_faces`` faces
+
+    Each pass scores every edge (Garland-Heckbert quadrics, vectorized),
+    then collapses, in one batch, the cheapest edges whose one-ring
+    neighbourhoods do not overlap, so collapses in a batch never interact.
+    Collapses that would break manifoldness or flip a neighbouring face
+    are rejected. Quadrics are summed on collapse rather than recomputed.
+    Returns the new mesh and the number of passes taken.
+    """
+    vertices = np.asarray(vertices, dtype=np.float64).copy()
+    faces = np.asarray(faces, dtype=np.int64)
+    if len(faces) <= target_faces:
+        return vertices, faces, 0
+
+    edges, half_edge, counts = _edges(faces)
+    quadrics = _plane_quadrics(vertices, faces, edges, half_edge, counts)
+
+    rng = np.random.default_rng(0)  # Fixed seed: identical input gives identical output
+    passes = 0
+    while len(faces) > target_faces and passes < max_passes:
+        passes += 1
+        if passes > 1:
+            edges, _, counts = _edges(faces)
+        positions, errors = _collapse_targets(vertices, quadrics, edges)
+        errors[counts > 2] = np.inf  # Never collapse already non-manifold edges
+
+        # Each collapse removes about two faces; do not overshoot the target
+        needed = max(1, (len(faces) - target_faces + 1) // 2)
+        selected = np.empty(0, dtype=np.int64)
+        for _ in range(4):
+            pool_size = max(needed, int(len(edges) * POOL_FRACTION))
+            candidates = _independent_cheapest(faces, edges, errors, len(vertices), pool_size, rng)[:needed]
+            if len(candidates) == 0:
+                break
+            rejected = np.union1d(
+                _link_violations(edges, counts, candidates, len(vertices)),
+                _flip_violations(vertices, faces, edges, candidates, positions)
+            )
+            selected = np.setdiff1d(candidates, rejected)
+            if len(selected):
+                break
+            errors[rejected] = np.inf  # Whole batch refused: try the next-cheapest edges
+        if len(selected) == 0:
+            break
+
+        keep_vertex, drop_vertex = edges[selected, 0], edges[selected, 1]
+        vertices[keep_vertex] = positions[selected]
+        quadrics[keep_vertex] += quadrics[drop_vertex]
+        remap = np.arange(len(vertices))
+        remap[drop_vertex] = keep_vertex
+        faces = remap[faces]
+        faces = faces[(faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])]
+
+    return vertices, faces, passes
+
+
+def mesh_report(vertices: np.ndarray, faces: np.ndarray) -> Dict[str, Any]:
+    """Triangle quality and manifoldness of a mesh"""
+    if len(faces) == 0:
+        return {'faces': 0, 'vertices': 0, 'mesh_quality': 0.0, 'geometry_score': 0.0,
+                'boundary_edges': 0, 'non_manifold_edges': 0, 'watertight': False}
+
+    triangles = vertices[faces]
+    doubled_area = np.linalg.norm(np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0]), axis=1)
+    squared_lengths = (
+        np.sum((triangles[:, 1] - triangles[:, 0]) ** 2, axis=1)
+        + np.sum((triangles[:, 2] - triangles[:, 1]) ** 2, axis=1)
+        + np.sum((triangles[:, 0] - triangles[:, 2]) ** 2, axis=1)
+    )
+    # 1.0 for an equilateral triangle, 0.0 for a sliver
+    quality = 2.0 * np.sqrt(3.0) * doubled_area / np.maximum(squared_lengths, 1e-30)
+
+    _, _, counts = _edges(faces)
+    boundary = int(np.sum(counts == 1))
+    non_manifold = int(np.sum(counts > 2))
+    return {
+        'faces': int(len(faces)),
+        'vertices': int(len(np.unique(faces))),
+        'mesh_quality': round(float(np.mean(quality)) * 100.0, 1),
+        'geometry_score': round(float(np.mean(counts == 2)) * 100.0, 1),
+        'boundary_edges': boundary,
+        'non_manifold_edges': non_manifold,
+        'watertight': boundary == 0 and non_manifold == 0,
+    }
+
+
+def optimize_mesh(vertices: np.ndarray, faces: np.ndarray, target_faces: int,
+                  optimization_level: str = 'standard') -> Tuple[np.ndarray, np.ndarray, Dict[str, Any]]:
+    """Weld, clean and decimate a mesh; returns the result and a report with per-stage timings"""
+    timings: Dict[str, float] = {}
+    input_faces = len(faces)
+
+    start = time.perf_counter()
+    diagonal = float(np.linalg.norm(vertices.max(axis=0) - vertices.min(axis=0))) if len(vertices) else 0.0
+    tolerance = WELD_TOLERANCE.get(optimization_level, WELD_TOLERANCE['standard']) * diagonal
+    input_vertices = len(vertices)
+    vertices, faces = weld_vertices(np.asarray(vertices, dtype=np.float64), np.asarray(faces, dtype=np.int64), tolerance)
+    welded = input_vertices - len(vertices)
+    timings['weld'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cleaned = remove_degenerate_faces(vertices, faces, area_epsilon=(tolerance ** 2) / 2.0)
+    degenerate = len(faces) - len(cleaned)
+    vertices, faces = compact(vertices, cleaned)
+    timings['clean'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vertices, faces, passes = decimate(vertices, faces, target_faces)
+    vertices, faces = compact(vertices, faces)
+    timings['decimate'] = time.perf_counter() - start
+
+    report = mesh_report(vertices, faces)
+    report.update({
+        'input_faces': input_faces,
+        'welded_vertices': welded,
+        'degenerate_faces_removed': degenerate,
+        'decimation_passes': passes,
+        'timings': {stage: round(seconds, 4) for stage, seconds in timings.items()},
+        'optimization_time': round(sum(timings.values()), 4),
+    })
+    return vertices, faces, report
+
+
+_ASCII_VERTEX = re.compile(rb'vertex\s+(\S+)\s+(\S+)\s+(\S+)')
+
+
+def load_mesh(path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Indexed (vertices, faces) from a mesh file
+
+    STL (binary or ASCII) is read natively; other formats (GLB, OBJ, PLY)
+    need trimesh installed.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if len(data) >= STL_HEADER_SIZE + 4:
+        count = int(np.frombuffer(data, dtype='<u4', count=1, offset=STL_HEADER_SIZE)[0])
+        if len(data) == STL_HEADER_SIZE + 4 + 50 * count:
+            _, triangles = read_binary_stl(data)
+            return triangles.reshape(-1, 3).astype(np.float64), np.arange(3 * count).reshape(-1, 3)
+    if data.lstrip()[:5].lower() == b'solid':
+        points = np.array(_ASCII_VERTEX.findall(data), dtype=np.float64)
+        if len(points) and len(points) % 3 == 0:
+            return points, np.arange(len(points)).reshape(-1, 3)
+
+    try:
+        import trimesh
+    except ImportError:
+        raise ValueError(f"Unsupported mesh format for {path} (install trimesh for GLB/OBJ/PLY)")
+    mesh = trimesh.load(path, force='mesh')
+    if not len(getattr(mesh, 'faces', ())):
+        raise ValueError(f"No triangles in {path}")
+    return np.asarray(mesh.vertices, dtype=np.float64), np.asarray(mesh.faces, dtype=np.int64)
+
+
+def optimize_mesh_file(source_path: str, output_path: str, target_faces: int,
+                       optimization_level: str = 'standard') -> Dict[str, Any]:
+    """Load, optimize and write a mesh as binary STL (runs inside pool workers)"""
+    start = time.perf_counter()
+    vertices, faces = load_mesh(source_path)
+    load_time = time.perf_counter() - start
+
+    vertices, faces, report = optimize_mesh(vertices, faces, target_faces, optimization_level)
+
+    start = time.perf_counter()
+    write_binary_stl(output_path, vertices, faces, name=os.path.basename(output_path))
+    report['timings'].update({'load': round(load_time, 4), 'write': round(time.perf_counter() - start, 4)})
+    report['output_path'] = output_path
+    return report
+
+
+class MeshOptimizer:
+    """
+    Process pool for mesh optimization
+
+    Decimation is CPU-bound NumPy work that holds the GIL between kernels,
+    so it runs in worker processes rather than threads; the event loop
+    only awaits the result. The pool starts on first use.
+    """
+
+    def __init__(self, workers: int = MESH_OPTIMIZER_WORKERS):
+        self.workers = max(1, workers)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.duration_histogram = Histogram(LATENCY_BUCKETS_MS)
+
+    async def optimize_file(self, source_path: str, output_path: str, target_faces: int,
+                            optimization_level: str = 'standard') -> Dict[str, Any]:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        self._in_flight += 1
+        try:
+            report = await loop.run_in_executor(
+                self._executor, optimize_mesh_file, source_path, output_path, target_faces, optimization_level
+            )
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self._in_flight -= 1
+        self.completed += 1
+        self.duration_histogram.observe((time.perf_counter() - start) * 1000.0)
+        return report
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            'workers': self.workers,
+            'started': self._executor is not None,
+            'in_flight': self._in_flight,
+            'completed': self.completed,
+            'failed': self.failed,
+            'duration_ms': self.duration_histogram.snapshot(),
+        }
@@ -0,0 +1,174 @@
+"""
+Pipeline Instrumentation
+Stage timers, fallback counters and a Prometheus text exporter over HDR latency histograms
+"""
+
+import asyncio
+import functools
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Sequence, Tuple
+
+from .stats import Counter, HdrHistogram
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Quantiles exported for every latency summary
+SUMMARY_QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class MetricFamily:
+    """A named metric with one child (Counter or HdrHistogram) per label combination"""
+
+    def __init__(self, name: str, documentation: str, kind: str,
+                 labelnames: Sequence[str], factory: Callable[[], Any]):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self._factory = factory
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str, **labels: str) -> Any:
+        key = values or tuple(labels[name] for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(key, self._factory())
+        return child
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for key, child in sorted(self._children.items()):
+            if self.kind == 'counter':
+                lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {child.value:g}')
+                continue
+            for q, value in zip(SUMMARY_QUANTILES, child.quantiles(SUMMARY_QUANTILES)):
+                labels = _format_labels(self.labelnames, key, f'quantile="{q:g}"')
+                lines.append(f'{self.name}{labels} ' + (f'{value:.6g}' if value is not None else 'NaN'))
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {child.sum:.6g}')
+            lines.append(f'{self.name}_count{labels} {child.count}')
+        return '\n'.join(lines)
+
+
+class MetricsRegistry:
+    """Metric families rendered together for a /metrics scrape"""
+
+    def __init__(self):
+        self._families: Dict[str, MetricFamily] = {}
+
+    def _register(self, family: MetricFamily) -> MetricFamily:
+        if family.name in self._families:
+            raise ValueError(f"Metric {family.name} already registered")
+        self._families[family.name] = family
+        return family
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> MetricFamily:
+        return self._register(MetricFamily(name, documentation, 'counter', labelnames, Counter))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  highest: float = 3600.0, significant_figures: int = 2) -> MetricFamily:
+        """HDR latency histogram in seconds, exported as a Prometheus summary"""
+        factory = functools.partial(HdrHistogram, highest=highest, significant_figures=significant_figures)
+        return self._register(MetricFamily(name, documentation, 'summary', labelnames, factory))
+
+    def render(self) -> str:
+        """Prometheus text exposition format (0.0.4)"""
+        return '\n'.join(family.render() for family in self._families.values()) + '\n'
+
+
+# Process-wide registry and the pipeline metrics recorded into it
+REGISTRY = MetricsRegistry()
+STAGE_SECONDS = REGISTRY.histogram(
+    'petplantr_stage_duration_seconds', 'Pipeline stage latency in seconds', ('stage', 'outcome')
+)
+FALLBACKS = REGISTRY.counter(
+    'petplantr_fallbacks_total', 'Degraded code paths taken instead of the primary implementation', ('fallback',)
+)
+
+
+def observe_stage(stage: str, seconds: float, outcome: str = 'ok') -> None:
+    STAGE_SECONDS.labels(stage, outcome).observe(seconds)
+
+
+def record_fallback(fallback: str) -> None:
+    FALLBACKS.labels(fallback).inc()
+
+
+def _outcome(exc_type: Any) -> str:
+    if exc_type is None:
+        return 'ok'
+    return 'cancelled' if issubclass(exc_type, asyncio.CancelledError) else 'error'
+
+
+class timed:
+    """
+    Time a pipeline stage into STAGE_SECONDS
+
+    Works as a context manager (``with timed('decode'):``) or as a
+    decorator for sync and async functions (``@timed('flux')``). The
+    outcome label is ok, error or cancelled.
+    """
+
+    __slots__ = ('stage', '_start')
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self._start = 0.0
+
+    def __enter__(self) -> 'timed':
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        observe_stage(self.stage, time.perf_counter() - self._start, _outcome(exc_type))
+        return False
+
+    def __call__(self, fn: Callable) -> Callable:
+        stage = self.stage
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                outcome = 'error'
+                try:
+                    result = await fn(*args, **kwargs)
+                    outcome = 'ok'
+                    return result
+                except asyncio.CancelledError:
+                    outcome = 'cancelled'
+                    raise
+                finally:
+                    observe_stage(stage, time.perf_counter() - start, outcome)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            outcome = 'error'
+            try:
+                result = fn(*args, **kwargs)
+                outcome = 'ok'
+                return result
+            finally:
+                observe_stage(stage, time.perf_counter() - start, outcome)
+        return wrapper
@@ -0,0 +1,160 @@
+"""
+Async Pipeline DAG
+Runs generation stages as soon as their inputs are ready, with per-stage timeouts and timing spans
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence, Tuple
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Marker for stages without a fallback value
+_REQUIRED = object()
+
+
+class PipelineStageError(Exception):
+    """A required stage failed or timed out; the rest of the run was cancelled"""
+
+    def __init__(self, stage: str, cause: BaseException, spans: Dict[str, Dict[str, Any]]):
+        super().__init__(f"stage '{stage}' failed: {cause}")
+        self.stage = stage
+        self.cause = cause
+        self.spans = spans
+
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    One pipeline step
+
+    ``fn`` is awaited with the values named in ``inputs`` as keyword
+    arguments (``params`` maps a parameter name to a different input
+    name) and its return value becomes the output named ``name``.
+    A stage with a ``fallback`` finishes with that value instead of
+    failing the run when it raises or exceeds ``timeout`` seconds.
+    """
+    name: str
+    fn: Callable[..., Awaitable[Any]]
+    inputs: Sequence[str] = ()
+    params: Dict[str, str] = field(default_factory=dict)
+    timeout: Optional[float] = None
+    fallback: Any = _REQUIRED
+
+    @property
+    def required(self) -> bool:
+        return self.fallback is _REQUIRED
+
+
+class PipelineDAG:
+    """
+    Static graph of stages keyed by output name
+
+    The graph is validated once at construction (unknown inputs,
+    duplicate outputs, cycles); ``run`` then starts every stage as a
+    task that waits only for the stages it reads from, so independent
+    branches overlap.
+    """
+
+    def __init__(self, stages: Sequence[Stage], initial: Sequence[str] = ()):
+        self.stages: Dict[str, Stage] = {}
+        for stage in stages:
+            if stage.name in self.stages or stage.name in initial:
+                raise ValueError(f"Duplicate pipeline output '{stage.name}'")
+            self.stages[stage.name] = stage
+        self.initial = tuple(initial)
+
+        for stage in stages:
+            for name in stage.inputs:
+                if name not in self.stages and name not in self.initial:
+                    raise ValueError(f"Stage '{stage.name}' reads unknown input '{name}'")
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> Tuple[str, ...]:
+        order, visiting, done = [], set(), set()
+
+        def visit(name: str) -> None:
+            if name in done or name in self.initial:
+                return
+            if name in visiting:
+                raise ValueError(f"Pipeline cycle through '{name}'")
+            visiting.add(name)
+            for dependency in self.stages[name].inputs:
+                visit(dependency)
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return tuple(order)
+
+    async def run(self, **initial: Any) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+        """
+        Run every stage; returns (outputs, spans)
+
+        Spans map stage name to ``start`` (seconds from the run start),
+        ``duration`` and ``status`` (ok, fallback, timeout, failed or
+        cancelled), in dependency order.
+        Raises PipelineStageError when a stage without a fallback fails.
+        """
+        missing = set(self.initial) - set(initial)
+        if missing:
+            raise ValueError(f"Missing pipeline inputs: {sorted(missing)}")
+
+        origin = time.perf_counter()
+        values: Dict[str, Any] = dict(initial)
+        spans: Dict[str, Dict[str, Any]] = {}
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def execute(stage: Stage) -> Any:
+            dependencies = [tasks[name] for name in stage.inputs if name in tasks]
+            if dependencies:
+                await asyncio.gather(*dependencies)
+            kwargs = {param: values[name] for param, name in stage.params.items()}
+            kwargs.update({name: values[name] for name in stage.inputs if name not in stage.params.values()})
+
+            start = time.perf_counter()
+            status, error = 'ok', None
+            try:
+                result = await asyncio.wait_for(stage.fn(**kwargs), stage.timeout)
+            except asyncio.TimeoutError:
+                status, error = 'timeout', TimeoutError(f"timed out after {stage.timeout}s")
+            except asyncio.CancelledError:
+                status = 'cancelled'
+                raise
+            except Exception as e:
+                status, error = 'failed', e
+            finally:
+                spans[stage.name] = {
+                    'start': round(start - origin, 4),
+                    'duration': round(time.perf_counter() - start, 4),
+                    'status': status,
+                }
+
+            if error is not None:
+                if stage.required:
+                    raise PipelineStageError(stage.name, error, spans)
+                logger.warning(f"Pipeline stage '{stage.name}' {status}, using fallback: {error}")
+                spans[stage.name]['status'] = 'fallback'
+                result = stage.fallback
+            values[stage.name] = result
+            return result
+
+        # Tasks are created in dependency order so every stage finds its inputs' tasks
+        for name in self.order:
+            tasks[name] = asyncio.create_task(execute(self.stages[name]))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+
+        ordered = {name: spans[name] for name in self.order}
+        ordered['total'] = {'start': 0.0, 'duration': round(time.perf_counter() - origin, 4), 'status': 'ok'}
+        return {name: values[name] for name in self.order}, ordered
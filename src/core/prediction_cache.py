@@ -0,0 +1,196 @@
+"""
+Content-Addressed Prediction Cache
+Caches breed predictions keyed by image hash, inference options and model version
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Cache configuration
+CACHE_BACKEND = os.getenv('BREED_CACHE_BACKEND', 'memory')  # memory | redis | none
+CACHE_REDIS_URL = os.getenv('BREED_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+CACHE_TTL = int(os.getenv('BREED_CACHE_TTL', '3600'))
+CACHE_MAX_ENTRIES = int(os.getenv('BREED_CACHE_MAX_ENTRIES', '10000'))
+CACHE_MAX_BYTES = int(os.getenv('BREED_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+
+def image_digest(data: bytes) -> str:
+    """SHA-256 of the decoded (binary) image payload"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class InMemoryCacheBackend:
+    """LRU cache with per-entry TTL and a bounded memory budget"""
+
+    name = 'memory'
+
+    def __init__(self,
+                 max_entries: int = CACHE_MAX_ENTRIES,
+                 max_bytes: int = CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self.evictions = 0
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, payload = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            return None
+
+        self._entries.move_to_end(key)
+        return payload
+
+    async def set(self, key: str, payload: bytes, ttl: int) -> None:
+        if len(payload) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+
+        self._entries[key] = (time.monotonic() + ttl, payload)
+        self._bytes += len(payload)
+
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    async def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    async def close(self) -> None:
+        await self.clear()
+
+    def _remove(self, key: str) -> None:
+        _, payload = self._entries.pop(key)
+        self._bytes -= len(payload)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'evictions': self.evictions,
+        }
+
+
+class RedisCacheBackend:
+    """Redis-compatible backend; memory budget and eviction are server policy"""
+
+    name = 'redis'
+
+    def __init__(self, url: str = CACHE_REDIS_URL, namespace: str = 'petplantr:breed:'):
+        import redis.asyncio as redis  # Optional dependency
+
+        self.url = url
+        self.namespace = namespace
+        self._client = redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._client.get(self.namespace + key)
+
+    async def set(self, key: str, payload: bytes, ttl: int) -> None:
+        await self._client.set(self.namespace + key, payload, ex=ttl)
+
+    async def clear(self) -> None:
+        async for key in self._client.scan_iter(match=self.namespace + '*'):
+            await self._client.delete(key)
+
+    async def close(self) -> None:
+        await self._client.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {'url': self.url, 'namespace': self.namespace}
+
+
+class PredictionCache:
+    """Prediction cache front-end with hit/miss accounting"""
+
+    def __init__(self, backend: Any, ttl: int = CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @staticmethod
+    def make_key(digest: str,
+                 use_tta: bool,
+                 top_k: int,
+                 model_version: str,
+                 confidence_threshold: float = 0.8,
+                 adaptive_tta: bool = False) -> str:
+        """Cache key covering everything that changes the prediction payload"""
+        options = f"tta={int(use_tta)}:adaptive={int(adaptive_tta)}:k={top_k}:thr={confidence_threshold:g}"
+        return f"{model_version}:{options}:{digest}"
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            payload = await self.backend.get(key)
+        except Exception as e:
+            # Cache outages must never fail a detection request
+            self.errors += 1
+            logger.warning(f"Prediction cache lookup failed: {e}")
+            payload = None
+
+        if payload is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return json.loads(payload)
+
+    async def set(self, key: str, result: Dict[str, Any]) -> None:
+        try:
+            payload = json.dumps(result, default=str).encode('utf-8')
+            await self.backend.set(key, payload, self.ttl)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Prediction cache store failed: {e}")
+
+    async def clear(self) -> None:
+        await self.backend.clear()
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'backend': self.backend.name,
+            'hits': self.hits,
+            'misses': self.misses,
+            'errors': self.errors,
+            'hit_rate': (self.hits / lookups) if lookups else 0.0,
+            'ttl': self.ttl,
+            **self.backend.stats(),
+        }
+
+
+def create_prediction_cache(backend: str = CACHE_BACKEND) -> Optional[PredictionCache]:
+    """Build the configured cache, falling back to in-process storage"""
+    if backend == 'none':
+        return None
+
+    if backend == 'redis':
+        try:
+            return PredictionCache(RedisCacheBackend())
+        except ImportError:
+            logger.warning("redis package not installed, using in-memory prediction cache")
+
+    return PredictionCache(InMemoryCacheBackend())
@@ -0,0 +1,225 @@
+"""
+Shared Memory-Mapped Model Weights
+Lets every serving worker map one read-only safetensors checkpoint instead of holding a private copy
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import struct
+import time
+import warnings
+from typing import Any, Dict, Optional
+
+import numpy as np
+import torch
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Shared checkpoint configuration
+SHARED_WEIGHTS_PATH = os.getenv('BREED_SHARED_WEIGHTS')  # Disabled when unset
+EXPORT_WAIT_SECONDS = float(os.getenv('BREED_SHARED_WEIGHTS_WAIT', '120'))
+
+# safetensors dtype codes <-> torch dtypes. bfloat16 has no numpy
+# equivalent, so it is mapped through int16 and reinterpreted.
+_TORCH_TO_SAFETENSORS = {
+    torch.float32: 'F32', torch.float16: 'F16', torch.bfloat16: 'BF16', torch.float64: 'F64',
+    torch.int64: 'I64', torch.int32: 'I32', torch.int16: 'I16', torch.int8: 'I8',
+    torch.uint8: 'U8', torch.bool: 'BOOL',
+}
+_SAFETENSORS_TO_NUMPY = {
+    'F32': np.float32, 'F16': np.float16, 'BF16': np.int16, 'F64': np.float64,
+    'I64': np.int64, 'I32': np.int32, 'I16': np.int16, 'I8': np.int8,
+    'U8': np.uint8, 'BOOL': np.bool_,
+}
+
+
+def state_dict_digest(state_dict: Dict[str, torch.Tensor]) -> str:
+    """SHA-256 over tensor names, dtypes, shapes and values (changes whenever the weights do)"""
+    digest = hashlib.sha256()
+    for name, tensor in sorted(state_dict.items()):
+        tensor = tensor.detach().cpu().contiguous()
+        digest.update(f"{name}:{tensor.dtype}:{tuple(tensor.shape)};".encode('utf-8'))
+        if tensor.dtype == torch.bfloat16:
+            tensor = tensor.view(torch.int16)
+        digest.update(tensor.numpy().tobytes())
+    return digest.hexdigest()
+
+
+def read_safetensors_metadata(path: str) -> Dict[str, str]:
+    """The free-form ``__metadata__`` section of a safetensors header"""
+    with open(path, 'rb') as f:
+        (header_size,) = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(header_size))
+    return header.get('__metadata__') or {}
+
+
+def save_safetensors(state_dict: Dict[str, torch.Tensor], path: str,
+                     metadata: Optional[Dict[str, str]] = None) -> None:
+    """Write a state dict in the safetensors layout (atomically, via rename)"""
+    header: Dict[str, Any] = {}
+    if metadata:
+        header['__metadata__'] = {key: str(value) for key, value in metadata.items()}
+    arrays = []
+    offset = 0
+    for name, tensor in state_dict.items():
+        tensor = tensor.detach().cpu().contiguous()
+        dtype = _TORCH_TO_SAFETENSORS[tensor.dtype]
+        if tensor.dtype == torch.bfloat16:
+            tensor = tensor.view(torch.int16)
+        array = tensor.numpy()
+        header[name] = {
+            'dtype': dtype,
+            'shape': list(array.shape),
+            'data_offsets': [offset, offset + array.nbytes],
+        }
+        arrays.append(array)
+        offset += array.nbytes
+
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    header_bytes += b' ' * (-len(header_bytes) % 8)  # Keep the data section 8-byte aligned
+
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for array in arrays:
+            f.write(array.tobytes())
+    os.replace(tmp_path, path)
+
+
+def map_safetensors(path: str) -> Dict[str, torch.Tensor]:
+    """
+    Map a safetensors file read-only; tensors share the OS page cache
+
+    The returned tensors are views over a read-only mapping and must not
+    be written to.
+    """
+    with open(path, 'rb') as f:
+        (header_size,) = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(header_size))
+    header.pop('__metadata__', None)
+
+    data_start = 8 + header_size
+    tensors: Dict[str, torch.Tensor] = {}
+    with warnings.catch_warnings():
+        # torch warns that read-only numpy arrays are not writable
+        warnings.simplefilter('ignore', UserWarning)
+        for name, info in header.items():
+            begin, end = info['data_offsets']
+            np_dtype = _SAFETENSORS_TO_NUMPY[info['dtype']]
+            shape = tuple(info['shape'])
+            if end == begin:
+                array = np.zeros(shape, dtype=np_dtype)
+            else:
+                array = np.memmap(path, dtype=np_dtype, mode='r', offset=data_start + begin, shape=shape)
+            tensor = torch.from_numpy(array)
+            if info['dtype'] == 'BF16':
+                tensor = tensor.view(torch.bfloat16)
+            tensors[name] = tensor
+    return tensors
+
+
+def attach_shared_weights(module: torch.nn.Module, path: str) -> int:
+    """
+    Point a module's parameters and buffers at a mapped checkpoint
+
+    The module's private weight copies are released once they are no
+    longer referenced, leaving only the shared mapping. Returns the number
+    of bytes now served from the mapping. Only CPU modules can be
+    attached; the mapping lives in host memory.
+    """
+    if any(t.device.type != 'cpu' for t in module.state_dict().values()):
+        raise ValueError("Shared weights can only back a CPU module")
+    mapped = map_safetensors(path)
+    module.load_state_dict(mapped, strict=True, assign=True)
+    module.eval()
+    for parameter in module.parameters():
+        parameter.requires_grad_(False)
+    return sum(t.numel() * t.element_size() for t in mapped.values())
+
+
+def _checkpoint_digest(path: str) -> Optional[str]:
+    try:
+        return read_safetensors_metadata(path).get('sha256')
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def ensure_shared_weights(module: torch.nn.Module,
+                          path: str,
+                          wait_seconds: float = EXPORT_WAIT_SECONDS) -> Optional[int]:
+    """
+    Export the checkpoint once across all workers, then map it
+
+    The checkpoint records the SHA-256 of the weights it was exported
+    from; a file from an older model (e.g. before the LoRA head was
+    retrained) does not match the freshly loaded module and is exported
+    again. The worker holding an ``flock`` on ``<path>.lock`` writes it;
+    the others wait for a matching file. The kernel drops the lock if
+    the exporter dies, so the next waiter takes over instead of waiting
+    on a stale lock file. Returns the mapped byte count, or None when
+    the module is not on CPU or no matching checkpoint appeared in
+    ``wait_seconds`` (the module keeps its private weights).
+    """
+    state_dict = module.state_dict()
+    if any(t.device.type != 'cpu' for t in state_dict.values()):
+        logger.info("Model is not on CPU, skipping shared weights")
+        return None
+
+    digest = state_dict_digest(state_dict)
+    if _checkpoint_digest(path) != digest:
+        with open(f"{path}.lock", 'a') as lock:
+            deadline = time.monotonic() + wait_seconds
+            while _checkpoint_digest(path) != digest and time.monotonic() < deadline:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    time.sleep(0.5)  # Another worker is exporting
+                    continue
+                try:
+                    if _checkpoint_digest(path) != digest:
+                        logger.info(f"Exporting shared model weights to {path}")
+                        save_safetensors(state_dict, path, metadata={'sha256': digest})
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    if _checkpoint_digest(path) != digest:
+        logger.warning(f"Shared weights {path} not available for this model, keeping private copy")
+        return None
+
+    return attach_shared_weights(module, path)
+
+
+def process_memory() -> Dict[str, int]:
+    """Resident memory split into anonymous (private) and file-backed (shared) pages"""
+    usage = {}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('VmRSS', 'RssAnon', 'RssFile'):
+                    usage[key] = int(value.split()[0]) * 1024
+    except OSError:
+        pass
+    return usage
+
+
+if __name__ == '__main__':
+    import argparse
+    import asyncio
+
+    parser = argparse.ArgumentParser(description="Export breed model weights for shared serving")
+    parser.add_argument('output', help="Destination .safetensors path")
+    args = parser.parse_args()
+
+    from .inference import BreedInferenceEngine
+
+    engine = BreedInferenceEngine()
+    asyncio.run(engine.load_model())
+    state_dict = engine.model.state_dict()
+    save_safetensors(state_dict, args.output, metadata={'sha256': state_dict_digest(state_dict)})
+    print(f"Wrote {args.output} ({os.path.getsize(args.output) / 1e6:.1f} MB)")
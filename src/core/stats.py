@@ -0,0 +1,201 @@
+"""
+Lightweight Serving Statistics
+Thread-safe histograms and counters for tuning latency-sensitive paths
+"""
+
+import bisect
+import math
+import threading
+from typing import Dict, List, Optional, Sequence, Any
+
+
+# Default bucket bounds for millisecond latencies (upper bounds, inclusive)
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class Histogram:
+    """Fixed-bucket histogram with count, sum and approximate quantiles"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets: List[float] = sorted(float(b) for b in buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        """Record a single observation"""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+            if value > self._max:
+                self._max = value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Approximate quantile using the upper bound of the matching bucket"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+            maximum = self._max
+        if total == 0:
+            return None
+
+        rank = q * total
+        cumulative = 0
+        for index, count in enumerate(counts):
+            cumulative += count
+            if cumulative >= rank and count:
+                return min(self.buckets[index], maximum) if index < len(self.buckets) else maximum
+        return maximum
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Serializable view of the histogram"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+            total_sum = self._sum
+            maximum = self._max
+
+        labels = [f"le_{b:g}" for b in self.buckets] + ["le_inf"]
+        return {
+            'count': total,
+            'mean': (total_sum / total) if total else 0.0,
+            'max': maximum,
+            'p50': self.quantile(0.50),
+            'p90': self.quantile(0.90),
+            'p99': self.quantile(0.99),
+            'buckets': dict(zip(labels, counts)),
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts = [0] * (len(self.buckets) + 1)
+            self._sum = 0.0
+            self._count = 0
+            self._max = 0.0
+
+
+class HdrHistogram:
+    """
+    Log-linear (HDR-style) histogram with bounded relative error
+
+    Values are recorded as integer multiples of ``unit`` up to ``highest``.
+    Every power-of-two range is split into linear sub-buckets so any
+    recorded value is reproduced within ``10 ** -significant_figures``
+    relative error, from microseconds to hours, at a fixed cost per
+    observation (a bit_length and a shift, no search).
+    """
+
+    def __init__(self, highest: float = 3600.0, unit: float = 1e-6, significant_figures: int = 2):
+        self.unit = unit
+        self._sub_bits = math.ceil(math.log2(2 * 10 ** significant_figures))
+        self._sub_count = 1 << self._sub_bits
+        self._half = self._sub_count >> 1
+        self._highest = max(int(highest / unit), self._sub_count)
+        self._counts = [0] * (self._index(self._highest) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def _index(self, value: int) -> int:
+        if value < self._sub_count:
+            return value
+        shift = value.bit_length() - self._sub_bits
+        return self._sub_count + (shift - 1) * self._half + (value >> shift) - self._half
+
+    def _upper(self, index: int) -> int:
+        """Highest value counted in a bucket"""
+        if index < self._sub_count:
+            return index
+        shift, sub = divmod(index - self._sub_count, self._half)
+        return ((sub + self._half + 1) << (shift + 1)) - 1
+
+    def observe(self, value: float) -> None:
+        """Record a single observation (clamped to [0, highest])"""
+        index = self._index(min(max(int(value / self.unit), 0), self._highest))
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+            if value > self._max:
+                self._max = value
+
+    def quantiles(self, qs: Sequence[float]) -> List[Optional[float]]:
+        """Approximate quantiles, in ascending order of ``qs``, in one pass over the buckets"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+            maximum = self._max
+        if total == 0:
+            return [None] * len(qs)
+
+        results = []
+        pending = iter(sorted(qs))
+        q = next(pending, None)
+        cumulative = 0
+        for index, count in enumerate(counts):
+            if not count:
+                continue
+            cumulative += count
+            while q is not None and cumulative >= q * total:
+                results.append(min(self._upper(index) * self.unit, maximum))
+                q = next(pending, None)
+            if q is None:
+                break
+        results.extend([maximum] * (len(qs) - len(results)))
+        return results
+
+    def quantile(self, q: float) -> Optional[float]:
+        return self.quantiles([q])[0]
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Serializable view of the histogram"""
+        p50, p90, p99, p999 = self.quantiles([0.50, 0.90, 0.99, 0.999])
+        with self._lock:
+            total = self._count
+            total_sum = self._sum
+            maximum = self._max
+        return {
+            'count': total,
+            'mean': (total_sum / total) if total else 0.0,
+            'max': maximum,
+            'p50': p50,
+            'p90': p90,
+            'p99': p99,
+            'p999': p999,
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts = [0] * len(self._counts)
+            self._sum = 0.0
+            self._count = 0
+            self._max = 0.0
+
+
+class Counter:
+    """Monotonic counter"""
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
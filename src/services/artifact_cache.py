@@ -0,0 +1,163 @@
+"""
+Content-Addressed Artifact Cache
+Reuses generated STL/GLB files for identical photos and generation parameters, with LRU size bounding of temp_outputs
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Cache configuration
+OUTPUT_DIR = os.getenv('OUTPUT_DIR', 'temp_outputs')
+ARTIFACT_CACHE_DIR = os.getenv('ARTIFACT_CACHE_DIR', os.path.join(OUTPUT_DIR, 'artifacts'))
+ARTIFACT_CACHE_MAX_BYTES = int(os.getenv('ARTIFACT_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))
+ARTIFACT_CACHE_ENABLED = os.getenv('ARTIFACT_CACHE_ENABLED', 'true').lower() == 'true'
+ARTIFACT_VERSION = 1  # Bump when pipeline output changes for the same inputs
+
+
+def artifact_key(content_sha256: str, **params: Any) -> str:
+    """Key for an input image digest plus normalized generation parameters"""
+    normalized = {
+        name: value.strip().lower() if isinstance(value, str) else value
+        for name, value in sorted(params.items())
+    }
+    material = json.dumps({'v': ARTIFACT_VERSION, 'image': content_sha256, 'params': normalized}, sort_keys=True)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+def _link(source: str, destination: str) -> None:
+    """Hardlink ``source`` to ``destination``, copying if links are unsupported"""
+    try:
+        os.link(source, destination)
+    except FileExistsError:
+        os.unlink(destination)
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+class ArtifactCache:
+    """
+    Generated mesh files keyed by ``artifact_key``
+
+    Cache entries and job outputs are hardlinks to the same inode, so a
+    hit costs one ``link`` call and no extra disk; the filesystem's link
+    count is the refcount. ``evict`` bounds everything under
+    ``output_dir`` by counting each inode once and deleting the least
+    recently used ones (every link, cache entry and job output alike).
+    """
+
+    def __init__(self,
+                 cache_dir: str = ARTIFACT_CACHE_DIR,
+                 output_dir: str = OUTPUT_DIR,
+                 max_bytes: int = ARTIFACT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.output_dir = output_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+
+    def _paths(self, key: str, suffix: str) -> Tuple[str, str]:
+        return os.path.join(self.cache_dir, f"{key}{suffix}"), os.path.join(self.cache_dir, f"{key}.json")
+
+    def lookup(self, key: str, destination: str, suffix: str = '.stl') -> Optional[Dict[str, Any]]:
+        """Link a cached artifact to ``destination``; returns its metadata, or None on a miss"""
+        artifact_path, meta_path = self._paths(key, suffix)
+        try:
+            with open(meta_path) as f:
+                metadata = json.load(f)
+            _link(artifact_path, destination)
+        except (FileNotFoundError, ValueError):
+            self.misses += 1
+            return None
+
+        now = time.time()
+        os.utime(artifact_path, (now, now))  # LRU recency
+        self.hits += 1
+        return metadata
+
+    def store(self, key: str, source: str, metadata: Dict[str, Any], suffix: str = '.stl') -> None:
+        """Add a finished artifact (linked, not copied) and enforce the size bound"""
+        artifact_path, meta_path = self._paths(key, suffix)
+        try:
+            _link(source, artifact_path)
+            tmp_path = f"{meta_path}.tmp.{os.getpid()}"
+            with open(tmp_path, 'w') as f:
+                json.dump(metadata, f, default=str)
+            os.replace(tmp_path, meta_path)
+            self.stores += 1
+        except OSError as e:
+            logger.warning(f"Failed to cache artifact {key}: {e}")
+            return
+        self.evict()
+
+    def _inodes(self) -> Tuple[Dict[Tuple[int, int], List[str]], Dict[Tuple[int, int], Tuple[float, int]]]:
+        paths: Dict[Tuple[int, int], List[str]] = {}
+        info: Dict[Tuple[int, int], Tuple[float, int]] = {}
+        for root, _, files in os.walk(self.output_dir):
+            for name in files:
+                if name.endswith('.json') and root == self.cache_dir:
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                inode = (st.st_dev, st.st_ino)
+                paths.setdefault(inode, []).append(path)
+                info[inode] = (max(st.st_mtime, info.get(inode, (0.0, 0))[0]), st.st_size)
+        return paths, info
+
+    def evict(self) -> int:
+        """Delete least recently used files until ``output_dir`` fits ``max_bytes``; returns bytes freed"""
+        with self._lock:
+            paths, info = self._inodes()
+            total = sum(size for _, size in info.values())
+            freed = 0
+            for inode in sorted(info, key=lambda i: info[i][0]):
+                if total - freed <= self.max_bytes:
+                    break
+                for path in paths[inode]:
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+                    if os.path.dirname(path) == self.cache_dir:
+                        try:
+                            os.unlink(os.path.splitext(path)[0] + '.json')
+                        except FileNotFoundError:
+                            pass
+                    self.evicted_files += 1
+                freed += info[inode][1]
+            self.evicted_bytes += freed
+            return freed
+
+    def get_metrics(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits / lookups) if lookups else 0.0,
+            'stores': self.stores,
+            'max_bytes': self.max_bytes,
+            'evicted_files': self.evicted_files,
+            'evicted_bytes': self.evicted_bytes,
+        }
+
+
+def create_artifact_cache() -> Optional[ArtifactCache]:
+    """Build the artifact cache unless disabled with ARTIFACT_CACHE_ENABLED=false"""
+    return ArtifactCache() if ARTIFACT_CACHE_ENABLED else None
@@ -0,0 +1,293 @@
+"""
+Token Authentication
+RS256 JWT verification against a JWKS document (Clerk-style), with rotation-aware key caching and a verified-token LRU
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import aiohttp
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Auth configuration
+AUTH_JWKS_URL = os.getenv('AUTH_JWKS_URL')  # e.g. https://<clerk-frontend-api>/.well-known/jwks.json
+AUTH_JWKS_PATH = os.getenv('AUTH_JWKS_PATH')  # Local JWKS file (tests, air-gapped deployments)
+AUTH_ISSUER = os.getenv('AUTH_ISSUER')
+AUTH_AUDIENCE = os.getenv('AUTH_AUDIENCE')
+AUTH_AUTHORIZED_PARTIES = [party for party in os.getenv('AUTH_AUTHORIZED_PARTIES', '').split(',') if party]
+AUTH_LEEWAY = float(os.getenv('AUTH_LEEWAY', '30'))
+AUTH_JWKS_TTL = float(os.getenv('AUTH_JWKS_TTL', '3600'))  # Used when the endpoint sends no max-age
+AUTH_JWKS_MIN_REFRESH = float(os.getenv('AUTH_JWKS_MIN_REFRESH', '30'))  # Unknown-kid refetch throttle
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', '10000'))
+
+# ASN.1 DigestInfo prefix for SHA-256 in PKCS#1 v1.5 signatures (RFC 8017, section 9.2)
+_SHA256_DIGEST_INFO = bytes.fromhex('3031300d060960864801650304020105000420')
+
+
+class AuthError(Exception):
+    """A token that must be rejected; the message says why"""
+
+
+def b64url_decode(segment: str) -> bytes:
+    try:
+        return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+    except (ValueError, TypeError):
+        raise AuthError("Malformed token encoding") from None
+
+
+class RSAPublicKey:
+    """RSA public key from a JWK, verifying RS256 (PKCS#1 v1.5 + SHA-256) signatures"""
+
+    def __init__(self, n: int, e: int, kid: Optional[str] = None):
+        self.n = n
+        self.e = e
+        self.kid = kid
+        self.size = (n.bit_length() + 7) // 8
+
+    @classmethod
+    def from_jwk(cls, jwk: Dict[str, Any]) -> 'RSAPublicKey':
+        if jwk.get('kty') != 'RSA':
+            raise ValueError(f"Unsupported key type {jwk.get('kty')!r}")
+        n = int.from_bytes(b64url_decode(jwk['n']), 'big')
+        e = int.from_bytes(b64url_decode(jwk['e']), 'big')
+        if n.bit_length() < 2048:
+            raise ValueError("RSA keys shorter than 2048 bits are not accepted")
+        return cls(n, e, jwk.get('kid'))
+
+    def verify(self, message: bytes, signature: bytes) -> bool:
+        if len(signature) != self.size:
+            return False
+        value = int.from_bytes(signature, 'big')
+        if value >= self.n:
+            return False
+        encoded = pow(value, self.e, self.n).to_bytes(self.size, 'big')
+        digest_info = _SHA256_DIGEST_INFO + hashlib.sha256(message).digest()
+        padding = self.size - len(digest_info) - 3
+        expected = b'\x00\x01' + b'\xff' * padding + b'\x00' + digest_info
+        return padding >= 8 and hmac.compare_digest(encoded, expected)
+
+
+class JWKSCache:
+    """
+    Signing keys from a JWKS file or URL, cached for their rotation TTL
+
+    Keys are refetched when the TTL (the endpoint's ``Cache-Control:
+    max-age`` if given) lapses, or when a token names an unknown ``kid``
+    (a rotation), throttled to once per ``min_refresh`` seconds so bogus
+    kids cannot make us hammer the endpoint. Concurrent refreshes share
+    one fetch.
+    """
+
+    def __init__(self,
+                 url: Optional[str] = None,
+                 path: Optional[str] = None,
+                 session_factory: Optional[Callable[[], aiohttp.ClientSession]] = None,
+                 ttl: float = AUTH_JWKS_TTL,
+                 min_refresh: float = AUTH_JWKS_MIN_REFRESH):
+        if not (url or path):
+            raise ValueError("JWKS needs a URL or a file path")
+        self.url = url
+        self.path = path
+        self.session_factory = session_factory
+        self.ttl = ttl
+        self.min_refresh = min_refresh
+        self._keys: Dict[str, RSAPublicKey] = {}
+        self._expires_at = 0.0
+        self._fetched_at = float('-inf')
+        self._lock = asyncio.Lock()
+        self.refreshes = 0
+
+    async def get_key(self, kid: Optional[str]) -> RSAPublicKey:
+        now = time.monotonic()
+        if now >= self._expires_at or (kid not in self._keys and now - self._fetched_at >= self.min_refresh):
+            await self.refresh()
+
+        if kid is None and len(self._keys) == 1:
+            return next(iter(self._keys.values()))
+        key = self._keys.get(kid)
+        if key is None:
+            raise AuthError(f"Unknown signing key {kid!r}")
+        return key
+
+    async def refresh(self) -> None:
+        fetched_at = self._fetched_at
+        async with self._lock:
+            if self._fetched_at != fetched_at:
+                return  # Another request refreshed while we waited
+            try:
+                document, ttl = await self._load()
+            except Exception as e:
+                self._fetched_at = time.monotonic()
+                if self._keys:
+                    logger.warning(f"JWKS refresh failed, keeping {len(self._keys)} cached keys: {e}")
+                    return
+                raise AuthError(f"Signing keys unavailable: {e}") from None
+
+            keys = {}
+            for jwk in document.get('keys', []):
+                if jwk.get('use', 'sig') != 'sig' or jwk.get('alg', 'RS256') != 'RS256':
+                    continue
+                try:
+                    key = RSAPublicKey.from_jwk(jwk)
+                except (KeyError, ValueError, AuthError) as e:
+                    logger.warning(f"Skipping JWK {jwk.get('kid')!r}: {e}")
+                    continue
+                keys[key.kid] = key
+
+            self._keys = keys
+            self._fetched_at = time.monotonic()
+            self._expires_at = self._fetched_at + ttl
+            self.refreshes += 1
+            logger.info(f"Loaded {len(keys)} JWKS signing keys (refresh in {ttl:.0f}s)")
+
+    async def _load(self) -> Tuple[Dict[str, Any], float]:
+        if self.path:
+            with open(self.path) as f:
+                return json.load(f), self.ttl
+
+        session = self.session_factory() if self.session_factory else None
+        owned = session is None
+        if owned:
+            session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+        try:
+            async with session.get(self.url) as response:
+                if response.status != 200:
+                    raise RuntimeError(f"JWKS endpoint returned {response.status}")
+                document = await response.json(content_type=None)
+                max_age = re.search(r'max-age=(\d+)', response.headers.get('Cache-Control', ''))
+                return document, float(max_age.group(1)) if max_age else self.ttl
+        finally:
+            if owned:
+                await session.close()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            'source': self.path or self.url,
+            'keys': sorted(kid or '' for kid in self._keys),
+            'refreshes': self.refreshes,
+            'expires_in': max(0.0, self._expires_at - time.monotonic()),
+        }
+
+
+class TokenVerifier:
+    """
+    Verifies RS256 JWTs and remembers the ones that passed
+
+    A verified token is cached (LRU, ``cache_size`` entries) until its
+    ``exp``, so repeat requests from the same session (status polls,
+    downloads) cost one dict lookup instead of a signature check.
+    Claims checked: ``exp``/``nbf`` (with ``leeway``), and ``iss``,
+    ``aud`` and Clerk's ``azp`` when configured.
+    """
+
+    def __init__(self,
+                 jwks: JWKSCache,
+                 issuer: Optional[str] = AUTH_ISSUER,
+                 audience: Optional[str] = AUTH_AUDIENCE,
+                 authorized_parties: Optional[list] = None,
+                 leeway: float = AUTH_LEEWAY,
+                 cache_size: int = AUTH_TOKEN_CACHE_SIZE):
+        self.jwks = jwks
+        self.issuer = issuer
+        self.audience = audience
+        self.authorized_parties = authorized_parties if authorized_parties is not None else AUTH_AUTHORIZED_PARTIES
+        self.leeway = leeway
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.cache_hits = 0
+        self.verified = 0
+        self.rejected = 0
+
+    async def verify(self, token: str) -> Dict[str, Any]:
+        """Claims of a valid token; raises AuthError otherwise"""
+        now = time.time()
+        cached = self._cache.get(token)
+        if cached is not None:
+            expires_at, claims = cached
+            if now < expires_at:
+                self._cache.move_to_end(token)
+                self.cache_hits += 1
+                return claims
+            del self._cache[token]
+
+        try:
+            claims = await self._verify(token, now)
+        except AuthError:
+            self.rejected += 1
+            raise
+
+        self.verified += 1
+        self._cache[token] = (claims['exp'] + self.leeway, claims)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return claims
+
+    async def _verify(self, token: str, now: float) -> Dict[str, Any]:
+        parts = token.split('.')
+        if len(parts) != 3:
+            raise AuthError("Token is not a JWT")
+        try:
+            header = json.loads(b64url_decode(parts[0]))
+            claims = json.loads(b64url_decode(parts[1]))
+        except ValueError:
+            raise AuthError("Malformed token") from None
+        if not isinstance(header, dict) or not isinstance(claims, dict):
+            raise AuthError("Malformed token")
+
+        # Only RS256: never let the token pick "none" or an HMAC algorithm
+        if header.get('alg') != 'RS256':
+            raise AuthError(f"Unsupported algorithm {header.get('alg')!r}")
+        key = await self.jwks.get_key(header.get('kid'))
+        if not key.verify(f"{parts[0]}.{parts[1]}".encode('ascii'), b64url_decode(parts[2])):
+            raise AuthError("Invalid signature")
+
+        if not isinstance(claims.get('exp'), (int, float)):
+            raise AuthError("Token has no expiry")
+        if now > claims['exp'] + self.leeway:
+            raise AuthError("Token expired")
+        if isinstance(claims.get('nbf'), (int, float)) and now < claims['nbf'] - self.leeway:
+            raise AuthError("Token not yet valid")
+        if self.issuer and claims.get('iss') != self.issuer:
+            raise AuthError("Unexpected issuer")
+        if self.audience:
+            audience = claims.get('aud')
+            if self.audience not in (audience if isinstance(audience, list) else [audience]):
+                raise AuthError("Unexpected audience")
+        if self.authorized_parties and claims.get('azp') and claims['azp'] not in self.authorized_parties:
+            raise AuthError("Unexpected authorized party")
+        if not claims.get('sub'):
+            raise AuthError("Token has no subject")
+        return claims
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            'cached_tokens': len(self._cache),
+            'cache_hits': self.cache_hits,
+            'verified': self.verified,
+            'rejected': self.rejected,
+            'jwks': self.jwks.get_metrics(),
+        }
+
+
+def user_from_claims(claims: Dict[str, Any]) -> Dict[str, Any]:
+    """The user dict routes expect, from verified token claims"""
+    metadata = claims.get('public_metadata') or claims.get('metadata') or {}
+    return {"user_id": claims['sub'], "plan": claims.get('plan') or metadata.get('plan') or 'default'}
+
+
+def create_token_verifier(session_factory: Optional[Callable[[], aiohttp.ClientSession]] = None) -> Optional[TokenVerifier]:
+    """Verifier for the configured JWKS, or None when neither AUTH_JWKS_PATH nor AUTH_JWKS_URL is set"""
+    if not (AUTH_JWKS_PATH or AUTH_JWKS_URL):
+        return None
+    return TokenVerifier(JWKSCache(url=AUTH_JWKS_URL, path=AUTH_JWKS_PATH, session_factory=session_factory))
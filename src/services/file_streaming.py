@@ -0,0 +1,143 @@
+"""
+Streaming File Downloads
+Chunked file responses with single HTTP Range support and on-the-fly gzip/deflate
+"""
+
+import logging
+import os
+import zlib
+from typing import Iterator, Mapping, Optional, Tuple
+
+from fastapi.responses import Response, StreamingResponse
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Download configuration
+DOWNLOAD_CHUNK_SIZE = int(os.getenv('DOWNLOAD_CHUNK_SIZE', str(64 * 1024)))
+COMPRESS_MIN_BYTES = int(os.getenv('DOWNLOAD_COMPRESS_MIN_BYTES', str(256 * 1024)))
+COMPRESS_LEVEL = int(os.getenv('DOWNLOAD_COMPRESS_LEVEL', '6'))
+
+# zlib window bits per Content-Encoding
+ENCODING_WBITS = {'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+
+
+class RangeNotSatisfiable(ValueError):
+    """Range header that selects no bytes of the file"""
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Inclusive (start, end) for a ``Range: bytes=...`` header, or None to send the whole file
+
+    Only single ranges are honoured; multi-range and non-byte units are
+    ignored, which RFC 9110 permits.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, sep, last = header[len('bytes='):].strip().partition('-')
+    if not sep:
+        return None
+    try:
+        if not first:
+            length = int(last)
+            if length <= 0:
+                raise RangeNotSatisfiable(header)
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        raise RangeNotSatisfiable(header)
+    return start, min(end, size - 1)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Preferred supported Content-Encoding from an Accept-Encoding header"""
+    if not accept_encoding:
+        return None
+    offered = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        offered[coding.strip().lower()] = quality
+    candidates = [(offered.get(coding, offered.get('*', 0.0)), coding) for coding in ENCODING_WBITS]
+    quality, coding = max(candidates, key=lambda candidate: candidate[0])
+    return coding if quality > 0 else None
+
+
+def iter_file(path: str, start: int = 0, end: Optional[int] = None,
+              chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> Iterator[bytes]:
+    """Bytes ``start``..``end`` (inclusive) of a file in chunks"""
+    remaining = (os.path.getsize(path) if end is None else end + 1) - start
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def iter_compressed(path: str, encoding: str, level: int = COMPRESS_LEVEL,
+                    chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> Iterator[bytes]:
+    """A file compressed chunk by chunk, never holding more than one chunk"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, ENCODING_WBITS[encoding])
+    for chunk in iter_file(path, chunk_size=chunk_size):
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def file_download(path: str,
+                  headers: Mapping[str, str],
+                  media_type: str = 'application/octet-stream',
+                  filename: Optional[str] = None,
+                  compress_min_bytes: int = COMPRESS_MIN_BYTES) -> Response:
+    """
+    Streaming response for a file honouring Range, If-Range and Accept-Encoding
+
+    Range requests are served from the identity encoding. Whole-file
+    responses at least ``compress_min_bytes`` long are compressed when the
+    client accepts gzip or deflate.
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+    response_headers = {'Accept-Ranges': 'bytes', 'ETag': etag, 'Vary': 'Accept-Encoding'}
+    if filename:
+        response_headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+
+    range_header = headers.get('range')
+    if_range = headers.get('if-range')
+    if if_range and if_range != etag:
+        range_header = None  # File changed since the client's partial copy
+
+    try:
+        byte_range = parse_range(range_header, size)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={**response_headers, 'Content-Range': f'bytes */{size}'})
+
+    if byte_range is not None:
+        start, end = byte_range
+        response_headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response_headers['Content-Length'] = str(end - start + 1)
+        return StreamingResponse(iter_file(path, start, end), status_code=206,
+                                 media_type=media_type, headers=response_headers)
+
+    encoding = negotiate_encoding(headers.get('accept-encoding')) if size >= compress_min_bytes else None
+    if encoding:
+        response_headers['Content-Encoding'] = encoding
+        return StreamingResponse(iter_compressed(path, encoding), media_type=media_type, headers=response_headers)
+
+    response_headers['Content-Length'] = str(size)
+    return StreamingResponse(iter_file(path), media_type=media_type, headers=response_headers)
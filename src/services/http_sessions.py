@@ -0,0 +1,145 @@
+"""
+Upstream HTTP Session Pool
+One pooled aiohttp session per upstream (AWS Lambda, Replicate, image hosts)
+"""
+
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Pool configuration
+DNS_CACHE_TTL = int(os.getenv('UPSTREAM_DNS_CACHE_TTL', '300'))
+KEEPALIVE_TIMEOUT = float(os.getenv('UPSTREAM_KEEPALIVE_TIMEOUT', '30'))
+
+
+@dataclass(frozen=True)
+class UpstreamConfig:
+    """Connection limits and timeouts for one upstream"""
+    limit: int
+    limit_per_host: int
+    total_timeout: float
+    connect_timeout: float
+    read_timeout: float
+
+
+UPSTREAMS: Dict[str, UpstreamConfig] = {
+    'lambda': UpstreamConfig(limit=50, limit_per_host=50, total_timeout=30, connect_timeout=5, read_timeout=25),
+    'replicate': UpstreamConfig(limit=50, limit_per_host=50, total_timeout=60, connect_timeout=5, read_timeout=30),
+    'images': UpstreamConfig(limit=100, limit_per_host=10, total_timeout=15, connect_timeout=5, read_timeout=10),
+    # Generated meshes (up to MAX_MESH_SIZE) downloaded for optimization, within OPTIMIZE_STAGE_TIMEOUT
+    'meshes': UpstreamConfig(limit=20, limit_per_host=10, total_timeout=180, connect_timeout=5, read_timeout=60),
+    'auth': UpstreamConfig(limit=10, limit_per_host=10, total_timeout=10, connect_timeout=5, read_timeout=5),
+}
+
+
+class _ConnectionStats:
+    """Counters fed by aiohttp tracing hooks"""
+
+    def __init__(self):
+        self.requests = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.dns_cache_hits = 0
+        self.dns_cache_misses = 0
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx, params):
+            self.requests += 1
+
+        async def on_connection_create_end(session, ctx, params):
+            self.connections_created += 1
+
+        async def on_connection_reuseconn(session, ctx, params):
+            self.connections_reused += 1
+
+        async def on_dns_cache_hit(session, ctx, params):
+            self.dns_cache_hits += 1
+
+        async def on_dns_cache_miss(session, ctx, params):
+            self.dns_cache_misses += 1
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_connection_create_end.append(on_connection_create_end)
+        trace.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace.on_dns_cache_miss.append(on_dns_cache_miss)
+        return trace
+
+    def snapshot(self) -> Dict[str, Any]:
+        acquired = self.connections_created + self.connections_reused
+        return {
+            'requests': self.requests,
+            'connections_created': self.connections_created,
+            'connections_reused': self.connections_reused,
+            'reuse_ratio': (self.connections_reused / acquired) if acquired else 0.0,
+            'dns_cache_hits': self.dns_cache_hits,
+            'dns_cache_misses': self.dns_cache_misses,
+        }
+
+
+class UpstreamSessions:
+    """
+    Lifecycle-managed aiohttp sessions keyed by upstream name
+
+    Sessions are opened in the app lifespan and reused by every request,
+    so repeated calls to the same host ride on kept-alive connections.
+    ``get`` opens a session lazily if called outside the lifespan (e.g.
+    from a worker process).
+    """
+
+    def __init__(self, upstreams: Optional[Dict[str, UpstreamConfig]] = None):
+        self.upstreams = upstreams or UPSTREAMS
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._stats: Dict[str, _ConnectionStats] = {name: _ConnectionStats() for name in self.upstreams}
+
+    async def start(self) -> None:
+        for name in self.upstreams:
+            self.get(name)
+        logger.info(f"Upstream session pool ready: {', '.join(self.upstreams)}")
+
+    def get(self, name: str) -> aiohttp.ClientSession:
+        """Pooled session for an upstream"""
+        session = self._sessions.get(name)
+        if session is None or session.closed:
+            config = self.upstreams[name]
+            connector = aiohttp.TCPConnector(
+                limit=config.limit,
+                limit_per_host=config.limit_per_host,
+                ttl_dns_cache=DNS_CACHE_TTL,
+                keepalive_timeout=KEEPALIVE_TIMEOUT,
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(
+                    total=config.total_timeout,
+                    connect=config.connect_timeout,
+                    sock_read=config.read_timeout,
+                ),
+                trace_configs=[self._stats[name].trace_config()],
+            )
+            self._sessions[name] = session
+        return session
+
+    async def close(self) -> None:
+        for session in self._sessions.values():
+            if not session.closed:
+                await session.close()
+        self._sessions.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-upstream connection reuse statistics"""
+        return {
+            name: {
+                **self._stats[name].snapshot(),
+                'open': name in self._sessions and not self._sessions[name].closed,
+            }
+            for name in self.upstreams
+        }
@@ -0,0 +1,193 @@
+"""
+Job Progress Events
+In-process pub/sub that fans job state changes out to SSE and WebSocket subscribers
+"""
+
+import asyncio
+import inspect
+import json
+import logging
+import os
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Optional, Set, Tuple
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Event stream configuration
+SUBSCRIBER_BUFFER = int(os.getenv('JOB_EVENTS_BUFFER', '16'))
+HEARTBEAT_INTERVAL = float(os.getenv('JOB_EVENTS_HEARTBEAT', '15'))
+WATCH_INTERVAL = float(os.getenv('JOB_EVENTS_WATCH_INTERVAL', '1.0'))
+
+TERMINAL_STATUSES = {'completed', 'failed'}
+EVENT_FIELDS = ('job_id', 'status', 'progress', 'completed_at', 'error')
+
+# (event name, JSON payload); encoded once and shared by every subscriber
+Event = Tuple[str, str]
+
+
+class Subscription:
+    """One subscriber's view of a job topic; slow readers drop their oldest events"""
+
+    def __init__(self, buffer: int = SUBSCRIBER_BUFFER):
+        self._events: Deque[Event] = deque(maxlen=buffer)
+        self._ready = asyncio.Event()
+        self.dropped = 0
+
+    def push(self, event: Event) -> None:
+        if len(self._events) == self._events.maxlen:
+            self.dropped += 1
+        self._events.append(event)
+        self._ready.set()
+
+    async def next(self, timeout: Optional[float] = None) -> Optional[Event]:
+        """Next event, or None if ``timeout`` elapses first"""
+        if not self._events:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self._events.popleft()
+
+
+class _Topic:
+    def __init__(self):
+        self.subscribers: Set[Subscription] = set()
+        self.last_status: Optional[str] = None
+        self.last_payload: Optional[str] = None
+        self.watcher: Optional[asyncio.Task] = None
+
+
+class JobEvents:
+    """
+    Per-job topics of progress and status-change events
+
+    ``publish`` turns a job record into one encoded event and appends it
+    to every subscriber of that job, so fan-out costs one serialization
+    regardless of subscriber count. Events are state snapshots, which is
+    why a subscriber that falls behind can safely lose old ones.
+
+    When jobs run in another process (queue workers), ``subscribe`` can
+    be given a ``fetch`` callable; a single watcher task per job then
+    polls the job store on behalf of all of that job's subscribers.
+    """
+
+    def __init__(self, buffer: int = SUBSCRIBER_BUFFER):
+        self.buffer = buffer
+        self._topics: Dict[str, _Topic] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.published = 0
+        self.delivered = 0
+
+    def publish(self, job_id: str, record: Dict[str, Any]) -> int:
+        """Send a job's current state to its subscribers; returns the subscriber count"""
+        topic = self._topics.get(job_id)
+        if topic is None:
+            return 0
+
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if self._loop is not None and running is not self._loop:
+            # Called from a worker thread: hop onto the serving loop
+            self._loop.call_soon_threadsafe(self._publish, job_id, dict(record))
+            return len(topic.subscribers)
+        return self._publish(job_id, record)
+
+    def _publish(self, job_id: str, record: Dict[str, Any]) -> int:
+        topic = self._topics.get(job_id)
+        if topic is None:
+            return 0
+
+        payload = json.dumps({field: record.get(field) for field in EVENT_FIELDS}, default=str)
+        if payload == topic.last_payload:
+            return len(topic.subscribers)
+
+        status = record.get('status')
+        name = 'status' if status != topic.last_status else 'progress'
+        topic.last_status = status
+        topic.last_payload = payload
+
+        event = (name, payload)
+        for subscription in topic.subscribers:
+            subscription.push(event)
+        self.published += 1
+        self.delivered += len(topic.subscribers)
+        return len(topic.subscribers)
+
+    @asynccontextmanager
+    async def subscribe(self,
+                        job_id: str,
+                        load: Optional[Callable[[], Any]] = None,
+                        fetch: Optional[Callable[[], Any]] = None,
+                        watch_interval: float = WATCH_INTERVAL) -> AsyncIterator[Subscription]:
+        """
+        Subscribe to a job; the record ``load`` returns is delivered first as a status event
+
+        ``load`` (sync or async) runs only once the subscription is
+        registered, so a publish can never fall between reading the job
+        and subscribing to it. ``fetch`` (sync or async) enables store
+        polling for jobs updated by other processes.
+        """
+        self._loop = asyncio.get_running_loop()
+        topic = self._topics.setdefault(job_id, _Topic())
+        subscription = Subscription(self.buffer)
+        topic.subscribers.add(subscription)
+
+        try:
+            current = load() if load is not None else None
+            if inspect.isawaitable(current):
+                current = await current
+            if current is not None:
+                status_event = json.dumps({field: current.get(field) for field in EVENT_FIELDS}, default=str)
+                subscription.push(('status', status_event))
+                if topic.last_payload is None:
+                    topic.last_status, topic.last_payload = current.get('status'), status_event
+
+            if fetch is not None and (topic.watcher is None or topic.watcher.done()):
+                topic.watcher = asyncio.create_task(self._watch(job_id, topic, fetch, watch_interval))
+
+            yield subscription
+        finally:
+            topic.subscribers.discard(subscription)
+            if not topic.subscribers:
+                if topic.watcher:
+                    topic.watcher.cancel()
+                self._topics.pop(job_id, None)
+
+    async def _watch(self, job_id: str, topic: _Topic, fetch: Callable[[], Any], interval: float) -> None:
+        while topic.subscribers:
+            await asyncio.sleep(interval)
+            try:
+                record = fetch()
+                if inspect.isawaitable(record):
+                    record = await record
+            except Exception as e:
+                logger.warning(f"Job event watcher for {job_id} failed to read job: {e}")
+                continue
+            if record is not None:
+                self._publish(job_id, record)
+                if record.get('status') in TERMINAL_STATUSES:
+                    return
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            'topics': len(self._topics),
+            'subscribers': sum(len(topic.subscribers) for topic in self._topics.values()),
+            'watchers': sum(1 for topic in self._topics.values() if topic.watcher and not topic.watcher.done()),
+            'events_published': self.published,
+            'events_delivered': self.delivered,
+        }
+
+
+def is_terminal(event: Event) -> bool:
+    """Whether an event reports a finished job (the stream can close after it)"""
+    return json.loads(event[1]).get('status') in TERMINAL_STATUSES
+
+
+def format_sse(event: Event) -> bytes:
+    name, payload = event
+    return f"event: {name}\ndata: {payload}\n\n".encode('utf-8')
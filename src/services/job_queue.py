@@ -0,0 +1,399 @@
+"""
+Generation Job Queue
+Durable task queue (SQLite or Redis) with out-of-process workers, visibility timeouts and retries
+"""
+
+import asyncio
+import importlib
+import json
+import logging
+import os
+import signal
+import socket
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Queue configuration
+JOB_QUEUE_BACKEND = os.getenv('JOB_QUEUE_BACKEND', 'inline')  # inline | sqlite | redis
+JOB_QUEUE_PATH = os.getenv('JOB_QUEUE_PATH', 'data/queue.sqlite3')
+JOB_QUEUE_REDIS_URL = os.getenv('JOB_QUEUE_REDIS_URL', 'redis://localhost:6379/0')
+VISIBILITY_TIMEOUT = float(os.getenv('JOB_VISIBILITY_TIMEOUT', '300'))
+MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+RETRY_BACKOFF = float(os.getenv('JOB_RETRY_BACKOFF', '5'))
+WORKER_CONCURRENCY = int(os.getenv('JOB_WORKER_CONCURRENCY', '1'))
+POLL_INTERVAL = 0.5
+
+
+@dataclass
+class QueueTask:
+    """One delivery of a queued job"""
+    task_id: str
+    job_id: str
+    payload: Dict[str, Any]
+    attempts: int
+    max_attempts: int
+
+    @property
+    def exhausted(self) -> bool:
+        """Delivered more times than allowed (earlier attempts crashed or failed)"""
+        return self.attempts > self.max_attempts
+
+
+class SQLiteBroker:
+    """
+    Single-host broker on a WAL-mode SQLite file
+
+    ``reserve`` hides a task for ``visibility_timeout`` seconds. A worker
+    that dies mid-task never acks it, so the task becomes visible again
+    and another worker retries it.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path: str = JOB_QUEUE_PATH, queue: str = 'planter'):
+        self.path = path
+        self.queue = queue
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+
+        self._conn().execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                queue TEXT NOT NULL,
+                job_id TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                visible_at REAL NOT NULL,
+                worker TEXT,
+                error TEXT
+            )
+        """)
+        self._conn().execute(
+            "CREATE INDEX IF NOT EXISTS tasks_ready ON tasks (queue, visible_at) WHERE status = 'queued'"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, job_id: str, payload: Dict[str, Any], max_attempts: int = MAX_ATTEMPTS) -> str:
+        cursor = self._conn().execute(
+            "INSERT INTO tasks (queue, job_id, payload, max_attempts, visible_at) VALUES (?, ?, ?, ?, ?)",
+            (self.queue, job_id, json.dumps(payload), max_attempts, time.time())
+        )
+        return str(cursor.lastrowid)
+
+    def reserve(self, worker: str, visibility_timeout: float = VISIBILITY_TIMEOUT) -> Optional[QueueTask]:
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Reserved rows stay 'queued' with a future visible_at, so an
+            # expired reservation is picked up by the same index scan
+            row = conn.execute(
+                "SELECT task_id, job_id, payload, attempts, max_attempts FROM tasks "
+                "WHERE queue = ? AND status = 'queued' AND visible_at <= ? "
+                "ORDER BY visible_at LIMIT 1",
+                (self.queue, now)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            conn.execute(
+                "UPDATE tasks SET attempts = attempts + 1, visible_at = ?, worker = ? WHERE task_id = ?",
+                (now + visibility_timeout, worker, row[0])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        return QueueTask(str(row[0]), row[1], json.loads(row[2]), row[3] + 1, row[4])
+
+    def extend(self, task: QueueTask, visibility_timeout: float = VISIBILITY_TIMEOUT) -> None:
+        self._conn().execute(
+            "UPDATE tasks SET visible_at = ? WHERE task_id = ? AND status = 'queued'",
+            (time.time() + visibility_timeout, int(task.task_id))
+        )
+
+    def ack(self, task: QueueTask) -> None:
+        self._conn().execute("DELETE FROM tasks WHERE task_id = ?", (int(task.task_id),))
+
+    def retry(self, task: QueueTask, delay: float, error: str) -> None:
+        self._conn().execute(
+            "UPDATE tasks SET visible_at = ?, worker = NULL, error = ? WHERE task_id = ?",
+            (time.time() + delay, error, int(task.task_id))
+        )
+
+    def dead(self, task: QueueTask, error: str) -> None:
+        self._conn().execute(
+            "UPDATE tasks SET status = 'dead', error = ? WHERE task_id = ?",
+            (error, int(task.task_id))
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        ready, reserved, dead = self._conn().execute(
+            "SELECT "
+            "COALESCE(SUM(status = 'queued' AND (worker IS NULL OR visible_at <= ?)), 0), "
+            "COALESCE(SUM(status = 'queued' AND worker IS NOT NULL AND visible_at > ?), 0), "
+            "COALESCE(SUM(status = 'dead'), 0) "
+            "FROM tasks WHERE queue = ?",
+            (now, now, self.queue)
+        ).fetchone()
+        return {'backend': self.name, 'queue': self.queue, 'ready': ready, 'reserved': reserved, 'dead': dead}
+
+    def close(self) -> None:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+# KEYS: ready zset, task hash prefix. ARGV: now, visible_at
+_RESERVE_SCRIPT = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 1)
+if #ids == 0 then return nil end
+local id = ids[1]
+local key = KEYS[2] .. id
+redis.call('ZADD', KEYS[1], ARGV[2], id)
+local attempts = redis.call('HINCRBY', key, 'attempts', 1)
+local fields = redis.call('HMGET', key, 'job_id', 'payload', 'max_attempts')
+return {id, fields[1], fields[2], attempts, fields[3]}
+"""
+
+
+class RedisBroker:
+    """Redis-compatible broker; the visibility schedule is a sorted set scored by visible_at"""
+
+    name = 'redis'
+
+    def __init__(self, url: str = JOB_QUEUE_REDIS_URL, queue: str = 'planter'):
+        import redis  # Optional dependency
+
+        self.url = url
+        self.queue = queue
+        self._client = redis.from_url(url)
+        self._ready = f'petplantr:queue:{queue}:ready'
+        self._dead = f'petplantr:queue:{queue}:dead'
+        self._task_prefix = f'petplantr:queue:{queue}:task:'
+        self._reserve = self._client.register_script(_RESERVE_SCRIPT)
+
+    def enqueue(self, job_id: str, payload: Dict[str, Any], max_attempts: int = MAX_ATTEMPTS) -> str:
+        task_id = str(self._client.incr(f'petplantr:queue:{self.queue}:ids'))
+        pipe = self._client.pipeline()
+        pipe.hset(self._task_prefix + task_id, mapping={
+            'job_id': job_id, 'payload': json.dumps(payload), 'attempts': 0, 'max_attempts': max_attempts,
+        })
+        pipe.zadd(self._ready, {task_id: time.time()})
+        pipe.execute()
+        return task_id
+
+    def reserve(self, worker: str, visibility_timeout: float = VISIBILITY_TIMEOUT) -> Optional[QueueTask]:
+        now = time.time()
+        result = self._reserve(keys=[self._ready, self._task_prefix], args=[now, now + visibility_timeout])
+        if not result:
+            return None
+        task_id, job_id, payload, attempts, max_attempts = result
+        return QueueTask(task_id.decode(), job_id.decode(), json.loads(payload), int(attempts), int(max_attempts))
+
+    def extend(self, task: QueueTask, visibility_timeout: float = VISIBILITY_TIMEOUT) -> None:
+        self._client.zadd(self._ready, {task.task_id: time.time() + visibility_timeout}, xx=True)
+
+    def ack(self, task: QueueTask) -> None:
+        pipe = self._client.pipeline()
+        pipe.zrem(self._ready, task.task_id)
+        pipe.delete(self._task_prefix + task.task_id)
+        pipe.execute()
+
+    def retry(self, task: QueueTask, delay: float, error: str) -> None:
+        pipe = self._client.pipeline()
+        pipe.hset(self._task_prefix + task.task_id, 'error', error)
+        pipe.zadd(self._ready, {task.task_id: time.time() + delay}, xx=True)
+        pipe.execute()
+
+    def dead(self, task: QueueTask, error: str) -> None:
+        pipe = self._client.pipeline()
+        pipe.zrem(self._ready, task.task_id)
+        pipe.hset(self._task_prefix + task.task_id, 'error', error)
+        pipe.rpush(self._dead, task.task_id)
+        pipe.execute()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            'backend': self.name,
+            'queue': self.queue,
+            'ready': self._client.zcount(self._ready, '-inf', now),
+            'reserved': self._client.zcount(self._ready, f'({now}', '+inf'),
+            'dead': self._client.llen(self._dead),
+        }
+
+    def close(self) -> None:
+        self._client.close()
+
+
+def create_job_queue(backend: str = JOB_QUEUE_BACKEND, queue: str = 'planter') -> Optional[Any]:
+    """Build the configured broker; None means jobs run inline in the API process"""
+    if backend == 'sqlite':
+        return SQLiteBroker(queue=queue)
+
+    if backend == 'redis':
+        try:
+            return RedisBroker(queue=queue)
+        except ImportError:
+            logger.warning("redis package not installed, using SQLite job queue")
+            return SQLiteBroker(queue=queue)
+
+    return None
+
+
+class Worker:
+    """
+    Runs queued tasks with ``concurrency`` threads, each with its own event loop
+
+    Async handlers run to completion on their thread's loop, so blocking
+    pipeline calls inside them only hold up that slot. While a task runs
+    its reservation is extended every third of the visibility timeout;
+    if the process dies the reservation lapses and the task is redelivered.
+    """
+
+    def __init__(self,
+                 broker: Any,
+                 handler: Callable[..., Any],
+                 concurrency: int = WORKER_CONCURRENCY,
+                 visibility_timeout: float = VISIBILITY_TIMEOUT,
+                 on_dead: Optional[Callable[[str, str], Any]] = None):
+        self.broker = broker
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.visibility_timeout = visibility_timeout
+        self.on_dead = on_dead
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = threading.Event()
+        self._active: Dict[str, QueueTask] = {}
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.retried = 0
+        self.dead_lettered = 0
+
+    def run(self) -> None:
+        threads: List[threading.Thread] = [
+            threading.Thread(target=self._slot, args=(i,), name=f'job-worker-{i}', daemon=True)
+            for i in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        logger.info(f"Worker {self.name} consuming '{self.broker.queue}' with {self.concurrency} slots")
+
+        while not self._stop.wait(self.visibility_timeout / 3):
+            with self._lock:
+                active = list(self._active.values())
+            for task in active:
+                try:
+                    self.broker.extend(task, self.visibility_timeout)
+                except Exception as e:
+                    logger.warning(f"Failed to extend task {task.task_id}: {e}")
+
+        for thread in threads:
+            thread.join()
+
+    def stop(self, *_: Any) -> None:
+        self._stop.set()
+
+    def _slot(self, index: int) -> None:
+        loop = asyncio.new_event_loop()
+        worker = f"{self.name}/{index}"
+        while not self._stop.is_set():
+            try:
+                task = self.broker.reserve(worker, self.visibility_timeout)
+            except Exception as e:
+                logger.warning(f"Reserve failed: {e}")
+                task = None
+            if task is None:
+                self._stop.wait(POLL_INTERVAL)
+                continue
+            self._execute(task, loop)
+        loop.close()
+
+    def _execute(self, task: QueueTask, loop: asyncio.AbstractEventLoop) -> None:
+        if task.exhausted:
+            self._dead_letter(task, "exceeded max attempts (worker crashed or task failed repeatedly)")
+            return
+
+        with self._lock:
+            self._active[task.task_id] = task
+        try:
+            result = self.handler(**task.payload)
+            if asyncio.iscoroutine(result):
+                loop.run_until_complete(result)
+        except Exception as e:
+            logger.error(f"Task {task.task_id} (job {task.job_id}) failed on attempt {task.attempts}: {e}")
+            if task.attempts >= task.max_attempts:
+                self._dead_letter(task, str(e))
+            else:
+                self.broker.retry(task, RETRY_BACKOFF * 2 ** (task.attempts - 1), str(e))
+                self.retried += 1
+        else:
+            self.broker.ack(task)
+            self.completed += 1
+        finally:
+            with self._lock:
+                self._active.pop(task.task_id, None)
+
+    def _dead_letter(self, task: QueueTask, error: str) -> None:
+        self.broker.dead(task, error)
+        self.dead_lettered += 1
+        logger.error(f"Task {task.task_id} (job {task.job_id}) moved to dead letters: {error}")
+        if self.on_dead:
+            try:
+                self.on_dead(task.job_id, error)
+            except Exception as e:
+                logger.error(f"Dead-letter callback failed for job {task.job_id}: {e}")
+
+
+def load_callable(spec: str) -> Callable[..., Any]:
+    """Resolve a "module:attribute" reference"""
+    module_name, _, attribute = spec.partition(':')
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run generation job workers")
+    parser.add_argument('handler', help="Task handler as module:function, e.g. api_server:process_planter_generation")
+    parser.add_argument('--queue', default='planter')
+    parser.add_argument('--backend', default=JOB_QUEUE_BACKEND if JOB_QUEUE_BACKEND != 'inline' else 'sqlite')
+    parser.add_argument('--concurrency', type=int, default=WORKER_CONCURRENCY)
+    parser.add_argument('--visibility-timeout', type=float, default=VISIBILITY_TIMEOUT)
+    parser.add_argument('--on-dead', help="Called as fn(job_id, error) for dead-lettered tasks, e.g. api_server:fail_planter_job")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    worker = Worker(
+        create_job_queue(args.backend, args.queue),
+        load_callable(args.handler),
+        concurrency=args.concurrency,
+        visibility_timeout=args.visibility_timeout,
+        on_dead=load_callable(args.on_dead) if args.on_dead else None,
+    )
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()
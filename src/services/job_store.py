@@ -0,0 +1,487 @@
+"""
+Generation Job Store
+Pluggable persistence for planter generation jobs (in-memory LRU/TTL or SQLite WAL)
+"""
+
+import asyncio
+import base64
+import bisect
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Job store configuration
+JOB_STORE_BACKEND = os.getenv('JOB_STORE_BACKEND', 'sqlite')  # sqlite | memory
+JOB_STORE_PATH = os.getenv('JOB_STORE_PATH', 'data/jobs.sqlite3')
+JOB_TTL = int(os.getenv('JOB_TTL', str(24 * 3600)))  # Retention of finished jobs
+JOB_STORE_MAX_ENTRIES = int(os.getenv('JOB_STORE_MAX_ENTRIES', '10000'))
+PURGE_INTERVAL = 60.0
+DEFAULT_PAGE_SIZE = 20
+
+# (created timestamp, job_id): the per-user listing order, newest first
+IndexKey = Tuple[float, str]
+
+TERMINAL_STATUSES = {'completed', 'failed'}
+
+
+def job_owner(record: Dict[str, Any]) -> Optional[str]:
+    """User that owns a job record"""
+    return record.get('user_id') or (record.get('metadata') or {}).get('user_id')
+
+
+def encode_cursor(key: IndexKey) -> str:
+    """Opaque pagination cursor for the last job on a page"""
+    created, job_id = key
+    return base64.urlsafe_b64encode(f"{created!r}|{job_id}".encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> IndexKey:
+    """Inverse of ``encode_cursor``; raises ValueError on malformed input"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created, job_id = raw.split('|', 1)
+        return float(created), job_id
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from None
+
+
+class JobStore:
+    """
+    Interface shared by job store backends
+
+    Records are plain JSON-serializable dicts. Finished jobs (completed or
+    failed) expire ``ttl`` seconds after they reach that state; running
+    jobs never expire.
+
+    Async handlers use the ``a``-prefixed methods: backends that do
+    blocking I/O (``blocking = True``) run them on a worker thread so lock
+    waits never stall the event loop; the others run inline.
+    """
+
+    name = 'base'
+    blocking = False
+
+    def __init__(self, ttl: int = JOB_TTL):
+        self.ttl = ttl
+
+    def create(self, job_id: str, record: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def update(self, job_id: str, **fields: Any) -> Optional[Dict[str, Any]]:
+        """Merge fields into a job; returns the new record, or None if the job is gone"""
+        raise NotImplementedError
+
+    def delete(self, job_id: str) -> bool:
+        raise NotImplementedError
+
+    def list_jobs(self,
+                  user_id: str,
+                  limit: int = DEFAULT_PAGE_SIZE,
+                  after: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        One page of ``user_id``'s live jobs, newest first
+
+        ``after`` is the cursor returned with the previous page. Returns the
+        records and the cursor for the next page (None on the last page).
+        """
+        raise NotImplementedError
+
+    def claim(self, key: str, job_id: str, ttl: float, expected: Optional[str] = None) -> str:
+        """
+        Atomically bind ``key`` to ``job_id`` for ``ttl`` seconds
+
+        Succeeds when the key is free, expired, or currently bound to
+        ``expected`` (a takeover of a stale binding). Returns the job the
+        key is bound to afterwards: ``job_id`` if this caller won.
+        """
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def purge_expired(self) -> int:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {'backend': self.name, 'ttl': self.ttl}
+
+    def _expires_at(self, record: Dict[str, Any], now: float) -> Optional[float]:
+        return now + self.ttl if record.get('status') in TERMINAL_STATUSES else None
+
+    async def _offload(self, method, *args: Any, **kwargs: Any) -> Any:
+        if self.blocking:
+            return await asyncio.to_thread(method, *args, **kwargs)
+        return method(*args, **kwargs)
+
+    async def acreate(self, job_id: str, record: Dict[str, Any]) -> None:
+        return await self._offload(self.create, job_id, record)
+
+    async def aget(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self._offload(self.get, job_id)
+
+    async def aupdate(self, job_id: str, **fields: Any) -> Optional[Dict[str, Any]]:
+        return await self._offload(self.update, job_id, **fields)
+
+    async def adelete(self, job_id: str) -> bool:
+        return await self._offload(self.delete, job_id)
+
+    async def alist_jobs(self,
+                         user_id: str,
+                         limit: int = DEFAULT_PAGE_SIZE,
+                         after: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        return await self._offload(self.list_jobs, user_id, limit=limit, after=after)
+
+    async def aclaim(self, key: str, job_id: str, ttl: float, expected: Optional[str] = None) -> str:
+        return await self._offload(self.claim, key, job_id, ttl, expected=expected)
+
+    async def acount(self) -> int:
+        return await self._offload(self.count)
+
+
+class InMemoryJobStore(JobStore):
+    """
+    Process-local LRU store with TTL expiry of finished jobs
+
+    A per-user index of (created, job_id) keys kept in creation order
+    makes a listing page O(log n + page size) regardless of how many jobs
+    other users own.
+    """
+
+    name = 'memory'
+
+    def __init__(self, ttl: int = JOB_TTL, max_entries: int = JOB_STORE_MAX_ENTRIES):
+        super().__init__(ttl)
+        self.max_entries = max_entries
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._expires: Dict[str, float] = {}
+        self._created: Dict[str, float] = {}
+        self._owners: Dict[str, str] = {}
+        self._by_user: Dict[str, List[IndexKey]] = {}
+        self._claims: Dict[str, Tuple[str, float]] = {}
+        self._last_created = 0.0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def create(self, job_id: str, record: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            if job_id in self._jobs:
+                self._remove(job_id)
+            # Strictly increasing creation times keep each user index append-only
+            self._last_created = created = max(now, self._last_created + 1e-6)
+            self._jobs[job_id] = dict(record)
+            self._created[job_id] = created
+            self._set_expiry(job_id, self._expires_at(record, now))
+            self._index(job_id, job_owner(record))
+            while len(self._jobs) > self.max_entries:
+                oldest = next(iter(self._jobs))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            record = self._live(job_id)
+            if record is None:
+                return None
+            self._jobs.move_to_end(job_id)
+            return dict(record)
+
+    def update(self, job_id: str, **fields: Any) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            record = self._live(job_id)
+            if record is None:
+                return None
+            record.update(fields)
+            if 'status' in fields:
+                self._set_expiry(job_id, self._expires_at(record, time.time()))
+            owner = job_owner(record)
+            if owner != self._owners.get(job_id):
+                self._unindex(job_id)
+                self._index(job_id, owner)
+            self._jobs.move_to_end(job_id)
+            return dict(record)
+
+    def delete(self, job_id: str) -> bool:
+        with self._lock:
+            if job_id not in self._jobs:
+                return False
+            self._remove(job_id)
+            return True
+
+    def list_jobs(self,
+                  user_id: str,
+                  limit: int = DEFAULT_PAGE_SIZE,
+                  after: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        with self._lock:
+            keys = self._by_user.get(user_id, [])
+            position = bisect.bisect_left(keys, decode_cursor(after)) if after else len(keys)
+
+            page: List[Dict[str, Any]] = []
+            last_key = None
+            now = time.time()
+            while position > 0 and len(page) < limit:
+                position -= 1
+                key = keys[position]
+                if self._expires.get(key[1], float('inf')) <= now:
+                    continue
+                page.append(dict(self._jobs[key[1]]))
+                last_key = key
+
+        # Older keys may all turn out to be expired; the next page is then empty
+        return page, (encode_cursor(last_key) if position > 0 and last_key else None)
+
+    def claim(self, key: str, job_id: str, ttl: float, expected: Optional[str] = None) -> str:
+        now = time.time()
+        with self._lock:
+            current = self._claims.get(key)
+            if current is None or current[1] <= now or current[0] == expected:
+                self._claims[key] = (job_id, now + ttl)
+                return job_id
+            return current[0]
+
+    def count(self) -> int:
+        return len(self._jobs)
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [job_id for job_id, expires_at in self._expires.items() if expires_at <= now]
+            for job_id in expired:
+                self._remove(job_id)
+            for key in [key for key, (_, expires_at) in self._claims.items() if expires_at <= now]:
+                del self._claims[key]
+        return len(expired)
+
+    def _live(self, job_id: str) -> Optional[Dict[str, Any]]:
+        record = self._jobs.get(job_id)
+        if record is not None and self._expires.get(job_id, float('inf')) <= time.time():
+            self._remove(job_id)
+            return None
+        return record
+
+    def _set_expiry(self, job_id: str, expires_at: Optional[float]) -> None:
+        if expires_at is None:
+            self._expires.pop(job_id, None)
+        else:
+            self._expires[job_id] = expires_at
+
+    def _index(self, job_id: str, owner: Optional[str]) -> None:
+        if owner is None:
+            return
+        self._owners[job_id] = owner
+        keys = self._by_user.setdefault(owner, [])
+        key = (self._created[job_id], job_id)
+        if not keys or keys[-1] < key:
+            keys.append(key)
+        else:
+            bisect.insort(keys, key)
+
+    def _unindex(self, job_id: str) -> None:
+        owner = self._owners.pop(job_id, None)
+        if owner is None:
+            return
+        keys = self._by_user[owner]
+        position = bisect.bisect_left(keys, (self._created[job_id], job_id))
+        if position < len(keys) and keys[position][1] == job_id:
+            keys.pop(position)
+        if not keys:
+            del self._by_user[owner]
+
+    def _remove(self, job_id: str) -> None:
+        if job_id in self._created:
+            self._unindex(job_id)
+        self._jobs.pop(job_id, None)
+        self._expires.pop(job_id, None)
+        self._created.pop(job_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **super().stats(),
+            'jobs': len(self._jobs),
+            'users': len(self._by_user),
+            'claims': len(self._claims),
+            'max_entries': self.max_entries,
+            'evictions': self.evictions,
+        }
+
+
+class SQLiteJobStore(JobStore):
+    """
+    SQLite store in WAL mode, shared by every worker process on a host
+
+    WAL lets status reads proceed while another worker writes, and each
+    thread keeps its own connection (the async methods run on worker
+    threads). Reads are a primary-key lookup.
+    Expired rows are hidden from reads immediately and deleted at most
+    once per ``PURGE_INTERVAL``.
+    """
+
+    name = 'sqlite'
+    blocking = True
+
+    def __init__(self, path: str = JOB_STORE_PATH, ttl: int = JOB_TTL):
+        super().__init__(ttl)
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._last_purge = 0.0
+
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                user_id TEXT,
+                status TEXT NOT NULL,
+                created REAL NOT NULL,
+                expires_at REAL,
+                data TEXT NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_expires ON jobs (expires_at) WHERE expires_at IS NOT NULL")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_user_created ON jobs (user_id, created, job_id)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS claims (
+                key TEXT PRIMARY KEY,
+                job_id TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def create(self, job_id: str, record: Dict[str, Any]) -> None:
+        now = time.time()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO jobs (job_id, user_id, status, created, expires_at, data) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, job_owner(record), record.get('status', 'pending'), now,
+             self._expires_at(record, now), json.dumps(record, default=str))
+        )
+        if now - self._last_purge > PURGE_INTERVAL:
+            self.purge_expired()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT data FROM jobs WHERE job_id = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (job_id, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(self, job_id: str, **fields: Any) -> Optional[Dict[str, Any]]:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")  # Serialize read-modify-write across workers
+        try:
+            row = conn.execute(
+                "SELECT data, expires_at FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            record = json.loads(row[0])
+            record.update(fields)
+            expires_at = self._expires_at(record, time.time()) if 'status' in fields else row[1]
+            conn.execute(
+                "UPDATE jobs SET user_id = ?, status = ?, expires_at = ?, data = ? WHERE job_id = ?",
+                (job_owner(record), record.get('status', 'pending'), expires_at,
+                 json.dumps(record, default=str), job_id)
+            )
+            conn.execute("COMMIT")
+            return record
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, job_id: str) -> bool:
+        cursor = self._conn().execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+        return cursor.rowcount > 0
+
+    def list_jobs(self,
+                  user_id: str,
+                  limit: int = DEFAULT_PAGE_SIZE,
+                  after: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        # Walks the (user_id, created, job_id) index backwards from the cursor
+        created, job_id = decode_cursor(after) if after else (float('inf'), '')
+        rows = self._conn().execute(
+            "SELECT created, job_id, data FROM jobs "
+            "WHERE user_id = ? AND (created, job_id) < (?, ?) "
+            "AND (expires_at IS NULL OR expires_at > ?) "
+            "ORDER BY created DESC, job_id DESC LIMIT ?",
+            (user_id, created, job_id, time.time(), limit + 1)
+        ).fetchall()
+        page = rows[:limit]
+        cursor = encode_cursor((page[-1][0], page[-1][1])) if len(rows) > limit else None
+        return [json.loads(row[2]) for row in page], cursor
+
+    def claim(self, key: str, job_id: str, ttl: float, expected: Optional[str] = None) -> str:
+        now = time.time()
+        conn = self._conn()
+        # One statement, so the check-and-set is atomic across workers
+        conn.execute(
+            "INSERT INTO claims (key, job_id, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET job_id = excluded.job_id, expires_at = excluded.expires_at "
+            "WHERE claims.expires_at <= ? OR claims.job_id = ?",
+            (key, job_id, now + ttl, now, expected)
+        )
+        row = conn.execute("SELECT job_id FROM claims WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else job_id
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+    def purge_expired(self) -> int:
+        self._last_purge = time.time()
+        conn = self._conn()
+        cursor = conn.execute(
+            "DELETE FROM jobs WHERE expires_at IS NOT NULL AND expires_at <= ?", (self._last_purge,)
+        )
+        conn.execute("DELETE FROM claims WHERE expires_at <= ?", (self._last_purge,))
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), 'path': self.path}
+
+
+def create_job_store(backend: str = JOB_STORE_BACKEND) -> JobStore:
+    """Build the configured job store, falling back to in-process storage"""
+    if backend == 'sqlite':
+        try:
+            return SQLiteJobStore()
+        except sqlite3.Error as e:
+            logger.warning(f"SQLite job store unavailable ({e}), using in-memory job store")
+
+    return InMemoryJobStore()
@@ -0,0 +1,472 @@
+"""
+Rate Limiting
+Sliding-window-counter limits per plan and route, O(1) per key, shared across workers via Redis or SQLite
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Mapping, Optional
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Limiter configuration
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'sqlite')  # sqlite | redis | memory
+RATE_LIMIT_PATH = os.getenv('RATE_LIMIT_PATH', 'data/ratelimit.sqlite3')
+RATE_LIMIT_REDIS_URL = os.getenv('RATE_LIMIT_REDIS_URL', 'redis://localhost:6379/0')
+RATE_LIMIT_BACKEND_TIMEOUT = float(os.getenv('RATE_LIMIT_BACKEND_TIMEOUT', '0.25'))
+RATE_LIMIT_BACKEND_RETRY = float(os.getenv('RATE_LIMIT_BACKEND_RETRY', '30'))  # Seconds on local limits after a failure
+RATE_LIMIT_EVICT_INTERVAL = float(os.getenv('RATE_LIMIT_EVICT_INTERVAL', '60'))
+SQLITE_BUSY_TIMEOUT = 0.8 * RATE_LIMIT_BACKEND_TIMEOUT  # Lock waits end (busy) before the check times out
+
+# plan -> route -> "count/period"; '*' matches any route, 'default' any plan
+DEFAULT_RATE_LIMITS: Dict[str, Dict[str, str]] = {
+    'default': {'*': '100/hour'},
+    'anonymous': {'*': '50/hour'},
+}
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+class RateLimitBackendBusy(Exception):
+    """Transient contention in a shared store; the check fails open instead of going local"""
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """At most ``limit`` requests per ``window`` seconds"""
+    limit: int
+    window: float
+
+    def __str__(self) -> str:
+        for name, seconds in PERIODS.items():
+            if self.window == seconds:
+                return f"{self.limit}/{name}"
+        return f"{self.limit}/{self.window:g}s"
+
+
+@dataclass(frozen=True)
+class RateLimitDecision:
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: float  # Seconds until the request would be allowed (0 when allowed)
+
+    def headers(self) -> Dict[str, str]:
+        headers = {'X-RateLimit-Limit': str(self.limit), 'X-RateLimit-Remaining': str(self.remaining)}
+        if not self.allowed:
+            headers['Retry-After'] = str(max(1, int(self.retry_after + 0.999)))
+        return headers
+
+
+def parse_rate(rate: str) -> RateLimit:
+    """``RateLimit`` from strings like ``"100/hour"``, ``"10/minute"`` or ``"5/30s"``"""
+    count, _, period = rate.strip().partition('/')
+    period = period.strip().lower()
+    if period.endswith('s') and period[:-1] in PERIODS:
+        period = period[:-1]  # "hours"
+    try:
+        window = float(PERIODS[period] if period in PERIODS else period.rstrip('s'))
+        return RateLimit(int(count), window)
+    except ValueError:
+        raise ValueError(f"Invalid rate limit {rate!r} (expected e.g. '100/hour')") from None
+
+
+class RateLimitPolicy:
+    """
+    Limits per plan and route
+
+    Lookup order for (plan, route): the plan's route entry, the plan's
+    ``'*'`` entry, then the same two under ``'default'``.
+    """
+
+    def __init__(self, limits: Mapping[str, Mapping[str, str]] = DEFAULT_RATE_LIMITS):
+        self.limits: Dict[str, Dict[str, RateLimit]] = {
+            plan: {route: parse_rate(rate) for route, rate in routes.items()}
+            for plan, routes in limits.items()
+        }
+        if '*' not in self.limits.get('default', {}):
+            raise ValueError("Rate limits need a default plan with a '*' route")
+
+    @classmethod
+    def from_env(cls) -> 'RateLimitPolicy':
+        """Defaults overlaid with the RATE_LIMITS JSON, e.g. ``{"premium": {"*": "500/hour"}}``"""
+        limits = {plan: dict(routes) for plan, routes in DEFAULT_RATE_LIMITS.items()}
+        configured = os.getenv('RATE_LIMITS')
+        if configured:
+            for plan, routes in json.loads(configured).items():
+                limits.setdefault(plan, {}).update(routes)
+        return cls(limits)
+
+    def resolve(self, plan: Optional[str], route: str) -> RateLimit:
+        for candidate in (plan, 'default'):
+            routes = self.limits.get(candidate) if candidate else None
+            if routes:
+                limit = routes.get(route) or routes.get('*')
+                if limit:
+                    return limit
+        return self.limits['default']['*']
+
+
+def sliding_window(now: float, limit: RateLimit, window_index: int, current: int, previous: int,
+                   cost: int = 1) -> RateLimitDecision:
+    """
+    Sliding-window-counter check from the counts of the current and previous fixed windows
+
+    The previous window's count is weighted by how much of it still
+    overlaps the sliding window, which approximates a log of timestamps
+    with two integers. ``window_index``/``current`` must already be rolled
+    forward to ``now`` (see ``roll_window``).
+    """
+    elapsed = now - window_index * limit.window
+    weight = 1.0 - elapsed / limit.window
+    estimate = previous * weight + current
+    if estimate + cost <= limit.limit:
+        return RateLimitDecision(True, limit.limit, int(limit.limit - estimate - cost), 0.0)
+
+    if current + cost <= limit.limit and previous:
+        # Allowed once enough of the previous window slides out
+        retry_after = limit.window * (1.0 - (limit.limit - cost - current) / previous) - elapsed
+    else:
+        # Wait for this window to end, then for its count to decay in the next one
+        retry_after = limit.window - elapsed
+        if current:
+            retry_after += limit.window * max(0.0, 1.0 - (limit.limit - cost) / current)
+    return RateLimitDecision(False, limit.limit, 0, max(0.0, retry_after))
+
+
+def roll_window(now: float, window: float, window_index: int, current: int, previous: int):
+    """Advance a key's (window_index, current, previous) counters to the window containing ``now``"""
+    index = int(now // window)
+    if index == window_index:
+        return window_index, current, previous
+    if index == window_index + 1:
+        return index, 0, current
+    return index, 0, 0
+
+
+class SQLiteRateLimitStore:
+    """
+    Counters in a SQLite file shared by every worker process on one host
+
+    Each check is one IMMEDIATE transaction (read, decide, upsert), so
+    concurrent workers serialize on the row and never over-admit. The
+    transaction runs on a worker thread so lock waits never stall the
+    event loop; each thread keeps its own connection.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path: str = RATE_LIMIT_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._conn().execute("""
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                key TEXT PRIMARY KEY,
+                window_index INTEGER NOT NULL,
+                current INTEGER NOT NULL,
+                previous INTEGER NOT NULL,
+                window REAL NOT NULL
+            )
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    async def hit(self, key: str, limit: RateLimit, cost: int = 1) -> RateLimitDecision:
+        return await asyncio.to_thread(self._hit, key, limit, cost)
+
+    def _hit(self, key: str, limit: RateLimit, cost: int) -> RateLimitDecision:
+        now = time.time()
+        conn = self._conn()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError as e:
+            if 'locked' in str(e) or 'busy' in str(e):
+                raise RateLimitBackendBusy(str(e)) from None
+            raise
+        try:
+            row = conn.execute(
+                "SELECT window_index, current, previous, window FROM rate_limits WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[3] != limit.window:
+                row = (int(now // limit.window), 0, 0, limit.window)
+            index, current, previous = roll_window(now, limit.window, row[0], row[1], row[2])
+            decision = sliding_window(now, limit, index, current, previous, cost)
+            if decision.allowed:
+                current += cost
+            conn.execute(
+                "INSERT INTO rate_limits (key, window_index, current, previous, window) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET window_index = excluded.window_index, "
+                "current = excluded.current, previous = excluded.previous, window = excluded.window",
+                (key, index, current, previous, limit.window)
+            )
+            conn.execute("COMMIT")
+            return decision
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    async def evict_idle(self) -> int:
+        return await asyncio.to_thread(self._evict_idle)
+
+    def _evict_idle(self) -> int:
+        cursor = self._conn().execute(
+            "DELETE FROM rate_limits WHERE CAST(? / window AS INTEGER) > window_index + 1", (time.time(),)
+        )
+        return cursor.rowcount
+
+    async def close(self) -> None:
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+
+# KEYS: counter hash. ARGV: window seconds, limit, cost. Mirrors roll_window + sliding_window,
+# using the server clock so every host agrees on window boundaries.
+_SLIDING_WINDOW_SCRIPT = """
+local window = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local index = math.floor(now / window)
+
+local state = redis.call('HMGET', KEYS[1], 'index', 'current', 'previous', 'window')
+local stored = tonumber(state[1])
+local current = tonumber(state[2]) or 0
+local previous = tonumber(state[3]) or 0
+if stored == nil or tonumber(state[4]) ~= window or index > stored + 1 then
+    current, previous = 0, 0
+elseif index == stored + 1 then
+    current, previous = 0, current
+end
+
+local elapsed = now - index * window
+local estimate = previous * (1 - elapsed / window) + current
+local allowed = 0
+local retry_after = 0
+if estimate + cost <= limit then
+    allowed = 1
+    current = current + cost
+elseif current + cost <= limit and previous > 0 then
+    retry_after = window * (1 - (limit - cost - current) / previous) - elapsed
+else
+    retry_after = window - elapsed
+    if current > 0 then
+        retry_after = retry_after + window * math.max(0, 1 - (limit - cost) / current)
+    end
+end
+
+redis.call('HSET', KEYS[1], 'index', index, 'current', current, 'previous', previous, 'window', window)
+redis.call('PEXPIRE', KEYS[1], math.ceil(2 * window * 1000))
+return {allowed, math.max(0, math.floor(limit - estimate - cost)), tostring(math.max(0, retry_after))}
+"""
+
+
+class RedisRateLimitStore:
+    """
+    Counters in a Redis-compatible server shared by every host
+
+    One EVALSHA per check runs the whole read-decide-write atomically on
+    the server; keys expire after two idle windows, so Redis does the
+    eviction.
+    """
+
+    name = 'redis'
+
+    def __init__(self, url: str = RATE_LIMIT_REDIS_URL, prefix: str = 'petplantr:ratelimit:'):
+        import redis.asyncio as redis  # Optional dependency
+
+        self.url = url
+        self.prefix = prefix
+        self._client = redis.from_url(
+            url, socket_timeout=RATE_LIMIT_BACKEND_TIMEOUT, socket_connect_timeout=RATE_LIMIT_BACKEND_TIMEOUT
+        )
+        self._script = self._client.register_script(_SLIDING_WINDOW_SCRIPT)
+
+    async def hit(self, key: str, limit: RateLimit, cost: int = 1) -> RateLimitDecision:
+        allowed, remaining, retry_after = await self._script(
+            keys=[self.prefix + key], args=[limit.window, limit.limit, cost]
+        )
+        return RateLimitDecision(bool(allowed), limit.limit, int(remaining), float(retry_after))
+
+    async def evict_idle(self) -> int:
+        return 0  # Keys carry their own TTL
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+class RateLimiter:
+    """
+    Sliding-window-counter limiter, process-local or backed by a shared store
+
+    Each key holds four numbers (window index, current count, previous
+    count, window length), so a check is O(1) in time and memory however
+    busy the key is. A background task drops keys whose windows have both
+    lapsed, since their state is indistinguishable from a new key.
+
+    With a ``store`` (SQLite or Redis), every worker counts against the
+    same state, so N workers enforce the limit once rather than N times.
+    A check that hits transient contention (RateLimitBackendBusy) is
+    allowed without touching the local counters. If the store fails,
+    checks fall back to the local counters for ``retry_backend`` seconds
+    before the store is tried again.
+    """
+
+    def __init__(self,
+                 policy: Optional[RateLimitPolicy] = None,
+                 store: Optional[Any] = None,
+                 evict_interval: float = RATE_LIMIT_EVICT_INTERVAL,
+                 retry_backend: float = RATE_LIMIT_BACKEND_RETRY):
+        self.policy = policy or RateLimitPolicy.from_env()
+        self.store = store
+        self.evict_interval = evict_interval
+        self.retry_backend = retry_backend
+        self._backend_retry_at = 0.0
+        self._counters: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+        self._evictor: Optional[asyncio.Task] = None
+        self.allowed = 0
+        self.limited = 0
+        self.evicted = 0
+        self.fallbacks = 0
+        self.busy_fail_open = 0
+
+    @property
+    def name(self) -> str:
+        return self.store.name if self.store is not None else 'memory'
+
+    def hit(self, key: str, limit: RateLimit, cost: int = 1) -> RateLimitDecision:
+        """Count one request against ``key`` unless that would exceed ``limit``"""
+        now = time.time()
+        with self._lock:
+            entry = self._counters.get(key)
+            if entry is None or entry[3] != limit.window:
+                entry = self._counters[key] = [int(now // limit.window), 0, 0, limit.window]
+            index, current, previous = roll_window(now, limit.window, int(entry[0]), int(entry[1]), int(entry[2]))
+            decision = sliding_window(now, limit, index, current, previous, cost)
+            if decision.allowed:
+                current += cost
+            entry[0], entry[1], entry[2] = index, current, previous
+        self._count(decision)
+        return decision
+
+    async def check(self, identity: str, route: str, plan: Optional[str] = None, cost: int = 1) -> RateLimitDecision:
+        """Apply the policy's limit for (plan, route) to one caller"""
+        key = f"{route}:{identity}"
+        limit = self.policy.resolve(plan, route)
+        if self.store is not None and time.monotonic() >= self._backend_retry_at:
+            try:
+                decision = await asyncio.wait_for(self.store.hit(key, limit, cost), RATE_LIMIT_BACKEND_TIMEOUT)
+                self._count(decision)
+                return decision
+            except RateLimitBackendBusy as e:
+                # One contended check is not an outage: admit it rather than switch every
+                # worker to its own counters (which would admit N x the limit)
+                self.busy_fail_open += 1
+                logger.debug(f"Rate limit backend {self.store.name} busy ({e}); allowing request")
+                return RateLimitDecision(True, limit.limit, max(limit.limit - cost, 0), 0.0)
+            except Exception as e:
+                self.fallbacks += 1
+                self._backend_retry_at = time.monotonic() + self.retry_backend
+                logger.warning(f"Rate limit backend {self.store.name} unavailable ({e!r}); "
+                               f"using local limits for {self.retry_backend:.0f}s")
+        return self.hit(key, limit, cost)
+
+    def _count(self, decision: RateLimitDecision) -> None:
+        if decision.allowed:
+            self.allowed += 1
+        else:
+            self.limited += 1
+
+    def evict_idle(self) -> int:
+        """Drop keys with no requests in their current or previous window"""
+        now = time.time()
+        with self._lock:
+            idle = [key for key, (index, _, _, window) in self._counters.items() if int(now // window) > index + 1]
+            for key in idle:
+                del self._counters[key]
+        self.evicted += len(idle)
+        return len(idle)
+
+    async def _evict_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.evict_interval)
+            evicted = self.evict_idle()
+            if self.store is not None:
+                try:
+                    evicted += await self.store.evict_idle()
+                except Exception as e:
+                    logger.warning(f"Rate limit backend eviction failed: {e}")
+            if evicted:
+                logger.debug(f"Evicted {evicted} idle rate limit keys")
+
+    async def start(self) -> None:
+        if self._evictor is None or self._evictor.done():
+            self._evictor = asyncio.create_task(self._evict_loop())
+
+    async def stop(self) -> None:
+        if self._evictor is not None:
+            self._evictor.cancel()
+            try:
+                await self._evictor
+            except asyncio.CancelledError:
+                pass
+            self._evictor = None
+        if self.store is not None:
+            await self.store.close()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            'backend': self.name,
+            'keys': len(self._counters),
+            'allowed': self.allowed,
+            'limited': self.limited,
+            'evicted': self.evicted,
+            'backend_fallbacks': self.fallbacks,
+            'busy_fail_open': self.busy_fail_open,
+            'on_local_fallback': self.store is not None and time.monotonic() < self._backend_retry_at,
+            'limits': {plan: {route: str(limit) for route, limit in routes.items()}
+                       for plan, routes in self.policy.limits.items()},
+        }
+
+
+def create_rate_limiter(backend: str = RATE_LIMIT_BACKEND) -> RateLimiter:
+    """Build the configured limiter; shared backends fall back to local limits when unavailable"""
+    store = None
+    if backend == 'redis':
+        try:
+            store = RedisRateLimitStore()
+        except ImportError:
+            logger.warning("redis package not installed, using SQLite rate limits")
+            backend = 'sqlite'
+    if backend == 'sqlite':
+        try:
+            store = SQLiteRateLimitStore()
+        except sqlite3.Error as e:
+            logger.warning(f"SQLite rate limits unavailable ({e}), using per-process limits")
+    return RateLimiter(store=store)
@@ -0,0 +1,370 @@
+"""
+Replicate Prediction Completion
+Shared adaptive poller with optional webhook resolution for in-flight predictions
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Set
+
+import aiohttp
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Replicate configuration (point REPLICATE_API_BASE at a fake server for local testing)
+REPLICATE_API_BASE = os.getenv('REPLICATE_API_BASE', 'https://api.replicate.com/v1').rstrip('/')
+REPLICATE_WEBHOOK_URL = os.getenv('REPLICATE_WEBHOOK_URL')  # Public URL of the webhook route
+REPLICATE_WEBHOOK_SECRET = os.getenv('REPLICATE_WEBHOOK_SECRET')  # "whsec_..." signing secret
+
+# Polling configuration
+POLL_MIN_INTERVAL = float(os.getenv('REPLICATE_POLL_MIN_INTERVAL', '0.25'))
+POLL_MAX_INTERVAL = float(os.getenv('REPLICATE_POLL_MAX_INTERVAL', '10'))
+POLL_BACKOFF = float(os.getenv('REPLICATE_POLL_BACKOFF', '1.5'))
+POLL_CONCURRENCY = int(os.getenv('REPLICATE_POLL_CONCURRENCY', '16'))
+PREDICTION_MAX_WAIT = float(os.getenv('REPLICATE_PREDICTION_MAX_WAIT', '900'))
+WEBHOOK_POLL_FACTOR = 4.0  # Polling is only a safety net when webhooks are on
+WEBHOOK_MAX_AGE = 300  # Seconds a signed webhook timestamp stays valid
+EARLY_RESULTS_MAX = 256  # Webhooks that beat their waiter, kept until claimed
+
+TERMINAL_STATUSES = {'succeeded', 'failed', 'canceled'}
+
+# Latency priors (seconds) until a model has completed predictions of its own
+DEFAULT_EXPECTED_LATENCY = 10.0
+MODEL_LATENCY_PRIORS = {
+    'black-forest-labs/flux-dev': 8.0,
+    'firtoz/trellis': 60.0,
+}
+
+
+class PredictionTimeout(Exception):
+    """Raised when a prediction is still running after the maximum wait"""
+
+    def __init__(self, prediction_id: str, waited: float):
+        super().__init__(f"Prediction {prediction_id} not finished after {waited:.0f}s")
+        self.prediction_id = prediction_id
+
+
+class WebhookSignatureError(ValueError):
+    """Raised when a webhook delivery fails signature verification"""
+
+
+def model_key(version: str) -> str:
+    """Latency bucket for a model reference ("owner/name:sha" -> "owner/name")"""
+    return version.split(':', 1)[0]
+
+
+class LatencyModel:
+    """Per-model EWMA of observed completion time"""
+
+    def __init__(self, alpha: float = 0.3, priors: Optional[Dict[str, float]] = None):
+        self.alpha = alpha
+        self._expected: Dict[str, float] = dict(priors if priors is not None else MODEL_LATENCY_PRIORS)
+        self._samples: Dict[str, int] = {}
+
+    def expected(self, model: str) -> float:
+        return self._expected.get(model, DEFAULT_EXPECTED_LATENCY)
+
+    def observe(self, model: str, seconds: float) -> None:
+        if self._samples.get(model):
+            self._expected[model] = (1 - self.alpha) * self._expected[model] + self.alpha * seconds
+        else:
+            self._expected[model] = seconds
+        self._samples[model] = self._samples.get(model, 0) + 1
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        return {
+            model: {'expected_s': expected, 'samples': self._samples.get(model, 0)}
+            for model, expected in self._expected.items()
+        }
+
+
+def next_poll_delay(elapsed: float, expected: float, attempt: int,
+                    min_interval: float = POLL_MIN_INTERVAL,
+                    max_interval: float = POLL_MAX_INTERVAL,
+                    backoff: float = POLL_BACKOFF) -> float:
+    """
+    Seconds until the next status check of a prediction
+
+    Before the expected completion time the next check lands halfway to
+    it, so few requests are spent while the job is certainly still
+    running and checks get denser as it nears. Past the expected time the
+    interval backs off exponentially from ``min_interval``.
+    """
+    remaining = expected - elapsed
+    if remaining > 0:
+        delay = remaining / 2
+    else:
+        delay = min_interval * backoff ** attempt
+    return min(max(delay, min_interval), max_interval)
+
+
+@dataclass
+class _Pending:
+    future: asyncio.Future
+    model: str
+    started: float
+    next_poll: float
+    overdue_attempts: int = 0
+    polls: int = 0
+    waiters: int = 1
+    checking: bool = False
+
+
+class ReplicatePoller:
+    """
+    One background task that tracks every in-flight prediction
+
+    Callers ``await wait(prediction_id, model)``. The poller checks all
+    due predictions concurrently over the shared Replicate session,
+    scheduling each one from the model's historical latency. When
+    ``REPLICATE_WEBHOOK_URL`` is configured, predictions are created with
+    a completion webhook and ``resolve`` settles the waiting future as
+    soon as Replicate calls back; polling then only runs as a slow
+    safety net. Webhooks need ``REPLICATE_WEBHOOK_SECRET`` as well:
+    unsigned deliveries are always rejected.
+
+    Each due status check runs as its own task (at most
+    ``POLL_CONCURRENCY`` at once), so a slow GET only delays its own
+    prediction.
+    """
+
+    def __init__(self,
+                 session_factory: Callable[[], aiohttp.ClientSession],
+                 api_base: str = REPLICATE_API_BASE,
+                 api_token: Optional[str] = None,
+                 webhook_url: Optional[str] = REPLICATE_WEBHOOK_URL,
+                 webhook_secret: Optional[str] = REPLICATE_WEBHOOK_SECRET,
+                 max_wait: float = PREDICTION_MAX_WAIT,
+                 latency: Optional[LatencyModel] = None):
+        self._session_factory = session_factory
+        self.api_base = api_base.rstrip('/')
+        self.api_token = api_token if api_token is not None else os.getenv('REPLICATE_API_TOKEN')
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        self.max_wait = max_wait
+        self.latency = latency or LatencyModel()
+        self._pending: Dict[str, _Pending] = {}
+        self._early: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(POLL_CONCURRENCY)
+        self._task: Optional[asyncio.Task] = None
+        self._checks: Set[asyncio.Task] = set()
+        self.polls = 0
+        self.webhook_resolutions = 0
+        self.poll_resolutions = 0
+        self.timeouts = 0
+
+    @property
+    def webhooks_enabled(self) -> bool:
+        return bool(self.webhook_url and self.webhook_secret)
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {'Authorization': f'Token {self.api_token}'}
+
+    def webhook_fields(self) -> Dict[str, Any]:
+        """Extra prediction-create fields that request a completion webhook"""
+        if not self.webhooks_enabled:
+            return {}
+        return {'webhook': self.webhook_url, 'webhook_events_filter': ['completed']}
+
+    async def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            if self.webhook_url and not self.webhook_secret:
+                logger.warning("REPLICATE_WEBHOOK_URL is set without REPLICATE_WEBHOOK_SECRET; webhooks stay off")
+            logger.info(f"Replicate poller started (webhooks {'on' if self.webhooks_enabled else 'off'})")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._checks):
+            task.cancel()
+        for pending in self._pending.values():
+            if not pending.future.done():
+                pending.future.cancel()
+        self._pending.clear()
+
+    async def wait(self, prediction_id: str, model: str, max_wait: Optional[float] = None) -> Dict[str, Any]:
+        """Wait until a prediction reaches a terminal status and return it"""
+        early = self._early.pop(prediction_id, None)
+        if early is not None:
+            return early
+
+        await self.start()
+        pending = self._pending.get(prediction_id)
+        if pending is None:
+            now = time.monotonic()
+            model = model_key(model)
+            pending = _Pending(
+                future=asyncio.get_running_loop().create_future(),
+                model=model,
+                started=now,
+                next_poll=now + self._delay(0.0, model, 0),
+            )
+            self._pending[prediction_id] = pending
+            self._wakeup.set()
+        else:
+            pending.waiters += 1
+
+        max_wait = max_wait or self.max_wait
+        try:
+            return await asyncio.wait_for(asyncio.shield(pending.future), timeout=max_wait)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise PredictionTimeout(prediction_id, max_wait) from None
+        finally:
+            pending.waiters -= 1
+            if pending.waiters <= 0 and self._pending.get(prediction_id) is pending:
+                del self._pending[prediction_id]
+
+    def resolve(self, prediction: Dict[str, Any], source: str = 'webhook') -> bool:
+        """Settle a waiting prediction from a terminal payload; False if nobody waits on it"""
+        if prediction.get('status') not in TERMINAL_STATUSES:
+            return False
+        pending = self._pending.pop(prediction.get('id'), None)
+        if pending is None or pending.future.done():
+            if source == 'webhook' and prediction.get('id'):
+                # Fast predictions can call back before their waiter registers
+                self._early[prediction['id']] = prediction
+                while len(self._early) > EARLY_RESULTS_MAX:
+                    self._early.popitem(last=False)
+            return False
+
+        if prediction['status'] == 'succeeded':
+            self.latency.observe(pending.model, time.monotonic() - pending.started)
+        pending.future.set_result(prediction)
+        if source == 'webhook':
+            self.webhook_resolutions += 1
+        else:
+            self.poll_resolutions += 1
+        return True
+
+    def verify_webhook(self, headers: Dict[str, str], body: bytes) -> None:
+        """
+        Check a webhook delivery's signature
+
+        Replicate signs ``"{webhook-id}.{webhook-timestamp}.{body}"`` with
+        HMAC-SHA256 keyed by the base64 part of the ``whsec_`` secret.
+        Without a secret every delivery is rejected: an unauthenticated
+        payload could otherwise settle a prediction with any output URL.
+        """
+        if not self.webhook_secret:
+            raise WebhookSignatureError("Webhooks are not enabled")
+
+        webhook_id = headers.get('webhook-id')
+        timestamp = headers.get('webhook-timestamp')
+        signatures = headers.get('webhook-signature')
+        if not (webhook_id and timestamp and signatures):
+            raise WebhookSignatureError("Missing webhook signature headers")
+        try:
+            if abs(time.time() - int(timestamp)) > WEBHOOK_MAX_AGE:
+                raise WebhookSignatureError("Webhook timestamp outside tolerance")
+        except ValueError:
+            raise WebhookSignatureError("Invalid webhook timestamp") from None
+
+        key = base64.b64decode(self.webhook_secret.split('_', 1)[-1])
+        signed = f"{webhook_id}.{timestamp}.".encode() + body
+        expected = base64.b64encode(hmac.new(key, signed, hashlib.sha256).digest()).decode()
+        for signature in signatures.split():
+            _, _, value = signature.partition(',')
+            if hmac.compare_digest(value, expected):
+                return
+        raise WebhookSignatureError("Webhook signature mismatch")
+
+    def _delay(self, elapsed: float, model: str, overdue_attempts: int) -> float:
+        delay = next_poll_delay(elapsed, self.latency.expected(model), overdue_attempts)
+        if self.webhooks_enabled:
+            delay = min(delay * WEBHOOK_POLL_FACTOR, POLL_MAX_INTERVAL * WEBHOOK_POLL_FACTOR)
+        return delay
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            for prediction_id, pending in list(self._pending.items()):
+                if pending.next_poll <= now and not pending.checking:
+                    pending.checking = True
+                    task = asyncio.create_task(self._check(prediction_id, pending))
+                    self._checks.add(task)
+                    task.add_done_callback(self._checks.discard)
+
+            idle = [p.next_poll for p in self._pending.values() if not p.checking]
+            timeout = min(idle, default=now + 60) - now
+            # asyncio.wait, not wait_for: wait_for can swallow stop()'s cancel when a check sets the event at once
+            wakeup = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                await asyncio.wait({wakeup}, timeout=max(timeout, 0))
+            finally:
+                wakeup.cancel()
+
+    async def _check(self, prediction_id: str, pending: _Pending) -> None:
+        """One status check; never raises, so a bad response cannot stop the poller"""
+        try:
+            await self._poll(prediction_id, pending)
+        except Exception as e:
+            logger.error(f"Replicate status check for {prediction_id} crashed: {e}")
+            self._reschedule(pending)
+        finally:
+            pending.checking = False
+            self._wakeup.set()
+
+    async def _poll(self, prediction_id: str, pending: _Pending) -> None:
+        async with self._semaphore:
+            self.polls += 1
+            pending.polls += 1
+            prediction: Dict[str, Any] = {}
+            try:
+                async with self._session_factory().get(
+                    f'{self.api_base}/predictions/{prediction_id}',
+                    headers=self.headers
+                ) as response:
+                    if response.status == 200:
+                        prediction = await response.json()
+                    elif 400 <= response.status < 500 and response.status != 429:
+                        # The prediction will never be readable; fail the waiters now
+                        self._pending.pop(prediction_id, None)
+                        if not pending.future.done():
+                            pending.future.set_exception(
+                                Exception(f'Failed to check job status: {response.status}')
+                            )
+                        return
+                    else:
+                        logger.warning(f"Replicate status check for {prediction_id} returned {response.status}")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Replicate status check for {prediction_id} failed: {e}")
+
+        if self.resolve(prediction, source='poll'):
+            return
+        self._reschedule(pending)
+
+    def _reschedule(self, pending: _Pending) -> None:
+        now = time.monotonic()
+        elapsed = now - pending.started
+        if elapsed >= self.latency.expected(pending.model):
+            pending.overdue_attempts += 1
+        pending.next_poll = now + self._delay(elapsed, pending.model, pending.overdue_attempts)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            'in_flight': len(self._pending),
+            'polls': self.polls,
+            'resolved_by_poll': self.poll_resolutions,
+            'resolved_by_webhook': self.webhook_resolutions,
+            'timeouts': self.timeouts,
+            'webhooks_enabled': self.webhooks_enabled,
+            'expected_latency': self.latency.snapshot(),
+        }
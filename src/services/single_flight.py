@@ -0,0 +1,91 @@
+"""
+Single-Flight Request Coalescing
+Runs one execution per key for concurrent identical requests, optionally replaying results for idempotent retries
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Idempotency configuration
+IDEMPOTENCY_TTL = float(os.getenv('IDEMPOTENCY_TTL', str(24 * 3600)))
+IDEMPOTENCY_MAX_RESULTS = int(os.getenv('IDEMPOTENCY_MAX_RESULTS', '1024'))
+
+
+def request_fingerprint(*parts: Any) -> str:
+    """Stable hash of request inputs (dicts are compared by content, not key order)"""
+    material = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key onto one execution
+
+    The first caller for a key starts ``fn`` as its own task; later callers
+    await the same task. The task is shielded, so a caller that
+    disconnects does not cancel the work for the others. Failures are
+    shared by everyone waiting at the time and are never retained.
+
+    With ``result_ttl`` > 0, successful results are also kept (LRU,
+    ``max_results``) so a retry with the same key after completion gets
+    the original result instead of a second execution.
+    """
+
+    def __init__(self, result_ttl: float = 0.0, max_results: int = IDEMPOTENCY_MAX_RESULTS):
+        self.result_ttl = result_ttl
+        self.max_results = max_results
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._results: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.executions = 0
+        self.coalesced = 0
+        self.replayed = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Result of ``fn`` for ``key`` and whether it came from another caller's execution"""
+        stored = self._results.get(key)
+        if stored is not None:
+            expires_at, result = stored
+            if expires_at > time.monotonic():
+                self._results.move_to_end(key)
+                self.replayed += 1
+                return result, True
+            del self._results[key]
+
+        task = self._inflight.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+            self.executions += 1
+        else:
+            self.coalesced += 1
+
+        return await asyncio.shield(task), shared
+
+    def _finish(self, key: str, task: asyncio.Future) -> None:
+        self._inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        if self.result_ttl > 0:
+            self._results[key] = (time.monotonic() + self.result_ttl, task.result())
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            'in_flight': len(self._inflight),
+            'executions': self.executions,
+            'coalesced': self.coalesced,
+            'replayed': self.replayed,
+            'retained_results': len(self._results),
+        }
@@ -0,0 +1,194 @@
+"""
+Streaming Upload Ingest
+Caps request bodies as they arrive, then reads UploadFile bodies in fixed-size chunks with a streaming hash and disk spooling
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from typing import Dict, Optional, Union
+
+from fastapi import HTTPException, UploadFile
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Ingest configuration
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(64 * 1024)))
+UPLOAD_SPOOL_THRESHOLD = int(os.getenv('UPLOAD_SPOOL_THRESHOLD', str(1024 * 1024)))
+UPLOAD_FORM_OVERHEAD = int(os.getenv('UPLOAD_FORM_OVERHEAD', str(64 * 1024)))  # Multipart boundaries and form fields
+
+
+class UploadTooLarge(ValueError):
+    """Raised as soon as an upload passes its byte cap"""
+
+    def __init__(self, limit: int):
+        super().__init__(f"Upload too large (max {limit} bytes)")
+        self.limit = limit
+
+
+class UploadSizeLimit:
+    """
+    ASGI middleware capping request bodies on upload routes
+
+    Starlette parses (and spools) the whole multipart body before the
+    endpoint runs, so a cap checked inside the handler only fires after
+    the bytes were received. This runs first: a declared Content-Length
+    over ``limit + overhead`` gets a 413 without reading the body, and a
+    chunked body is counted as it streams in and cut off with a 413 at
+    the same point. ``limits`` maps exact request paths to byte caps.
+    """
+
+    def __init__(self, app, limits: Dict[str, int], overhead: int = UPLOAD_FORM_OVERHEAD):
+        self.app = app
+        self.limits = dict(limits)
+        self.overhead = overhead
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get('path')) if scope['type'] == 'http' else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        cap = limit + self.overhead
+        headers = dict(scope.get('headers') or [])
+        content_length = headers.get(b'content-length', b'')
+        if content_length.isdigit() and int(content_length) > cap:
+            logger.warning(f"Rejected {scope['path']} upload of {int(content_length)} bytes before reading it")
+            await self._reject(send, limit)
+            return
+
+        received = 0
+
+        async def capped_receive():
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > cap:
+                    # Raised inside form parsing; FastAPI passes HTTPException through as the response
+                    raise HTTPException(status_code=413, detail=str(UploadTooLarge(limit)))
+            return message
+
+        await self.app(scope, capped_receive, send)
+
+    @staticmethod
+    async def _reject(send, limit: int) -> None:
+        body = json.dumps({'detail': str(UploadTooLarge(limit))}).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': 413,
+            'headers': [(b'content-type', b'application/json'),
+                        (b'content-length', str(len(body)).encode()),
+                        (b'connection', b'close')],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+
+class IngestedUpload:
+    """
+    A fully received upload: its SHA-256, size and content
+
+    Content at or below the spool threshold stays in memory as ``data``;
+    anything larger lives in a spool file at ``path``. ``source`` gives
+    whichever exists, and both Pillow and the generation pipeline accept
+    either a bytes-like object or a path.
+    """
+
+    def __init__(self, sha256: str, size: int, data: Optional[bytes] = None, path: Optional[str] = None):
+        self.sha256 = sha256
+        self.size = size
+        self.data = data
+        self.path = path
+
+    @property
+    def spooled(self) -> bool:
+        return self.path is not None
+
+    @property
+    def source(self) -> Union[bytes, str]:
+        return self.data if self.data is not None else self.path
+
+    def view(self) -> memoryview:
+        """Zero-copy view of in-memory content"""
+        if self.data is None:
+            raise ValueError("Upload is spooled to disk; use .path")
+        return memoryview(self.data)
+
+    def persist(self, destination: str) -> str:
+        """Move the content to ``destination`` (a rename when already spooled on the same disk)"""
+        if self.path is not None:
+            shutil.move(self.path, destination)
+        else:
+            with open(destination, 'wb') as f:
+                f.write(self.data)
+            self.data = None
+        self.path = destination
+        return destination
+
+    def discard(self) -> None:
+        """Remove the spool file, if any"""
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+        self.data = None
+
+
+async def ingest_upload(file: UploadFile,
+                        max_bytes: int,
+                        spool_dir: Optional[str] = None,
+                        chunk_size: int = UPLOAD_CHUNK_SIZE,
+                        spool_threshold: int = UPLOAD_SPOOL_THRESHOLD) -> IngestedUpload:
+    """
+    Receive an upload chunk by chunk
+
+    By the time the endpoint runs Starlette has already received the
+    whole body, so this cap only bounds what we hash and keep; the
+    receive-time limit is UploadSizeLimit, mounted for the same routes.
+    The SHA-256 is computed on the same pass. Memory held per upload is
+    bounded by ``spool_threshold``; past it, chunks go straight to a spool
+    file in ``spool_dir``.
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLarge(max_bytes)
+
+    digest = hashlib.sha256()
+    size = 0
+    chunks = []
+    spool = None
+    try:
+        while True:
+            chunk = await file.read(chunk_size)
+            if not chunk:
+                break
+
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(max_bytes)
+            digest.update(chunk)
+
+            if spool is None and size > spool_threshold:
+                spool = tempfile.NamedTemporaryFile(dir=spool_dir, prefix='upload-', suffix='.part', delete=False)
+                spool.writelines(chunks)
+                chunks.clear()
+            if spool is not None:
+                spool.write(chunk)
+            else:
+                chunks.append(chunk)
+    except BaseException:
+        if spool is not None:
+            spool.close()
+            os.unlink(spool.name)
+        raise
+
+    if spool is not None:
+        spool.close()
+        return IngestedUpload(digest.hexdigest(), size, path=spool.name)
+
+    return IngestedUpload(digest.hexdigest(), size, data=b''.join(chunks))
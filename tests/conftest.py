@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Tests import the app the way api_server does: from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep api_server imports from creating SQLite files under data/
+os.environ.setdefault('JOB_STORE_BACKEND', 'memory')
+os.environ.setdefault('RATE_LIMIT_BACKEND', 'memory')
@@ -0,0 +1,239 @@
+"""
+Token Authentication tests
+RS256 verification, JWKS rotation and the verified-token cache against a local JWKS file
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import random
+import time
+import types
+
+import pytest
+
+from src.services import auth
+from src.services.auth import AuthError, JWKSCache, TokenVerifier, user_from_claims
+
+ISSUER = 'https://clerk.example.test'
+AUDIENCE = 'petplantr-api'
+
+_SMALL_PRIMES = [p for p in range(3, 2000) if all(p % d for d in range(2, int(p ** 0.5) + 1))]
+
+
+def _is_probable_prime(n, rng, rounds=24):
+    if any(n % p == 0 for p in _SMALL_PRIMES):
+        return n in _SMALL_PRIMES
+    d, r = n - 1, 0
+    while d % 2 == 0:
+        d, r = d // 2, r + 1
+    for _ in range(rounds):
+        x = pow(rng.randrange(2, n - 2), d, n)
+        if x in (1, n - 1):
+            continue
+        for _ in range(r - 1):
+            x = pow(x, 2, n)
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def _prime(bits, rng, e):
+    while True:
+        candidate = rng.getrandbits(bits) | (1 << (bits - 1)) | (1 << (bits - 2)) | 1
+        if (candidate - 1) % e and _is_probable_prime(candidate, rng):
+            return candidate
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+class RSATestKey:
+    """A 2048-bit RSA key pair that signs RS256 tokens (test-only, seeded RNG)"""
+
+    def __init__(self, kid, seed):
+        rng = random.Random(seed)
+        self.kid = kid
+        self.e = 65537
+        p, q = _prime(1024, rng, self.e), _prime(1024, rng, self.e)
+        self.n = p * q
+        self.d = pow(self.e, -1, (p - 1) * (q - 1))
+        self.size = (self.n.bit_length() + 7) // 8
+
+    def jwk(self):
+        return {
+            'kty': 'RSA', 'use': 'sig', 'alg': 'RS256', 'kid': self.kid,
+            'n': _b64(self.n.to_bytes(self.size, 'big')),
+            'e': _b64(self.e.to_bytes(3, 'big')),
+        }
+
+    def sign(self, message):
+        digest_info = auth._SHA256_DIGEST_INFO + hashlib.sha256(message).digest()
+        padded = b'\x00\x01' + b'\xff' * (self.size - len(digest_info) - 3) + b'\x00' + digest_info
+        return pow(int.from_bytes(padded, 'big'), self.d, self.n).to_bytes(self.size, 'big')
+
+    def token(self, claims, header=None):
+        header = header or {'alg': 'RS256', 'typ': 'JWT', 'kid': self.kid}
+        signing_input = f"{_b64(json.dumps(header).encode())}.{_b64(json.dumps(claims).encode())}"
+        return f"{signing_input}.{_b64(self.sign(signing_input.encode('ascii')))}"
+
+
+class FakeClock:
+    """Stands in for the time module inside auth, so expiry and refresh throttling can be stepped"""
+
+    def __init__(self):
+        self.wall = time.time()
+        self.mono = 1000.0
+
+    def time(self):
+        return self.wall
+
+    def monotonic(self):
+        return self.mono
+
+    def advance(self, seconds):
+        self.wall += seconds
+        self.mono += seconds
+
+
+@pytest.fixture(scope='session')
+def signing_key():
+    return RSATestKey('key-1', seed=1)
+
+
+@pytest.fixture(scope='session')
+def rotated_key():
+    return RSATestKey('key-2', seed=2)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(auth, 'time', types.SimpleNamespace(time=fake.time, monotonic=fake.monotonic))
+    return fake
+
+
+@pytest.fixture
+def jwks_path(tmp_path, signing_key):
+    path = tmp_path / 'jwks.json'
+    path.write_text(json.dumps({'keys': [signing_key.jwk()]}))
+    return path
+
+
+@pytest.fixture
+def verifier(jwks_path, clock):
+    return TokenVerifier(JWKSCache(path=str(jwks_path), min_refresh=30),
+                         issuer=ISSUER, audience=AUDIENCE, authorized_parties=[], leeway=30)
+
+
+def _claims(clock, **overrides):
+    claims = {'sub': 'user_123', 'iss': ISSUER, 'aud': AUDIENCE,
+              'iat': int(clock.wall), 'nbf': int(clock.wall), 'exp': int(clock.wall) + 300}
+    claims.update(overrides)
+    return claims
+
+
+def _rejects(verifier, token, message):
+    with pytest.raises(AuthError, match=message):
+        asyncio.run(verifier.verify(token))
+
+
+def test_valid_token(verifier, signing_key, clock):
+    claims = asyncio.run(verifier.verify(signing_key.token(_claims(clock, plan='pro'))))
+
+    assert claims['sub'] == 'user_123'
+    assert user_from_claims(claims) == {'user_id': 'user_123', 'plan': 'pro'}
+    assert verifier.verified == 1
+
+
+def test_wrong_signature(verifier, signing_key, rotated_key, clock):
+    # Signed by a different key that claims the trusted kid
+    forged = rotated_key.token(_claims(clock), header={'alg': 'RS256', 'kid': signing_key.kid})
+    _rejects(verifier, forged, 'Invalid signature')
+
+    # Valid signature over different claims
+    header, _, signature = signing_key.token(_claims(clock)).split('.')
+    tampered = f"{header}.{_b64(json.dumps(_claims(clock, sub='admin')).encode())}.{signature}"
+    _rejects(verifier, tampered, 'Invalid signature')
+    assert verifier.rejected == 2
+
+
+def test_alg_none_rejected(verifier, signing_key, clock):
+    header = _b64(json.dumps({'alg': 'none', 'kid': signing_key.kid}).encode())
+    payload = _b64(json.dumps(_claims(clock)).encode())
+    _rejects(verifier, f"{header}.{payload}.", 'Unsupported algorithm')
+
+
+def test_hs256_rejected(verifier, signing_key, clock):
+    # Classic key confusion: HMAC keyed with the public key material
+    header = _b64(json.dumps({'alg': 'HS256', 'kid': signing_key.kid}).encode())
+    payload = _b64(json.dumps(_claims(clock)).encode())
+    secret = json.dumps(signing_key.jwk()).encode()
+    signature = _b64(hmac.new(secret, f"{header}.{payload}".encode(), hashlib.sha256).digest())
+    _rejects(verifier, f"{header}.{payload}.{signature}", 'Unsupported algorithm')
+
+
+def test_expired_token(verifier, signing_key, clock):
+    _rejects(verifier, signing_key.token(_claims(clock, exp=int(clock.wall) - 31)), 'Token expired')
+
+    # Inside the leeway still passes
+    asyncio.run(verifier.verify(signing_key.token(_claims(clock, exp=int(clock.wall) - 10))))
+
+
+def test_token_before_nbf(verifier, signing_key, clock):
+    _rejects(verifier, signing_key.token(_claims(clock, nbf=int(clock.wall) + 120)), 'not yet valid')
+
+
+def test_wrong_issuer(verifier, signing_key, clock):
+    _rejects(verifier, signing_key.token(_claims(clock, iss='https://evil.example.test')), 'Unexpected issuer')
+
+
+def test_wrong_audience(verifier, signing_key, clock):
+    _rejects(verifier, signing_key.token(_claims(clock, aud='another-api')), 'Unexpected audience')
+
+    # A list audience containing ours is accepted
+    asyncio.run(verifier.verify(signing_key.token(_claims(clock, aud=['another-api', AUDIENCE]))))
+
+
+def test_unknown_kid_refresh_respects_min_refresh(verifier, signing_key, rotated_key, jwks_path, clock):
+    asyncio.run(verifier.verify(signing_key.token(_claims(clock))))
+    assert verifier.jwks.refreshes == 1
+
+    # The issuer rotates; a token with the new kid arrives within min_refresh of the last fetch
+    jwks_path.write_text(json.dumps({'keys': [signing_key.jwk(), rotated_key.jwk()]}))
+    rotated_token = rotated_key.token(_claims(clock))
+    clock.advance(10)
+    _rejects(verifier, rotated_token, 'Unknown signing key')
+    _rejects(verifier, rotated_key.token(_claims(clock, sub='other')), 'Unknown signing key')
+    assert verifier.jwks.refreshes == 1
+
+    # Once min_refresh has passed the unknown kid triggers exactly one refetch
+    clock.advance(21)
+    assert asyncio.run(verifier.verify(rotated_token))['sub'] == 'user_123'
+    assert verifier.jwks.refreshes == 2
+
+    # Bogus kids cannot force further fetches inside the window
+    bogus = rotated_key.token(_claims(clock), header={'alg': 'RS256', 'kid': 'bogus'})
+    _rejects(verifier, bogus, 'Unknown signing key')
+    assert verifier.jwks.refreshes == 2
+
+
+def test_token_cache_hit_and_expiry(verifier, signing_key, jwks_path, clock):
+    token = signing_key.token(_claims(clock, exp=int(clock.wall) + 60))
+    asyncio.run(verifier.verify(token))
+
+    # A cache hit does not touch the key set at all
+    jwks_path.unlink()
+    assert asyncio.run(verifier.verify(token))['sub'] == 'user_123'
+    assert (verifier.cache_hits, verifier.verified) == (1, 1)
+
+    # Past exp + leeway the entry is dropped and the token re-verified, and rejected
+    clock.advance(60 + 31)
+    _rejects(verifier, token, 'Token expired')
+    assert verifier.get_metrics()['cached_tokens'] == 0
+    assert verifier.cache_hits == 1
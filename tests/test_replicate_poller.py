@@ -0,0 +1,298 @@
+"""
+Replicate Prediction Completion tests
+Shared polling, webhook resolution and timeout/failure outcomes against a fake Replicate server
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import time
+from collections import Counter
+
+import aiohttp
+import httpx
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from src.services.replicate_poller import LatencyModel, PredictionTimeout, ReplicatePoller
+
+MODEL = 'test/model:abc123'
+WEBHOOK_SECRET = 'whsec_' + base64.b64encode(b'fake-replicate-signing-key').decode()
+
+
+class FakeReplicate:
+    """GET /predictions/{id} over an in-memory prediction table, counting every status check"""
+
+    def __init__(self):
+        self.predictions = {}
+        self.delays = {}
+        self.checks = Counter()
+        app = web.Application()
+        app.router.add_get('/predictions/{id}', self.get_prediction)
+        self.server = TestServer(app)
+
+    async def get_prediction(self, request):
+        prediction_id = request.match_info['id']
+        self.checks[prediction_id] += 1
+        await asyncio.sleep(self.delays.get(prediction_id, 0))
+        prediction = self.predictions.get(prediction_id)
+        if prediction is None:
+            return web.json_response({'detail': 'Not found.'}, status=404)
+        return web.json_response(prediction)
+
+    def add(self, prediction_id, status='processing'):
+        self.predictions[prediction_id] = {'id': prediction_id, 'status': status, 'output': None}
+
+    def finish(self, prediction_id, status='succeeded', **fields):
+        self.predictions[prediction_id].update(status=status, **fields)
+
+    @property
+    def api_base(self):
+        return str(self.server.make_url('')).rstrip('/')
+
+
+def run_with_replicate(test, **poller_options):
+    """Run ``test(fake, poller)`` on one loop with a live fake server and a started poller"""
+
+    async def main():
+        fake = FakeReplicate()
+        await fake.server.start_server()
+        session = aiohttp.ClientSession()
+        poller_options.setdefault('latency', LatencyModel(priors={'test/model': 0.05}))
+        poller = ReplicatePoller(lambda: session, api_base=fake.api_base, api_token='test-token',
+                                 webhook_url=poller_options.pop('webhook_url', None),
+                                 webhook_secret=poller_options.pop('webhook_secret', None),
+                                 **poller_options)
+        try:
+            return await test(fake, poller)
+        finally:
+            await poller.stop()
+            await session.close()
+            await fake.server.close()
+
+    return asyncio.run(main())
+
+
+def signed_headers(body, secret=WEBHOOK_SECRET, webhook_id='msg_1', timestamp=None):
+    timestamp = str(int(time.time() if timestamp is None else timestamp))
+    key = base64.b64decode(secret.split('_', 1)[-1])
+    signature = base64.b64encode(
+        hmac.new(key, f"{webhook_id}.{timestamp}.".encode() + body, hashlib.sha256).digest()
+    ).decode()
+    return {'webhook-id': webhook_id, 'webhook-timestamp': timestamp,
+            'webhook-signature': f'v1,{signature}', 'content-type': 'application/json'}
+
+
+def test_waiters_share_one_poll_loop():
+    async def scenario(fake, poller):
+        fake.add('shared')
+        fake.add('solo')
+        waiters = [asyncio.create_task(poller.wait('shared', MODEL)) for _ in range(5)]
+        solo = asyncio.create_task(poller.wait('solo', MODEL))
+        await asyncio.sleep(0.3)
+        fake.finish('shared', output=['https://replicate.delivery/model.glb'])
+        fake.finish('solo', output=['https://replicate.delivery/other.glb'])
+
+        results = await asyncio.gather(*waiters)
+        await solo
+        return fake, poller, results
+
+    fake, poller, results = run_with_replicate(scenario)
+
+    assert all(result['output'] == ['https://replicate.delivery/model.glb'] for result in results)
+    # Five waiters cost no more status checks than one
+    assert fake.checks['shared'] <= fake.checks['solo'] + 1
+    metrics = poller.get_metrics()
+    assert metrics['resolved_by_poll'] == 2
+    assert metrics['in_flight'] == 0
+
+
+def test_slow_status_check_does_not_stall_others():
+    async def scenario(fake, poller):
+        fake.add('slow')
+        fake.delays['slow'] = 5
+        fake.add('fast', status='succeeded')
+        slow = asyncio.create_task(poller.wait('slow', MODEL))
+        await asyncio.sleep(0.1)  # The slow GET is now in flight
+
+        started = time.monotonic()
+        result = await poller.wait('fast', MODEL)
+        elapsed = time.monotonic() - started
+        slow.cancel()
+        return result, elapsed
+
+    result, elapsed = run_with_replicate(scenario)
+
+    assert result['status'] == 'succeeded'
+    assert elapsed < 1
+
+
+def test_unexpected_payload_does_not_kill_the_poller():
+    async def scenario(fake, poller):
+        fake.predictions['garbled'] = ['not', 'a', 'prediction']
+        fake.add('healthy', status='succeeded')
+        garbled = asyncio.create_task(poller.wait('garbled', MODEL))
+        await asyncio.sleep(0.2)
+
+        result = await asyncio.wait_for(poller.wait('healthy', MODEL), timeout=2)
+        alive = not poller._task.done()
+        still_tracked = poller.get_metrics()['in_flight']
+        garbled.cancel()
+        return fake, result, alive, still_tracked
+
+    fake, result, alive, still_tracked = run_with_replicate(scenario)
+
+    assert result['status'] == 'succeeded'
+    assert alive
+    assert fake.checks['garbled'] >= 1
+    assert still_tracked == 1  # The garbled prediction was rescheduled, not dropped
+
+
+def test_timeout_releases_the_prediction():
+    async def scenario(fake, poller):
+        fake.add('slow')
+        with pytest.raises(PredictionTimeout):
+            await poller.wait('slow', MODEL, max_wait=0.3)
+        return fake, poller
+
+    fake, poller = run_with_replicate(scenario)
+
+    assert fake.checks['slow'] >= 1
+    assert poller.get_metrics()['timeouts'] == 1
+    assert poller.get_metrics()['in_flight'] == 0
+
+
+def test_failed_prediction_is_returned():
+    async def scenario(fake, poller):
+        fake.add('broken', status='failed')
+        fake.predictions['broken']['error'] = 'CUDA out of memory'
+        return await poller.wait('broken', MODEL)
+
+    result = run_with_replicate(scenario)
+
+    assert result['status'] == 'failed'
+    assert result['error'] == 'CUDA out of memory'
+
+
+def test_unreadable_prediction_fails_its_waiters():
+    async def scenario(fake, poller):
+        with pytest.raises(Exception, match='404'):
+            await poller.wait('missing', MODEL)
+        return fake, poller
+
+    fake, poller = run_with_replicate(scenario)
+
+    assert fake.checks['missing'] == 1
+    assert poller.get_metrics()['in_flight'] == 0
+
+
+@pytest.fixture(scope='module')
+def api_server():
+    import api_server
+    return api_server
+
+
+def test_webhook_route_completes_waiting_prediction(api_server, monkeypatch):
+    async def scenario(fake, poller):
+        monkeypatch.setattr(api_server, 'replicate_poller', poller)
+        fake.add('hooked')
+        waiter = asyncio.create_task(poller.wait('hooked', MODEL))
+        await asyncio.sleep(0.05)
+
+        body = json.dumps({'id': 'hooked', 'status': 'succeeded', 'output': ['https://replicate.delivery/a.glb']}).encode()
+        transport = httpx.ASGITransport(app=api_server.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            response = await client.post('/api/v1/webhooks/replicate', content=body, headers=signed_headers(body))
+        result = await asyncio.wait_for(waiter, timeout=1)
+        return fake, poller, response, result
+
+    # A slow latency prior keeps the safety-net poll from racing the webhook
+    fake, poller, response, result = run_with_replicate(
+        scenario, webhook_url='https://petplantr.test/api/v1/webhooks/replicate',
+        webhook_secret=WEBHOOK_SECRET, latency=LatencyModel(priors={'test/model': 60.0}),
+    )
+
+    assert response.status_code == 200
+    assert response.json() == {'received': True, 'resolved': True}
+    assert result['output'] == ['https://replicate.delivery/a.glb']
+    assert fake.checks['hooked'] == 0
+    assert poller.get_metrics()['resolved_by_webhook'] == 1
+
+
+def test_webhook_route_before_waiter_is_kept(api_server, monkeypatch):
+    async def scenario(fake, poller):
+        monkeypatch.setattr(api_server, 'replicate_poller', poller)
+        body = json.dumps({'id': 'fast', 'status': 'succeeded', 'output': ['x']}).encode()
+        transport = httpx.ASGITransport(app=api_server.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            response = await client.post('/api/v1/webhooks/replicate', content=body, headers=signed_headers(body))
+        result = await asyncio.wait_for(poller.wait('fast', MODEL), timeout=1)
+        return fake, response, result
+
+    fake, response, result = run_with_replicate(
+        scenario, webhook_url='https://petplantr.test/api/v1/webhooks/replicate', webhook_secret=WEBHOOK_SECRET,
+    )
+
+    assert response.json() == {'received': True, 'resolved': False}
+    assert result['output'] == ['x']
+    assert fake.checks['fast'] == 0
+
+
+@pytest.mark.parametrize('tamper', ['signature', 'timestamp', 'missing'])
+def test_webhook_route_rejects_bad_signatures(api_server, monkeypatch, tamper):
+    async def scenario(fake, poller):
+        monkeypatch.setattr(api_server, 'replicate_poller', poller)
+        fake.add('target')
+        waiter = asyncio.create_task(poller.wait('target', MODEL))
+        await asyncio.sleep(0.05)
+
+        body = json.dumps({'id': 'target', 'status': 'succeeded', 'output': ['forged']}).encode()
+        if tamper == 'signature':
+            headers = signed_headers(body, secret='whsec_' + base64.b64encode(b'wrong-key').decode())
+        elif tamper == 'timestamp':
+            headers = signed_headers(body, timestamp=time.time() - 3600)
+        else:
+            headers = {'content-type': 'application/json'}
+        transport = httpx.ASGITransport(app=api_server.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            response = await client.post('/api/v1/webhooks/replicate', content=body, headers=headers)
+        settled = waiter.done()
+        waiter.cancel()
+        return response, settled
+
+    response, settled = run_with_replicate(
+        scenario, webhook_url='https://petplantr.test/api/v1/webhooks/replicate',
+        webhook_secret=WEBHOOK_SECRET, latency=LatencyModel(priors={'test/model': 60.0}),
+    )
+
+    assert response.status_code == 401
+    assert not settled
+
+
+def test_webhook_route_rejected_without_secret(api_server, monkeypatch):
+    async def scenario(fake, poller):
+        monkeypatch.setattr(api_server, 'replicate_poller', poller)
+        fake.add('target')
+        waiter = asyncio.create_task(poller.wait('target', MODEL))
+        await asyncio.sleep(0.05)
+
+        body = json.dumps({'id': 'target', 'status': 'succeeded', 'output': ['https://evil.test/mesh.glb']}).encode()
+        transport = httpx.ASGITransport(app=api_server.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            response = await client.post('/api/v1/webhooks/replicate', content=body,
+                                         headers={'content-type': 'application/json'})
+        settled = waiter.done()
+        waiter.cancel()
+        return poller, response, settled
+
+    poller, response, settled = run_with_replicate(
+        scenario, webhook_url='https://petplantr.test/api/v1/webhooks/replicate',
+        latency=LatencyModel(priors={'test/model': 60.0}),
+    )
+
+    assert response.status_code == 401
+    assert not settled
+    assert poller.webhook_fields() == {}